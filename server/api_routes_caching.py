@@ -11,13 +11,12 @@ import uuid
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-import base64
-from PIL import Image
+from PIL import Image, ImageOps
 import io
 from datetime import datetime
 
 from supabase_client import supabase_manager
-from hash_utils import hash_image, normalize_url
+from hash_utils import decode_base64_with_hash, hash_image, hash_to_hex, normalize_url, phash
 
 # Force stdout to flush immediately for debugging
 sys.stdout.reconfigure(line_buffering=True)
@@ -148,23 +147,20 @@ async def analyze_with_caching(
         # Decode image if base64 provided (for hashing)
         if request.image_base64:
             base64_len = len(request.image_base64)
-            print(f"[ANALYZE] 🔍 Decoding base64 image ({base64_len} chars, ~{base64_len * 3 / 4 / 1024:.1f}KB)")
-            image_data = base64.b64decode(request.image_base64)
+            print(f"[ANALYZE] 🔍 Decoding + hashing base64 image ({base64_len} chars, ~{base64_len * 3 / 4 / 1024:.1f}KB)")
+            # Hash the uploaded bytes as they are decoded (no JPEG re-encode)
+            image_data, image_hash = decode_base64_with_hash(request.image_base64)
             print(f"[ANALYZE] Decoded to {len(image_data)} bytes ({len(image_data) / 1024:.1f}KB)")
+            print(f"[ANALYZE] Image hash: {image_hash}")
 
-            print(f"[ANALYZE] Opening PIL Image for hashing...")
             image_obj = Image.open(io.BytesIO(image_data))
             print(f"[ANALYZE] Image size: {image_obj.size}, mode: {image_obj.mode}")
 
-            print(f"[ANALYZE] Computing image hash...")
-            image_hash = hash_image(image_obj)
-            print(f"[ANALYZE] Image hash: {image_hash}")
-
         # Cache checking disabled - always run full analysis for location-specific results
         print(f"[ANALYZE] 🔄 Running full analysis (cache disabled for location-aware results)")
 
         # Import the existing detection function
-        from fashion_detector_server import run_full_detection_pipeline
+        from fashion_detector_server import NEAR_DUPLICATE_CACHE, near_duplicate_index, run_full_detection_pipeline
 
         print(f"[ANALYZE] 🎯 Calling run_full_detection_pipeline...")
         print(f"[ANALYZE]   - skip_detection: {request.skip_detection}")
@@ -212,15 +208,22 @@ async def analyze_with_caching(
         if supabase_manager.enabled and request.user_id and detection_result.get('cloudinary_url'):
             cache_hash = image_hash or (hash_image(image_obj) if image_obj else None) or uuid.uuid4().hex
             print(f"[ANALYZE] Storing cache with hash: {cache_hash}")
+            # Hash the oriented image, as detect_and_search does, so a rotated photo matches across endpoints
+            image_phash = phash(ImageOps.exif_transpose(image_obj)) if NEAR_DUPLICATE_CACHE and image_obj else None
+            cache_country = request.country or 'US'
 
             cache_id = supabase_manager.store_cache(
                 image_url=image_url or detection_result.get('cloudinary_url'),
                 image_hash=cache_hash,
                 cloudinary_url=detection_result['cloudinary_url'],
                 detected_garments=detection_result.get('detected_garments', []),
-                search_results=detection_result.get('results', [])
+                search_results=detection_result.get('results', []),
+                country=cache_country,  # Results were localised for the request's country
+                image_phash=hash_to_hex(image_phash) if image_phash is not None else None
             )
             print(f"[ANALYZE] ✅ Cache stored with ID: {cache_id}")
+            if cache_id and image_phash is not None:
+                near_duplicate_index.add(image_phash, cache_id, cache_country)
         else:
             print(f"[ANALYZE] ⏭️  Skipping cache storage")
 
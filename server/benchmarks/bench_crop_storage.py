@@ -0,0 +1,113 @@
+"""
+Upload latency and failed crops per request with each crop storage.
+
+Each request runs the server's upload_garments (--crops garment crops plus
+the full image) on the shared upload pool, --concurrency requests at a time:
+
+  cloudinary  cloudinary_stub.py with --latency-ms per upload
+  local       the in-memory local storage (URLs served by /crops)
+  faulty      local storage behind --fault-latency-ms, --error-rate and
+              --timeout-rate, the way a slow, flaky CDN behaves
+
+and the report shows ms per request (mean / p95), crops left without a URL
+and the upload client's retries and deadline misses.
+
+Usage:
+    python benchmarks/bench_crop_storage.py [--requests 40] [--concurrency 4]
+        [--crops 4] [--latency-ms 80] [--fault-latency-ms 300]
+        [--error-rate 0.1] [--timeout-rate 0.02]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+os.environ.setdefault("WARMUP_ON_STARTUP", "false")
+
+
+def photo(seed, size=(1200, 1600)):
+    small = np.random.default_rng(seed).integers(0, 255, (size[1] // 40, size[0] // 40, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.BICUBIC)
+
+
+def detections(count):
+    boxes = [(240, 240, 960, 800), (300, 720, 900, 1440), (360, 1400, 660, 1580), (720, 480, 1020, 880)]
+    return [{"label": "shirt", "expanded_bbox": list(boxes[i % len(boxes)])} for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--crops", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--fault-latency-ms", type=float, default=300.0)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--timeout-rate", type=float, default=0.02)
+    args = parser.parse_args()
+
+    import cloudinary
+
+    import fashion_detector_server as server
+    from cloudinary_stub import CloudinaryStub
+    from crop_storage import create_storage
+
+    images = [photo(seed) for seed in range(4)]
+    dets = detections(args.crops)
+    base = replace(server.crop_storage_settings(), base_url="http://127.0.0.1:8000")
+    storages = {
+        "cloudinary": lambda: create_storage("cloudinary", base),
+        "local": lambda: create_storage("local", base),
+        "faulty": lambda: create_storage("faulty", replace(
+            base,
+            fault_inner="local",
+            fault_latency_ms=args.fault_latency_ms,
+            fault_error_rate=args.error_rate,
+            fault_timeout_rate=args.timeout_rate,
+        )),
+    }
+
+    def one_request(i):
+        start = time.perf_counter()
+        full_url, results = server.upload_garments(images[i % len(images)], dets, include_full=True,
+                                                   deadline=server.upload_deadline())
+        missing = sum(url is None for _, url in results) + (full_url is None)
+        return (time.perf_counter() - start) * 1000, missing
+
+    stub = CloudinaryStub(latency=args.latency_ms / 1000).start()
+    try:
+        cloudinary.config(cloud_name="local", api_key="key", api_secret="secret", upload_prefix=stub.base_url)
+        print(
+            f"{args.requests} requests, {args.concurrency} at a time, {args.crops} crops + full image each; "
+            f"faulty: {args.fault_latency_ms:g} ms, {args.error_rate:.0%} errors, {args.timeout_rate:.0%} timeouts\n"
+        )
+        print(f"{'storage':<12}{'ms/request':>12}{'p95 ms':>9}{'missing URLs':>14}{'retries':>9}{'deadline':>10}")
+        for make in storages.values():
+            server._crop_storage = make()
+            server._upload_client = None
+            server.get_upload_client()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+                rows = list(ex.map(one_request, range(args.requests)))
+            stats = server.get_upload_client().stats()
+            server._upload_client.shutdown()
+            timings = [ms for ms, _ in rows]
+            print(
+                f"{stats['backend']:<12}{np.mean(timings):>12.0f}{np.percentile(timings, 95):>9.0f}"
+                f"{sum(missing for _, missing in rows) / args.requests:>14.2f}"
+                f"{stats['retries']:>9}{stats['deadline_exceeded']:>10}"
+            )
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
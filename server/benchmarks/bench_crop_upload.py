@@ -0,0 +1,104 @@
+"""
+Upload bytes and wall time per request: uploading every garment crop vs
+crop URLs of one full-image upload (CLOUDINARY_CROP_BY_URL).
+
+Both modes run the server's upload_garments(include_full=True), the
+/detect-and-search path, against cloudinary_stub.py with a simulated uplink,
+for --garments boxes per photo spread over the frame:
+
+  crops         every expanded_bbox crop + the full image, in parallel
+  crop-by-url   the full image once; crops are c_crop transformation URLs
+
+Usage:
+    python benchmarks/bench_crop_upload.py [path/to/photos] [--garments 4]
+        [--mbps 10] [--latency 0.06] [--count 4] [--size 3024x4032]
+
+Without a folder, --count synthetic photos of --size are used.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+from PIL import Image
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+os.environ.setdefault("WARMUP_ON_STARTUP", "false")
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg"}
+MODES = {"crops": False, "crop-by-url": True}
+
+
+def synthetic_upload(width, height, seed):
+    small = np.random.default_rng(seed).integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(small).resize((width, height), Image.BILINEAR).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def garment_boxes(width, height, count):
+    """Torso-, leg- and accessory-sized boxes, like a full-body outfit photo."""
+    shapes = [(0.2, 0.15, 0.8, 0.5), (0.25, 0.45, 0.75, 0.9), (0.3, 0.88, 0.55, 0.99), (0.6, 0.3, 0.85, 0.55)]
+    labels = ["shirt", "pants", "shoe", "bag"]
+    detections = []
+    for i in range(count):
+        x1, y1, x2, y2 = shapes[i % len(shapes)]
+        bbox = [int(x1 * width), int(y1 * height), int(x2 * width), int(y2 * height)]
+        detections.append({"label": labels[i % len(labels)], "expanded_bbox": bbox})
+    return detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="?", help="Folder of JPEG photos (default: synthetic)")
+    parser.add_argument("--garments", type=int, default=4)
+    parser.add_argument("--mbps", type=float, default=10.0, help="Simulated uplink per upload")
+    parser.add_argument("--latency", type=float, default=0.06, help="Simulated seconds per upload request")
+    parser.add_argument("--count", type=int, default=4, help="Number of synthetic photos")
+    parser.add_argument("--size", default="3024x4032", help="WxH of synthetic photos")
+    args = parser.parse_args()
+
+    import cloudinary
+
+    import fashion_detector_server as server
+    from cloudinary_stub import CloudinaryStub
+
+    if args.images:
+        uploads = [p.read_bytes() for p in sorted(Path(args.images).iterdir()) if p.suffix.lower() in IMAGE_SUFFIXES]
+    else:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        uploads = [synthetic_upload(width, height, seed) for seed in range(args.count)]
+
+    with CloudinaryStub(latency=args.latency, upload_mbps=args.mbps) as stub:
+        cloudinary.config(cloud_name="local", api_key="key", api_secret="secret", upload_prefix=stub.base_url)
+        print(
+            f"{len(uploads)} photos, {args.garments} garments each, "
+            f"{args.mbps:g} Mbps + {args.latency * 1000:.0f} ms per upload\n"
+        )
+        print(f"{'mode':<14}{'uploads':>9}{'KB/request':>12}{'ms/request':>12}")
+        for mode, by_url in MODES.items():
+            stub.reset()
+            timings = []
+            with patch.object(server, "CLOUDINARY_CROP_BY_URL", by_url):
+                for data in uploads:
+                    image = server.load_source_image(data)
+                    detections = garment_boxes(image.width, image.height, args.garments)
+                    start = time.perf_counter()
+                    server.upload_garments(image, detections, include_full=True)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    image.close()
+            requests_count = len(uploads)
+            print(
+                f"{mode:<14}{len(stub.uploads) / requests_count:>9.1f}"
+                f"{stub.bytes_uploaded / 1024 / requests_count:>12.0f}{np.mean(timings):>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
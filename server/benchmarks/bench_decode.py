@@ -0,0 +1,112 @@
+"""
+Decode time and peak memory per megapixel for uploaded photos.
+
+Methods:
+
+  legacy        Image.open -> ImageOps.exif_transpose -> convert("RGB")
+                (the old load_image_from_bytes: two full-size copies)
+  full          decode_oriented: same pixels, oriented in place, no copies
+  draft         SourceImage with the detection-size draft decode only (what a
+                request without crops, or with a full-image upload, pays)
+  draft+crops   SourceImage, then --crops crops from the full-resolution image
+
+Each (method, photo) runs in a fresh process; peak memory is the growth of
+the process's max RSS during the decode. Times are the best of --runs in
+that process.
+
+Usage:
+    python benchmarks/bench_decode.py path/to/photos [--runs 3] [--crops 2]
+        [--methods legacy,full,draft,draft+crops] [--shortest 800 --longest 1333]
+"""
+
+import argparse
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg"}
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def child(method, path, runs, crops, shortest, longest):
+    """Runs in a fresh process: decode one photo with one method."""
+    from PIL import Image, ImageOps
+
+    from image_codec import SourceImage, decode_oriented
+    from onnx_engine import get_resize_size
+
+    data = Path(path).read_bytes()
+
+    def min_size(width, height):
+        target_height, target_width = get_resize_size(height, width, shortest, longest)
+        return min(width, target_width), min(height, target_height)
+
+    def decode():
+        if method == "legacy":
+            image = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+            return image, image.size
+        if method == "full":
+            image = decode_oriented(data)
+            return image, image.size
+        source = SourceImage(data, min_size)
+        if method == "draft+crops":
+            width, height = source.size
+            for i in range(crops):
+                x = width * i // (crops + 1)
+                source.crop((x, height // 4, x + width // 3, height * 3 // 4)).load()
+        return source, source.size
+
+    baseline = max_rss_mb()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        image, size = decode()
+        timings.append((time.perf_counter() - start) * 1000)
+        image.close()
+    return {"ms": min(timings), "peak_mb": max_rss_mb() - baseline, "megapixels": size[0] * size[1] / 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", help="Folder of JPEG photos")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--crops", type=int, default=2)
+    parser.add_argument("--methods", default="legacy,full,draft,draft+crops")
+    parser.add_argument("--shortest", type=int, default=800)
+    parser.add_argument("--longest", type=int, default=1333)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.child, args.images, args.runs, args.crops, args.shortest, args.longest)))
+        return
+
+    paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    print(f"{'method':<14}{'ms/MP':>8}{'peak MB/MP':>12}   ({len(paths)} photos, best of {args.runs})")
+    for method in args.methods.split(","):
+        reports = []
+        for path in paths:
+            output = subprocess.run(
+                [sys.executable, __file__, str(path), "--child", method, "--runs", str(args.runs),
+                 "--crops", str(args.crops), "--shortest", str(args.shortest), "--longest", str(args.longest)],
+                check=True, capture_output=True, text=True, cwd=SERVER_DIR,
+            ).stdout
+            reports.append(json.loads(output.strip().splitlines()[-1]))
+        megapixels = sum(r["megapixels"] for r in reports)
+        ms_per_mp = sum(r["ms"] for r in reports) / megapixels
+        mb_per_mp = sum(r["peak_mb"] for r in reports) / megapixels
+        print(f"{method:<14}{ms_per_mp:>8.1f}{mb_per_mp:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Latency / recall of detection at several detection resolutions.
+
+Each resolution runs in its own fresh process with DETECTION_SHORTEST_EDGE /
+DETECTION_LONGEST_EDGE set, through the full run_detection pipeline
+(downsize, detection, low-light pass, filtering rules, crops). Garments are
+compared with the same label + IoU matching as compare_onnx_models.py:
+
+  - against hand-labelled boxes if --labels is given
+    ({"photo.jpg": [{"label": "dress", "bbox": [x1, y1, x2, y2]}, ...]})
+  - otherwise against the --reference resolution (default: the model's
+    native 800x1333), i.e. "how much do we lose versus today"
+
+Usage:
+    python benchmarks/bench_detection_resolution.py path/to/images
+        [--resolutions 480x800,608x1013,704x1173,800x1333] [--runs 3]
+        [--reference 800x1333] [--labels labels.json] [--iou 0.5] [--json report.json]
+
+Uses the model the server would load (INFERENCE_BACKEND, USE_ONNX etc. are passed through).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+
+from compare_onnx_models import IMAGE_SUFFIXES, match_detections
+
+
+def parse_resolution(value):
+    shortest, longest = value.lower().split("x")
+    return int(shortest), int(longest)
+
+
+def profile_resolution(resolution, image_paths, runs, threshold):
+    """Runs in a spawned worker: time run_detection on every image at one resolution."""
+    shortest, longest = resolution
+    os.environ["DETECTION_SHORTEST_EDGE"] = str(shortest)
+    os.environ["DETECTION_LONGEST_EDGE"] = str(longest)
+    os.environ["WARMUP_ON_STARTUP"] = "false"
+    from PIL import Image, ImageOps
+
+    import fashion_detector_server as server
+
+    server.ensure_model_loaded()
+    threshold = server.CONF_THRESHOLD if threshold is None else threshold
+
+    latencies_ms = []
+    resize_ms = []
+    detections = {}
+    # The pipeline logs every decision; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for path in image_paths:
+            image = ImageOps.exif_transpose(Image.open(path)).convert("RGB")
+            server.run_detection(image, threshold, server.EXPAND_RATIO, server.MAX_GARMENTS)  # warm-up for this size
+            for _ in range(runs):
+                start = time.perf_counter()
+                server.resize_for_detection(image)
+                resize_ms.append((time.perf_counter() - start) * 1000)
+
+                start = time.perf_counter()
+                filtered, _ = server.run_detection(image, threshold, server.EXPAND_RATIO, server.MAX_GARMENTS)
+                latencies_ms.append((time.perf_counter() - start) * 1000)
+            detections[Path(path).name] = [
+                {"label": d["label"], "score": float(d["score"]), "bbox": [int(v) for v in d["bbox"]]}
+                for d in filtered
+            ]
+
+    return {
+        "resolution": f"{shortest}x{longest}",
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "latency_p95_ms": float(np.percentile(latencies_ms, 95)),
+        "resize_p50_ms": float(np.percentile(resize_ms, 50)),
+        "detections": detections,
+    }
+
+
+def score(reference, candidate, iou_threshold):
+    """Recall / precision / mean IoU of `candidate` garments against `reference`."""
+    num_reference = num_candidate = num_matched = 0
+    ious = []
+    for name, ref_dets in reference.items():
+        cand_dets = candidate.get(name, [])
+        matches, _, _ = match_detections(ref_dets, cand_dets, iou_threshold)
+        num_reference += len(ref_dets)
+        num_candidate += len(cand_dets)
+        num_matched += len(matches)
+        ious.extend(iou for _, _, iou in matches)
+    return {
+        "garments": num_candidate,
+        "recall": num_matched / num_reference if num_reference else float("nan"),
+        "precision": num_matched / num_candidate if num_candidate else float("nan"),
+        "mean_iou": float(np.mean(ious)) if ious else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", type=Path, help="Folder of sample photos")
+    parser.add_argument("--resolutions", default="480x800,608x1013,704x1173,800x1333",
+                        help="Comma-separated SHORTESTxLONGEST edge limits")
+    parser.add_argument("--reference", default="800x1333", help="Resolution to compare against without --labels")
+    parser.add_argument("--labels", type=Path, default=None, help="Hand-labelled boxes per file name (JSON)")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per image (after one warm-up)")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU needed to count a box as the same garment")
+    parser.add_argument("--threshold", type=float, default=None, help="Defaults to the server's CONF_THRESHOLD")
+    parser.add_argument("--json", type=Path, default=None, help="Also write the raw results here")
+    args = parser.parse_args()
+
+    image_paths = sorted(str(p) for p in args.images.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not image_paths:
+        raise SystemExit(f"No images found in {args.images}")
+    resolutions = [parse_resolution(r) for r in args.resolutions.split(",") if r.strip()]
+    if not args.labels and parse_resolution(args.reference) not in resolutions:
+        resolutions.append(parse_resolution(args.reference))
+
+    results = {}
+    for resolution in resolutions:
+        name = f"{resolution[0]}x{resolution[1]}"
+        print(f"[resolution] {name} on {len(image_paths)} images x {args.runs} runs...")
+        # Fresh spawned process per resolution: the settings are read at import
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results[name] = pool.submit(profile_resolution, resolution, image_paths, args.runs, args.threshold).result()
+
+    if args.labels:
+        with open(args.labels, "r", encoding="utf-8") as f:
+            reference, reference_name = json.load(f), str(args.labels)
+    else:
+        reference_name = "{}x{}".format(*parse_resolution(args.reference))
+        reference = results[reference_name]["detections"]
+
+    print(f"\nGarments matched against {reference_name} (same label, IoU >= {args.iou})\n")
+    print(f"{'resolution':<14}{'p50 ms':>10}{'p95 ms':>10}{'resize ms':>11}{'garments':>10}{'recall':>9}{'precision':>11}{'mean IoU':>10}")
+    for name, result in sorted(results.items(), key=lambda item: parse_resolution(item[0])):
+        result.update(score(reference, result["detections"], args.iou))
+        print(
+            f"{name:<14}{result['latency_p50_ms']:>10.1f}{result['latency_p95_ms']:>10.1f}{result['resize_p50_ms']:>11.1f}"
+            f"{result['garments']:>10}{result['recall']:>9.3f}{result['precision']:>11.3f}{result['mean_iou']:>10.3f}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"reference": reference_name, "results": results}, f, indent=2)
+        print(f"\nRaw results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Micro-benchmark: cache-key hashing of uploaded images.
+
+Compares, per image:
+
+  legacy-jpeg      SHA-256 of a JPEG re-encode of the opened image (the old
+                   hash_image, still what /analyze paid for every upload)
+  b64decode+bytes  base64.b64decode, then hash_bytes of the upload
+  stream-b64       decode_base64_with_hash: decode and hash in one pass
+  pixels           hash_image(PIL image): SHA-256 of the decoded pixels
+                   (includes the decode, which the pipeline pays anyway)
+
+and hash_images over the whole set vs one image at a time.
+
+Usage:
+    python benchmarks/bench_image_hashing.py [path/to/images] [--runs 5]
+        [--size 3024x4032] [--count 4]
+
+Without a folder, --count synthetic photos of --size are used.
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from hash_utils import decode_base64_with_hash, hash_bytes, hash_image, hash_images
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def legacy_hash_image(image):
+    """The old hash_image: SHA-256 of a JPEG re-encode."""
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return hashlib.sha256(buffer.getvalue()).hexdigest()
+
+
+def synthetic_upload(width, height, seed):
+    small = np.random.default_rng(seed).integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(small).resize((width, height), Image.BILINEAR).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def best_ms(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="?", help="Folder of photos (default: synthetic)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--size", default="3024x4032", help="WxH of synthetic photos")
+    parser.add_argument("--count", type=int, default=4, help="Number of synthetic photos")
+    args = parser.parse_args()
+
+    if args.images:
+        paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        uploads = [p.read_bytes() for p in paths]
+    else:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        uploads = [synthetic_upload(width, height, seed) for seed in range(args.count)]
+
+    def opened(data):
+        return Image.open(io.BytesIO(data))
+
+    def decoded(data):
+        image = opened(data)
+        image.load()
+        return image
+
+    rows = {"legacy-jpeg": [], "b64decode+bytes": [], "stream-b64": [], "pixels": []}
+    for data in uploads:
+        text = base64.b64encode(data).decode()
+        image = decoded(data)
+        decode_ms = best_ms(lambda: decoded(data), args.runs)
+        # The legacy path hashed the freshly opened upload, so it paid the decode too
+        rows["legacy-jpeg"].append(best_ms(lambda: legacy_hash_image(opened(data)), args.runs))
+        rows["b64decode+bytes"].append(best_ms(lambda: hash_bytes(base64.b64decode(text)), args.runs))
+        rows["stream-b64"].append(best_ms(lambda: decode_base64_with_hash(text), args.runs))
+        rows["pixels"].append(best_ms(lambda: hash_image(image), args.runs) + decode_ms)
+
+    sizes = ", ".join(f"{len(data) / 1024:.0f}KB" for data in uploads)
+    print(f"{len(uploads)} uploads ({sizes}), best of {args.runs}\n")
+    print(f"{'method':<18}{'mean ms':>10}{'max ms':>10}")
+    for name, timings in rows.items():
+        print(f"{name:<18}{np.mean(timings):>10.2f}{max(timings):>10.2f}")
+
+    images = [decoded(data) for data in uploads]
+    serial = best_ms(lambda: [hash_image(image) for image in images], args.runs)
+    batched = best_ms(lambda: hash_images(images), args.runs)
+    print(f"\nhash_images over {len(images)} decoded images: {batched:.1f} ms (one at a time: {serial:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Memory and throughput: a model per worker vs one shared inference service.
+
+Starts --workers spawned "API worker" processes, as gunicorn would, in two
+setups:
+
+  in-process  each worker loads its own model (today's default)
+  service     inference_service.py holds the only model; workers set
+              INFERENCE_SOCKET and send their images over the Unix socket
+
+Once every worker is warm, each one runs --threads concurrent callers of
+get_raw_detections for --requests detections apiece. The report shows the
+resident memory of every process and the images/s over the whole host.
+
+Usage:
+    python benchmarks/bench_inference_service.py [--workers 2] [--threads 2]
+        [--requests 5] [--size 800x1067] [--modes in-process,service]
+
+Uses the model the server would load (INFERENCE_BACKEND, USE_ONNX etc. are passed through).
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+
+
+def worker_main(socket_path, size, threads, requests, barrier, results):
+    """One API worker: warm up, wait for the others, then run the load."""
+    os.environ["INFERENCE_SOCKET"] = socket_path
+    os.environ["WARMUP_ON_STARTUP"] = "false"
+    # A fallback would load the model in the worker and skew the memory numbers
+    os.environ.setdefault("INFERENCE_SOCKET_TIMEOUT", "600")
+    from PIL import Image
+
+    import fashion_detector_server as server
+    from perf_stats import current_rss_mb
+
+    width, height = size
+    image = Image.fromarray(
+        np.random.default_rng(os.getpid()).integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8)
+    ).resize((width, height))
+
+    latencies_ms = []
+
+    def caller():
+        for _ in range(requests):
+            start = time.perf_counter()
+            server.get_raw_detections(image, server.CONF_THRESHOLD)
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+
+    # The pipeline logs every call; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        if socket_path:
+            server._inference_client.wait_until_ready()
+        server.get_raw_detections(image, server.CONF_THRESHOLD)
+        barrier.wait()
+        start = time.perf_counter()
+        callers = [threading.Thread(target=caller) for _ in range(threads)]
+        for thread in callers:
+            thread.start()
+        for thread in callers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    fallbacks = server._service_router.snapshot()["fallbacks"] if server._service_router else 0
+    results.put({"rss_mb": current_rss_mb(), "elapsed_s": elapsed, "latencies_ms": latencies_ms, "fallbacks": fallbacks})
+
+
+def run_mode(mode, args, size):
+    ctx = multiprocessing.get_context("spawn")
+    service = None
+    socket_path = ""
+    tmp = tempfile.TemporaryDirectory()
+    if mode == "service":
+        socket_path = str(Path(tmp.name) / "inference.sock")
+        service = subprocess.Popen(
+            [sys.executable, str(SERVER_DIR / "inference_service.py"), "--socket", socket_path],
+            cwd=SERVER_DIR,
+            stdout=subprocess.DEVNULL,
+        )
+
+    try:
+        barrier = ctx.Barrier(args.workers)
+        results = ctx.Queue()
+        workers = [
+            ctx.Process(target=worker_main, args=(socket_path, size, args.threads, args.requests, barrier, results))
+            for _ in range(args.workers)
+        ]
+        for worker in workers:
+            worker.start()
+        reports = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        service_rss = None
+        if service is not None:
+            from inference_service import InferenceClient
+
+            stats = InferenceClient(socket_path).stats()
+            service_rss = stats["rss_mb"]
+            batch_mean = stats["batcher"]["batch_size"]["mean"]
+        else:
+            batch_mean = None
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+        tmp.cleanup()
+
+    latencies = [ms for report in reports for ms in report["latencies_ms"]]
+    elapsed = max(report["elapsed_s"] for report in reports)
+    worker_rss = [report["rss_mb"] for report in reports]
+    return {
+        "mode": mode,
+        "worker_rss_mb": worker_rss,
+        "service_rss_mb": service_rss,
+        "total_rss_mb": sum(worker_rss) + (service_rss or 0),
+        "images_per_s": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "mean_batch": batch_mean,
+        "fallbacks": sum(report["fallbacks"] for report in reports),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2, help="API worker processes (WEB_CONCURRENCY)")
+    parser.add_argument("--threads", type=int, default=2, help="Concurrent callers per worker")
+    parser.add_argument("--requests", type=int, default=5, help="Detections per caller")
+    parser.add_argument("--size", default="800x1067", help="WxH of the (already downsized) detection image")
+    parser.add_argument("--modes", default="in-process,service")
+    args = parser.parse_args()
+
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    rows = []
+    for mode in args.modes.split(","):
+        print(f"[{mode}] {args.workers} workers x {args.threads} threads x {args.requests} detections...")
+        rows.append(run_mode(mode, args, size))
+
+    print(f"\n{'mode':<12}{'worker RSS MB':>16}{'service MB':>12}{'total MB':>10}{'img/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'batch':>7}")
+    for row in rows:
+        workers = "/".join(f"{rss:.0f}" for rss in row["worker_rss_mb"])
+        service = f"{row['service_rss_mb']:.0f}" if row["service_rss_mb"] else "-"
+        batch = f"{row['mean_batch']:.2f}" if row["mean_batch"] else "-"
+        print(
+            f"{row['mode']:<12}{workers:>16}{service:>12}{row['total_rss_mb']:>10.0f}"
+            f"{row['images_per_s']:>8.2f}{row['p50_ms']:>9.0f}{row['p95_ms']:>9.0f}{batch:>7}"
+        )
+        if row["fallbacks"]:
+            print(f"  ({row['fallbacks']} calls fell back to in-process inference)")
+
+
+if __name__ == "__main__":
+    main()
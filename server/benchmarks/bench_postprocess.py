@@ -0,0 +1,161 @@
+"""
+Micro-benchmark: per-box Python loop vs vectorised DetectionFilter.
+
+Simulates YOLOS outputs (100 queries per image, 46 Fashionpedia classes +
+"no object") and times the detection tail of get_raw_detections both ways.
+
+Usage:
+    python benchmarks/bench_postprocess.py [--iterations 2000]
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from detection_postprocess import DetectionFilter, post_process_object_detection
+
+FASHIONPEDIA_LABELS = [
+    "shirt, blouse", "top, t-shirt, sweatshirt", "sweater", "cardigan", "jacket", "vest",
+    "pants", "shorts", "skirt", "coat", "dress", "jumpsuit", "cape", "glasses", "hat",
+    "headband, head covering, hair accessory", "tie", "glove", "watch", "belt", "leg warmer",
+    "tights, stockings", "sock", "shoe", "bag, wallet", "scarf", "umbrella", "hood", "collar",
+    "lapel", "epaulette", "sleeve", "pocket", "neckline", "buckle", "zipper", "applique",
+    "bead", "bow", "flower", "fringe", "ribbon", "rivet", "ruffle", "sequin", "tassel",
+]
+ID2LABEL = dict(enumerate(FASHIONPEDIA_LABELS))
+
+# Same values as fashion_detector_server (kept local so this runs without the server deps)
+MAJOR_GARMENTS = {
+    "shirt, blouse", "top, t-shirt, sweatshirt", "sweater", "cardigan",
+    "jacket", "vest", "coat", "dress", "jumpsuit", "cape",
+    "pants", "shorts", "skirt",
+    "shoe", "bag, wallet", "glasses", "hat",
+    "headband, head covering, hair accessory", "scarf"
+}
+CATEGORY_THRESHOLDS = {
+    "shirt, blouse": 0.25, "top, t-shirt, sweatshirt": 0.25, "sweater": 0.25, "cardigan": 0.25,
+    "dress": 0.25, "jumpsuit": 0.28, "pants": 0.28, "shorts": 0.30, "skirt": 0.27, "coat": 0.25,
+    "jacket": 0.25, "vest": 0.30, "cape": 0.35, "shoe": 0.80, "bag, wallet": 0.40, "glasses": 0.35,
+    "hat": 0.52, "headband, head covering, hair accessory": 0.58, "scarf": 0.38, "belt": 0.40,
+}
+
+
+def simulate_outputs(batch_size, num_queries=100, seed=0):
+    """Mostly "no object" queries with a handful of confident detections."""
+    rng = np.random.default_rng(seed)
+    num_classes = len(FASHIONPEDIA_LABELS) + 1
+    logits = rng.normal(0.0, 1.5, (batch_size, num_queries, num_classes)).astype(np.float32)
+    logits[..., -1] += 4.0
+    for b in range(batch_size):
+        confident = rng.choice(num_queries, size=12, replace=False)
+        classes = rng.integers(0, len(FASHIONPEDIA_LABELS), size=12)
+        logits[b, confident, classes] += rng.uniform(4.0, 9.0, size=12)
+    pred_boxes = rng.uniform(0.1, 0.5, (batch_size, num_queries, 4)).astype(np.float32)
+    return logits, pred_boxes
+
+
+def legacy_tail(logits, pred_boxes, target_sizes, thresholds):
+    """The original per-box loop: dict lookups, set membership, .item()/.tolist() per query."""
+    results = post_process_object_detection(logits, pred_boxes, target_sizes, threshold=min(thresholds))
+    out = []
+    for result, threshold in zip(results, thresholds):
+        detections = []
+        for box, score, label_idx in zip(result["boxes"], result["scores"], result["labels"]):
+            score = score.item()
+            if score <= threshold:
+                continue
+            label = ID2LABEL[label_idx.item()]
+            if label not in MAJOR_GARMENTS:
+                continue
+            category_threshold = CATEGORY_THRESHOLDS.get(label, threshold)
+            if score < category_threshold:
+                continue
+            x1, y1, x2, y2 = map(int, box.tolist())
+            detections.append({"label": label, "score": score, "bbox": [x1, y1, x2, y2]})
+        out.append(detections)
+    return out
+
+
+def legacy_torch_tail(logits, pred_boxes, target_sizes, thresholds):
+    """The original torch implementation (transformers post-processing + per-box loop)."""
+    import torch
+    from types import SimpleNamespace
+
+    processor = legacy_torch_tail.processor
+    outputs = SimpleNamespace(logits=torch.from_numpy(logits), pred_boxes=torch.from_numpy(pred_boxes))
+    results = processor.post_process_object_detection(
+        outputs, threshold=min(thresholds), target_sizes=torch.tensor(target_sizes)
+    )
+    out = []
+    for result, threshold in zip(results, thresholds):
+        detections = []
+        for box, score, label_idx in zip(result["boxes"], result["scores"], result["labels"]):
+            score = score.item()
+            label = ID2LABEL[label_idx.item()]
+            if label not in MAJOR_GARMENTS:
+                continue
+            category_threshold = CATEGORY_THRESHOLDS.get(label, threshold)
+            if score < category_threshold:
+                continue
+            x1, y1, x2, y2 = map(int, box.tolist())
+            detections.append({"label": label, "score": score, "bbox": [x1, y1, x2, y2]})
+        out.append(detections)
+    return out
+
+
+def same_detections(a, b, tol=1e-5):
+    """Equal labels/boxes; scores may differ by float32 rounding between torch and numpy softmax."""
+    if len(a) != len(b):
+        return False
+    for dets_a, dets_b in zip(a, b):
+        if len(dets_a) != len(dets_b):
+            return False
+        for da, db in zip(dets_a, dets_b):
+            if da["label"] != db["label"] or da["bbox"] != db["bbox"] or abs(da["score"] - db["score"]) > tol:
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100, help="YOLOS detection tokens per image")
+    args = parser.parse_args()
+
+    detection_filter = DetectionFilter(ID2LABEL, MAJOR_GARMENTS, CATEGORY_THRESHOLDS)
+
+    variants = [("python loop", legacy_tail)]
+    try:
+        from transformers import YolosImageProcessor
+        legacy_torch_tail.processor = YolosImageProcessor()
+        variants.insert(0, ("torch + loop", legacy_torch_tail))
+    except ImportError:
+        print("(torch/transformers not installed - skipping the original torch variant)")
+    variants.append(("vectorised", detection_filter.detect))
+
+    print(f"{'batch':>5} {'queries':>7} " + " ".join(f"{name:>14}" for name, _ in variants) + "   (us per image)")
+    for batch_size in (1, 2, 4, 8):
+        logits, pred_boxes = simulate_outputs(batch_size, args.queries)
+        target_sizes = [[1600.0, 1200.0]] * batch_size
+        thresholds = [0.275] * batch_size
+
+        reference = legacy_tail(logits, pred_boxes, target_sizes, thresholds)
+        row = []
+        for name, fn in variants:
+            result = fn(logits, pred_boxes, target_sizes, thresholds)
+            if not same_detections(result, reference):
+                raise SystemExit(f"{name} results differ from the python loop")
+            seconds = timeit.timeit(
+                lambda: fn(logits, pred_boxes, target_sizes, thresholds), number=args.iterations
+            )
+            row.append(seconds / args.iterations / batch_size * 1e6)
+        print(f"{batch_size:>5} {args.queries:>7} " + " ".join(f"{us:>14.1f}" for us in row))
+
+
+if __name__ == "__main__":
+    main()
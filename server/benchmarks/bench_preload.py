@@ -0,0 +1,150 @@
+"""
+Per-worker memory and first-request latency with and without PRELOAD_MODEL.
+
+Starts gunicorn (same worker class and gunicorn.conf.py as production) once
+per mode, waits until it answers, then:
+  - reads every worker's RSS / USS / PSS (PSS splits shared pages between
+    the processes sharing them, so it is the honest per-worker cost)
+  - fires one concurrent wave of /debug detections (one per worker) and
+    reports their latency, i.e. what the first users after a deploy or a
+    --max-requests recycle see
+  - reads worker memory again after the model is in use
+
+Usage:
+    python benchmarks/bench_preload.py [--workers 2] [--image photo.jpg]
+
+Uses the model the server would load (INFERENCE_BACKEND, USE_ONNX etc. are passed through).
+"""
+
+import argparse
+import base64
+import io
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import psutil
+import requests
+from PIL import Image
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_image_base64(path):
+    if path:
+        data = Path(path).read_bytes()
+    else:
+        buf = io.BytesIO()
+        Image.new("RGB", (900, 1200), (180, 150, 120)).save(buf, format="JPEG", quality=90)
+        data = buf.getvalue()
+    return base64.b64encode(data).decode()
+
+
+def worker_memory(master_pid):
+    rows = []
+    for child in psutil.Process(master_pid).children():
+        try:
+            info = child.memory_full_info()
+            rows.append({"pid": child.pid, "rss": info.rss / 1e6, "uss": info.uss / 1e6, "pss": info.pss / 1e6})
+        except psutil.Error:
+            pass
+    return rows
+
+
+def run_mode(preload, args, image_b64):
+    port = free_port()
+    env = {**os.environ, "PRELOAD_MODEL": "true" if preload else "false", "WEB_CONCURRENCY": str(args.workers)}
+    cmd = [
+        sys.executable, "-m", "gunicorn",
+        "-k", "uvicorn.workers.UvicornWorker",
+        "-c", str(SERVER_DIR / "gunicorn.conf.py"),
+        "--pythonpath", str(SERVER_DIR),
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(args.workers),
+        "--timeout", "300",
+        "fashion_detector_server:app",
+    ]
+    base_url = f"http://127.0.0.1:{port}"
+
+    with tempfile.TemporaryDirectory() as work_dir:  # /debug writes its crops to the cwd
+        log = open(Path(work_dir) / "gunicorn.log", "w")
+        started = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            while True:
+                if proc.poll() is not None:
+                    raise SystemExit(f"gunicorn exited, see log:\n{Path(log.name).read_text()[-3000:]}")
+                try:
+                    if requests.get(base_url + "/", timeout=1).ok and len(psutil.Process(proc.pid).children()) >= args.workers:
+                        break
+                except requests.RequestException:
+                    pass
+                time.sleep(0.2)
+            ready_seconds = time.perf_counter() - started
+            time.sleep(2)  # let post_fork finish in every worker
+            idle = worker_memory(proc.pid)
+
+            def detect():
+                start = time.perf_counter()
+                response = requests.post(base_url + "/debug", json={"image_base64": image_b64}, timeout=600)
+                response.raise_for_status()
+                return time.perf_counter() - start
+
+            with ThreadPoolExecutor(args.workers) as pool:
+                first_wave = list(pool.map(lambda _: detect(), range(args.workers)))
+            warm = [detect() for _ in range(args.workers)]
+            loaded = worker_memory(proc.pid)
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+            log.close()
+
+    return {
+        "ready_seconds": ready_seconds,
+        "idle": idle,
+        "loaded": loaded,
+        "first_wave": first_wave,
+        "warm": warm,
+    }
+
+
+def summarise(name, result):
+    def mean(rows, key):
+        return sum(r[key] for r in rows) / max(1, len(rows))
+
+    print(f"\n== {name}")
+    print(f"  ready after            {result['ready_seconds']:.1f}s")
+    for label, rows in (("idle workers", result["idle"]), ("after detection", result["loaded"])):
+        print(
+            f"  {label:<22} RSS {mean(rows, 'rss'):7.0f} MB   USS {mean(rows, 'uss'):7.0f} MB   "
+            f"PSS {mean(rows, 'pss'):7.0f} MB   (mean of {len(rows)} workers)"
+        )
+    print("  first requests         " + ", ".join(f"{s:.2f}s" for s in result["first_wave"]))
+    print("  warm requests          " + ", ".join(f"{s:.2f}s" for s in result["warm"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--image", default=None, help="Photo to detect on (default: a flat synthetic image)")
+    args = parser.parse_args()
+
+    image_b64 = test_image_base64(args.image)
+    for preload in (False, True):
+        summarise(f"PRELOAD_MODEL={'true' if preload else 'false'}", run_mode(preload, args, image_b64))
+
+
+if __name__ == "__main__":
+    main()
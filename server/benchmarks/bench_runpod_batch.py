@@ -0,0 +1,96 @@
+"""
+Per-image cost of the RunPod handler against the number of images per job.
+
+Drives runpod/runpod_handler.py's handler() directly (no RunPod runtime, no
+network) on whatever device torch finds, CPU here. For each batch size it sends
+multi-image jobs and reports time per job and per image, i.e. what
+RUNPOD_BATCHING saves on the GPU side before the per-job overhead (cold
+start, queueing, HTTP round trip) is even counted.
+
+Usage:
+    python benchmarks/bench_runpod_batch.py [--batch-sizes 1,2,4,8] [--runs 3]
+        [--images path/to/photos] [--size 1080x1440]
+
+Without --images, synthetic photos of --size are used. Set MAX_BATCH_SIZE to
+the largest batch size so jobs are not split.
+"""
+
+import argparse
+import base64
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageOps
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR / "runpod"))
+
+from compare_onnx_models import IMAGE_SUFFIXES
+
+
+def encode(image):
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=95)
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+def load_images(args, count):
+    if args.images:
+        paths = sorted(p for p in args.images.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        images = [ImageOps.exif_transpose(Image.open(p)).convert("RGB") for p in paths]
+    else:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        rng = np.random.default_rng(0)
+        images = [
+            Image.fromarray(rng.integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8)).resize((width, height))
+            for _ in range(count)
+        ]
+    if not images:
+        raise SystemExit(f"No images found in {args.images}")
+    return [encode(images[i % len(images)]) for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", default="1,2,4,8")
+    parser.add_argument("--runs", type=int, default=3, help="Timed jobs per batch size (after one warm-up)")
+    parser.add_argument("--images", type=Path, default=None, help="Folder of photos (photos of one size batch best)")
+    parser.add_argument("--size", default="1080x1440", help="Synthetic photo size without --images")
+    parser.add_argument("--threshold", type=float, default=0.275)
+    args = parser.parse_args()
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    os.environ.setdefault("MAX_BATCH_SIZE", str(max(batch_sizes)))
+    import runpod_handler
+
+    encoded = load_images(args, max(batch_sizes))
+
+    print(f"\ndevice={runpod_handler.device} MAX_BATCH_SIZE={runpod_handler.MAX_BATCH_SIZE}")
+    print(f"{'batch':>6}{'ms / job':>12}{'ms / image':>13}{'vs batch ' + str(batch_sizes[0]):>12}")
+    baseline = None
+    for batch_size in batch_sizes:
+        job = {"input": {"images": [
+            {"image_base64": image_b64, "threshold": args.threshold} for image_b64 in encoded[:batch_size]
+        ]}}
+        runpod_handler.handler(job)  # warm-up for this batch shape
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            output = runpod_handler.handler(job)
+            timings.append((time.perf_counter() - start) * 1000)
+        errors = [r["error"] for r in output["results"] if "error" in r]
+        if errors:
+            raise SystemExit(f"Handler error: {errors[0]}")
+
+        per_job = float(np.median(timings))
+        per_image = per_job / batch_size
+        baseline = baseline or per_image
+        print(f"{batch_size:>6}{per_job:>12.0f}{per_image:>13.0f}{per_image / baseline:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
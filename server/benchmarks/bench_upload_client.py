@@ -0,0 +1,101 @@
+"""
+Connections and wall time per request: per-request upload executors over
+the Cloudinary SDK's default connection pool vs the server's UploadClient.
+
+Each request uploads --crops crop-sized JPEGs plus one full-image JPEG in
+parallel to cloudinary_stub.py, which charges --connect-ms for every new
+connection (TCP + TLS setup) and --latency-ms per upload:
+
+  per-request   a new ThreadPoolExecutor per request, SDK pool with a single
+                keep-alive connection per host (the old upload path)
+  pooled        the server's long-lived UploadClient pool, with the SDK pool
+                sized to its workers
+
+Usage:
+    python benchmarks/bench_upload_client.py [--requests 10] [--crops 4]
+        [--connect-ms 150] [--latency-ms 50] [--mbps 20]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+os.environ.setdefault("WARMUP_ON_STARTUP", "false")
+
+
+def jpeg(size, quality, seed):
+    width, height = size
+    small = np.random.default_rng(seed).integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(small).resize(size, Image.BILINEAR).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--crops", type=int, default=4)
+    parser.add_argument("--connect-ms", type=float, default=150.0)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--mbps", type=float, default=20.0)
+    args = parser.parse_args()
+
+    import cloudinary
+    import cloudinary.uploader
+
+    import fashion_detector_server as server
+    from cloudinary_stub import CloudinaryStub
+
+    blobs = [jpeg((576, 768), 72, seed) for seed in range(args.crops)] + [jpeg((1200, 1600), 80, args.crops)]
+
+    def per_request():
+        with ThreadPoolExecutor(max_workers=min(7, len(blobs))) as ex:
+            list(ex.map(lambda data: server.get_crop_storage().put(data, timeout=8), blobs))
+
+    def pooled():
+        client = server.get_upload_client()
+        deadline = server.upload_deadline()
+        client.map(lambda data: client.call(data, deadline=deadline), blobs)
+
+    stub = CloudinaryStub(
+        latency=args.latency_ms / 1000, upload_mbps=args.mbps, connect_latency=args.connect_ms / 1000
+    ).start()
+    try:
+        cloudinary.config(cloud_name="local", api_key="key", api_secret="secret", upload_prefix=stub.base_url)
+        print(
+            f"{args.requests} requests x {len(blobs)} uploads, {args.connect_ms:g} ms per new connection, "
+            f"{args.latency_ms:g} ms + {args.mbps:g} Mbps per upload\n"
+        )
+        print(f"{'client':<14}{'connections/request':>21}{'ms/request':>12}{'p95 ms':>9}")
+        # The SDK's own connector, as created when cloudinary.uploader is imported
+        default_http = cloudinary.utils.get_http_connector(cloudinary.config(), cloudinary.CERT_KWARGS)
+        server.get_crop_storage()  # Sizes the SDK's pool to the upload workers
+        pooled_http = cloudinary.uploader._http
+        for name, run in (("per-request", per_request), ("pooled", pooled)):
+            cloudinary.uploader._http = default_http if name == "per-request" else pooled_http
+            run()  # Warm connections, as a worker past its first request would have
+            stub.reset()
+            timings = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1000)
+            print(
+                f"{name:<14}{stub.connections / args.requests:>21.1f}"
+                f"{np.mean(timings):>12.0f}{np.percentile(timings, 95):>9.0f}"
+            )
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
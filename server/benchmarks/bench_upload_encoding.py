@@ -0,0 +1,165 @@
+"""
+Upload encoding: fixed quality (the current settings) vs byte budgets.
+
+For every photo, the full image and --garments garment crops are encoded as
+upload_to_cloudinary would:
+
+  current              LANCZOS to CLOUDINARY_*_MAX_DIM, fixed CLOUDINARY_*_QUALITY
+  budget               encode_jpeg_budget with the CLOUDINARY_BYTE_BUDGET defaults
+  budget+progressive   the same with progressive scans
+
+and the report shows KB per image (mean / max), encode ms (resize included)
+and PSNR against the current encoding's input (a budget output that was
+shrunk is scaled back up first), per image class.
+
+With --search (needs SEARCHAPI_KEY and the CLOUDINARY_* credentials), each
+crop is also uploaded in both the current and the budget encoding and sent
+to Google Lens through the server's search_visual_products; the report adds
+the overlap of the result links (|A & B| / |A | B|).
+
+Usage:
+    python benchmarks/bench_upload_encoding.py [path/to/photos] [--garments 4]
+        [--count 6] [--size 3024x4032] [--search]
+
+Without a folder, --count synthetic photos of --size are used, alternating
+plain and busy textures.
+"""
+
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+
+from image_codec import JpegBudget, decode_oriented, encode_jpeg_budget, resize_within
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg"}
+
+# Same values as fashion_detector_server (kept local so this runs without the server deps)
+CLASSES = {
+    "crop": {"max_dim": 768, "quality": 72, "max_bytes": 60_000},
+    "full": {"max_dim": 1600, "quality": 80, "max_bytes": 200_000},
+}
+
+
+def synthetic_photo(width, height, seed):
+    """Plain (large-scale) or busy (fine pattern) texture, alternating by seed."""
+    cell = 64 if seed % 2 == 0 else 6
+    small = np.random.default_rng(seed).integers(0, 255, (height // cell, width // cell, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(small).resize((width, height), Image.BICUBIC).save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def garment_boxes(width, height, count):
+    """Torso-, leg- and accessory-sized boxes, like a full-body outfit photo."""
+    shapes = [(0.2, 0.15, 0.8, 0.5), (0.25, 0.45, 0.75, 0.9), (0.3, 0.88, 0.55, 0.99), (0.6, 0.3, 0.85, 0.55)]
+    return [
+        tuple(int(v * size) for v, size in zip(shapes[i % len(shapes)], (width, height, width, height)))
+        for i in range(count)
+    ]
+
+
+def encode_current(image, settings):
+    image = resize_within(image, settings["max_dim"], Image.LANCZOS, reducing_gap=2.0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=settings["quality"])
+    return buffer.getvalue()
+
+
+def encoder(progressive):
+    def encode(image, settings):
+        budget = JpegBudget(
+            max_bytes=settings["max_bytes"],
+            max_dim=settings["max_dim"],
+            max_quality=settings["quality"],
+            progressive=progressive,
+        )
+        return encode_jpeg_budget(image, budget)[0]
+
+    return encode
+
+
+METHODS = {"current": encode_current, "budget": encoder(False), "budget+progressive": encoder(True)}
+
+
+def psnr(data, reference):
+    decoded = Image.open(io.BytesIO(data)).convert("RGB")
+    if decoded.size != reference.size:
+        decoded = decoded.resize(reference.size, Image.BICUBIC)
+    mse = np.mean((np.asarray(decoded, dtype=np.float32) - np.asarray(reference, dtype=np.float32)) ** 2)
+    return 99.0 if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def search_overlap(crops):
+    """Mean overlap of Lens result links for (current, budget) encodings of each crop."""
+    import cloudinary.uploader
+
+    import fashion_detector_server as server
+
+    overlaps = []
+    for current, budget in crops:
+        links = []
+        for data in (current, budget):
+            url = cloudinary.uploader.upload(io.BytesIO(data), folder="snaplook_bench", resource_type="image")["secure_url"]
+            links.append({match.get("link") for match in server.search_visual_products(url) if match.get("link")})
+        union = links[0] | links[1]
+        overlaps.append(len(links[0] & links[1]) / len(union) if union else 1.0)
+    return overlaps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="?", help="Folder of JPEG photos (default: synthetic)")
+    parser.add_argument("--garments", type=int, default=4)
+    parser.add_argument("--count", type=int, default=6, help="Number of synthetic photos")
+    parser.add_argument("--size", default="3024x4032", help="WxH of synthetic photos")
+    parser.add_argument("--search", action="store_true", help="Also compare Lens results (uses API credits)")
+    args = parser.parse_args()
+
+    if args.images:
+        uploads = [p.read_bytes() for p in sorted(Path(args.images).iterdir()) if p.suffix.lower() in IMAGE_SUFFIXES]
+    else:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        uploads = [synthetic_photo(width, height, seed) for seed in range(args.count)]
+
+    rows = {(method, cls): {"kb": [], "ms": [], "psnr": []} for method in METHODS for cls in CLASSES}
+    search_pairs = []
+    for data in uploads:
+        photo = decode_oriented(data)
+        images = [("full", photo)] + [("crop", photo.crop(box)) for box in garment_boxes(*photo.size, args.garments)]
+        for cls, image in images:
+            settings = CLASSES[cls]
+            reference = resize_within(image, settings["max_dim"], Image.LANCZOS, reducing_gap=2.0)
+            encoded = {}
+            for method, encode in METHODS.items():
+                start = time.perf_counter()
+                encoded[method] = encode(image, settings)
+                row = rows[(method, cls)]
+                row["ms"].append((time.perf_counter() - start) * 1000)
+                row["kb"].append(len(encoded[method]) / 1024)
+                row["psnr"].append(psnr(encoded[method], reference))
+            if cls == "crop":
+                search_pairs.append((encoded["current"], encoded["budget"]))
+
+    print(f"{len(uploads)} photos, 1 full image + {args.garments} crops each\n")
+    print(f"{'class':<6}{'method':<20}{'mean KB':>9}{'max KB':>8}{'ms':>7}{'PSNR dB':>9}")
+    for (method, cls), row in sorted(rows.items(), key=lambda item: (item[0][1], list(METHODS).index(item[0][0]))):
+        print(
+            f"{cls:<6}{method:<20}{np.mean(row['kb']):>9.1f}{max(row['kb']):>8.1f}"
+            f"{np.mean(row['ms']):>7.1f}{np.mean(row['psnr']):>9.2f}"
+        )
+
+    if args.search:
+        overlaps = search_overlap(search_pairs)
+        print(f"\nLens result overlap, current vs budget crops: mean {np.mean(overlaps):.2f}, min {min(overlaps):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Compare the fp32 and INT8 ONNX models on a folder of images.
+
+Each model runs in its own fresh process (so RSS is not shared) through the
+full run_detection pipeline, i.e. after label/threshold filtering, low-light
+pass, headwear/dress/containment rules. Reports p50/p95 latency, model size,
+RSS, and per-class agreement: boxes matched by label + IoU, garments lost or
+gained, and score deltas.
+
+Usage:
+    python benchmarks/compare_onnx_models.py path/to/images [--runs 3]
+        [--fp32 yolos_fashionpedia.onnx] [--int8 yolos_fashionpedia_int8.onnx]
+        [--iou 0.5] [--json report.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+
+from onnx_engine import variant_model_path
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+def profile_model(variant, model_path, image_paths, runs, threshold, expand_ratio, max_crops):
+    """Runs in a spawned worker: load one model, time run_detection on every image."""
+    os.environ["USE_ONNX"] = "true"
+    os.environ["ONNX_MODEL_VARIANT"] = variant
+    os.environ["INFERENCE_BACKEND"] = "onnx-int8" if variant == "int8" else "onnx"
+    import psutil
+    from PIL import Image, ImageOps
+
+    import fashion_detector_server as server
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+
+    server.ONNX_MODEL_PATH = Path(model_path)
+    load_start = time.perf_counter()
+    server.ensure_model_loaded()
+    load_seconds = time.perf_counter() - load_start
+    rss_loaded = process.memory_info().rss
+
+    threshold = server.CONF_THRESHOLD if threshold is None else threshold
+    expand_ratio = server.EXPAND_RATIO if expand_ratio is None else expand_ratio
+    max_crops = server.MAX_GARMENTS if max_crops is None else max_crops
+
+    latencies_ms = []
+    detections = {}
+    # The pipeline logs every decision; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for path in image_paths:
+            image = ImageOps.exif_transpose(Image.open(path)).convert("RGB")
+            server.run_detection(image, threshold, expand_ratio, max_crops)  # warm-up for this size
+            for _ in range(runs):
+                start = time.perf_counter()
+                filtered, _ = server.run_detection(image, threshold, expand_ratio, max_crops)
+                latencies_ms.append((time.perf_counter() - start) * 1000)
+            detections[path] = [
+                {"label": d["label"], "score": float(d["score"]), "bbox": [int(v) for v in d["bbox"]]}
+                for d in filtered
+            ]
+
+    return {
+        "model_path": str(model_path),
+        "model_mb": Path(model_path).stat().st_size / 1e6,
+        "load_seconds": load_seconds,
+        "rss_before_load_mb": rss_before / 1e6,
+        "rss_loaded_mb": rss_loaded / 1e6,
+        "rss_peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / 1e6,  # KiB on Linux
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "latency_p95_ms": float(np.percentile(latencies_ms, 95)),
+        "latency_mean_ms": float(np.mean(latencies_ms)),
+        "detections": detections,
+    }
+
+
+def box_iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_detections(reference, candidate, iou_threshold):
+    """Greedy same-label matching by IoU. Returns (matches, unmatched_ref, unmatched_cand)."""
+    pairs = sorted(
+        (
+            (box_iou(r["bbox"], c["bbox"]), i, j)
+            for i, r in enumerate(reference)
+            for j, c in enumerate(candidate)
+            if r["label"] == c["label"]
+        ),
+        reverse=True,
+    )
+    used_ref, used_cand, matches = set(), set(), []
+    for iou, i, j in pairs:
+        if iou < iou_threshold:
+            break
+        if i in used_ref or j in used_cand:
+            continue
+        used_ref.add(i)
+        used_cand.add(j)
+        matches.append((reference[i], candidate[j], iou))
+    unmatched_ref = [r for i, r in enumerate(reference) if i not in used_ref]
+    unmatched_cand = [c for j, c in enumerate(candidate) if j not in used_cand]
+    return matches, unmatched_ref, unmatched_cand
+
+
+def compare(reference, candidate, iou_threshold):
+    per_class = defaultdict(lambda: {"reference": 0, "matched": 0, "lost": 0, "gained": 0, "ious": [], "deltas": []})
+    identical_images = 0
+
+    for path, ref_dets in reference["detections"].items():
+        cand_dets = candidate["detections"].get(path, [])
+        matches, lost, gained = match_detections(ref_dets, cand_dets, iou_threshold)
+        if not lost and not gained:
+            identical_images += 1
+        for det in ref_dets:
+            per_class[det["label"]]["reference"] += 1
+        for ref, cand, iou in matches:
+            stats = per_class[ref["label"]]
+            stats["matched"] += 1
+            stats["ious"].append(iou)
+            stats["deltas"].append(cand["score"] - ref["score"])
+        for det in lost:
+            per_class[det["label"]]["lost"] += 1
+        for det in gained:
+            per_class[det["label"]]["gained"] += 1
+
+    return per_class, identical_images
+
+
+def print_report(results, per_class, identical_images, iou_threshold):
+    names = list(results)
+    print(f"\n{'':<22}" + "".join(f"{name:>14}" for name in names))
+    for key, label, fmt in [
+        ("model_mb", "model size (MB)", "{:>14.1f}"),
+        ("load_seconds", "load time (s)", "{:>14.2f}"),
+        ("rss_loaded_mb", "RSS after load (MB)", "{:>14.0f}"),
+        ("rss_peak_mb", "peak RSS (MB)", "{:>14.0f}"),
+        ("latency_p50_ms", "p50 latency (ms)", "{:>14.1f}"),
+        ("latency_p95_ms", "p95 latency (ms)", "{:>14.1f}"),
+    ]:
+        print(f"{label:<22}" + "".join(fmt.format(results[name][key]) for name in names))
+
+    num_images = len(results[names[0]]["detections"])
+    print(f"\nImages with identical garments: {identical_images}/{num_images}  (IoU >= {iou_threshold})")
+    print(f"\n{'class':<42}{'fp32':>6}{'match':>7}{'lost':>6}{'gained':>8}{'mean IoU':>10}{'mean dS':>9}{'max |dS|':>10}")
+    totals = defaultdict(int)
+    for label in sorted(per_class):
+        stats = per_class[label]
+        deltas = np.asarray(stats["deltas"]) if stats["deltas"] else np.zeros(1)
+        mean_iou = np.mean(stats["ious"]) if stats["ious"] else float("nan")
+        print(
+            f"{label[:41]:<42}{stats['reference']:>6}{stats['matched']:>7}{stats['lost']:>6}{stats['gained']:>8}"
+            f"{mean_iou:>10.3f}{deltas.mean():>+9.3f}{np.abs(deltas).max():>10.3f}"
+        )
+        for key in ("reference", "matched", "lost", "gained"):
+            totals[key] += stats[key]
+    print(f"{'TOTAL':<42}{totals['reference']:>6}{totals['matched']:>7}{totals['lost']:>6}{totals['gained']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", type=Path, help="Folder of test images")
+    parser.add_argument("--fp32", type=Path, default=SERVER_DIR / "yolos_fashionpedia.onnx")
+    parser.add_argument("--int8", type=Path, default=None, help="Defaults to <fp32>_int8.onnx")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per image (after one warm-up)")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU needed to count a box as the same garment")
+    parser.add_argument("--threshold", type=float, default=None, help="Defaults to the server's CONF_THRESHOLD")
+    parser.add_argument("--expand-ratio", type=float, default=None)
+    parser.add_argument("--max-crops", type=int, default=None)
+    parser.add_argument("--json", type=Path, default=None, help="Also write the raw results here")
+    args = parser.parse_args()
+
+    int8_path = args.int8 or variant_model_path(args.fp32, "int8")
+    image_paths = sorted(str(p) for p in args.images.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not image_paths:
+        raise SystemExit(f"No images found in {args.images}")
+    for path in (args.fp32, int8_path):
+        if not Path(path).exists():
+            raise SystemExit(f"Model not found: {path} (run export_model_to_onnx.py --quantize)")
+
+    results = {}
+    for name, path in (("fp32", args.fp32), ("int8", int8_path)):
+        print(f"[compare] {name}: {path} on {len(image_paths)} images x {args.runs} runs...")
+        # Fresh spawned process per model so RSS and load time are not shared
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results[name] = pool.submit(
+                profile_model, name, str(path), image_paths, args.runs,
+                args.threshold, args.expand_ratio, args.max_crops,
+            ).result()
+
+    per_class, identical_images = compare(results["fp32"], results["int8"], args.iou)
+    print_report(results, per_class, identical_images, args.iou)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"models": results, "per_class": per_class}, f, indent=2)
+        print(f"\nRaw results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
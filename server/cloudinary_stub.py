@@ -0,0 +1,193 @@
+"""
+Local stand-in for the Cloudinary upload API and image delivery.
+
+Accepts POST /v1_1/<cloud>/image/upload (the SDK's multipart upload) and
+answers like Cloudinary ({"public_id", "version", "secure_url", "width",
+"height", "format", "bytes"}), honouring `folder`, `public_id` and
+`overwrite`; the `secure_url` points back at the stub,
+which serves the stored image with the `c_crop` / `c_limit` transformations
+the server builds crop URLs from. Every upload's size is recorded in
+`uploads` and every new connection in `connections`. `latency` /
+`upload_mbps` simulate the network per upload and `connect_latency` the
+TCP + TLS setup of a new connection, so that upload strategies can be
+compared offline.
+
+Usage (with the SDK pointed at it):
+    stub = CloudinaryStub(upload_mbps=20, latency=0.05).start()
+    cloudinary.config(cloud_name="local", api_key="key", api_secret="secret",
+                      upload_prefix=stub.base_url)
+"""
+
+import io
+import json
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+from PIL import Image
+
+_TRANSFORMATION = re.compile(r"^[a-z]+_[^/]*$")
+
+
+def apply_transformations(image: Image.Image, transformations) -> Image.Image:
+    """The subset of Cloudinary transformations the server uses: c_crop and c_limit."""
+    for transformation in transformations:
+        params = dict(part.split("_", 1) for part in transformation.split(","))
+        crop = params.get("c")
+        if crop == "crop":
+            x, y = int(params.get("x", 0)), int(params.get("y", 0))
+            image = image.crop((x, y, x + int(params["w"]), y + int(params["h"])))
+        elif crop == "limit":
+            image = image.copy()
+            image.thumbnail((int(params["w"]), int(params["h"])), Image.LANCZOS)
+    return image
+
+
+class CloudinaryStub:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        upload_mbps: float = 0.0,
+        connect_latency: float = 0.0,
+    ):
+        self.latency = latency
+        self.upload_mbps = upload_mbps  # 0 = unlimited
+        self.connect_latency = connect_latency
+        self.connections = 0
+        self.uploads = []  # {"public_id", "bytes"}
+        self.images: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._request_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def bytes_uploaded(self) -> int:
+        with self._lock:
+            return sum(upload["bytes"] for upload in self.uploads)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.uploads.clear()
+            self.connections = 0
+
+    def start(self) -> "CloudinaryStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="cloudinary-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "CloudinaryStub":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _store(self, cloud: str, data: bytes, fields: Dict[str, str]) -> dict:
+        public_id = fields.get("public_id") or uuid.uuid4().hex[:20]
+        if fields.get("folder"):
+            public_id = f"{fields['folder']}/{public_id}"
+        overwrite = fields.get("overwrite", "true").lower() not in {"0", "false"}
+        with self._lock:
+            self.uploads.append({"public_id": public_id, "bytes": len(data)})
+            if overwrite or public_id not in self.images:
+                self.images[public_id] = data
+            data = self.images[public_id]
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+        return {
+            "public_id": public_id,
+            "version": 1,
+            "width": width,
+            "height": height,
+            "format": "jpg",
+            "bytes": len(data),
+            "secure_url": f"{self.base_url}/{cloud}/image/upload/v1/{public_id}.jpg",
+        }
+
+    def _request_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+                if stub.connect_latency:
+                    time.sleep(stub.connect_latency)
+
+            def do_POST(self):
+                match = re.match(r"^/v1_1/([^/]+)/image/upload/?$", self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if not match:
+                    return self._reply(404, b'{"error": "unknown path"}', "application/json")
+                if stub.latency or stub.upload_mbps:
+                    time.sleep(stub.latency + (length * 8 / (stub.upload_mbps * 1e6) if stub.upload_mbps else 0))
+                message = BytesParser(policy=HTTP).parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+                )
+                fields = {
+                    part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                    for part in message.iter_parts()
+                }
+                if not fields.get("file"):
+                    return self._reply(400, b'{"error": "missing file"}', "application/json")
+                data = fields.pop("file")
+                fields = {name: value.decode() for name, value in fields.items()}
+                self._reply(200, json.dumps(stub._store(match.group(1), data, fields)).encode(), "application/json")
+
+            def do_GET(self):
+                match = re.match(r"^/[^/]+/image/upload/(.*)$", self.path)
+                if not match:
+                    return self._reply(404, b"", "text/plain")
+                parts = match.group(1).split("/")
+                transformations = []
+                while parts and _TRANSFORMATION.match(parts[0]) and not re.match(r"^v\d+$", parts[0]):
+                    transformations.append(parts.pop(0))
+                if parts and re.match(r"^v\d+$", parts[0]):
+                    parts.pop(0)
+                public_id = "/".join(parts).rsplit(".", 1)[0]
+                data = stub.images.get(public_id)
+                if data is None:
+                    return self._reply(404, b"", "text/plain")
+                if transformations:
+                    image = apply_transformations(Image.open(io.BytesIO(data)).convert("RGB"), transformations)
+                    buffer = io.BytesIO()
+                    image.save(buffer, format="JPEG", quality=95)
+                    data = buffer.getvalue()
+                self._reply(200, data, "image/jpeg")
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def _reply(self, status, data, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,354 @@
+"""
+Pluggable storage for the crops and full images the pipeline uploads.
+
+A storage backend takes encoded JPEG bytes and returns an upload response
+shaped like Cloudinary's ({"secure_url", "public_id", "version", "width",
+"height"}), so upload_to_cloudinary, the upload cache and the search code
+don't care what is behind it. Backends register a factory under a name with
+`register_storage`; the server picks one with CROP_STORAGE.
+
+Built in:
+
+  cloudinary  the Cloudinary upload API (the default)
+  local       a TTL store in memory or in a directory, served by the server's
+              own GET /crops/<id>.jpg route with HMAC-signed, expiring URLs
+  faulty      another backend with injected latency, errors and timeouts,
+              for load tests that must not hit the real CDN
+"""
+
+import hashlib
+import hmac
+import io
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+
+@dataclass(frozen=True)
+class StorageSettings:
+    """Everything the built-in backends need; each reads its own fields."""
+
+    folder: str = "snaplook_crops"
+    pool_size: int = 8  # cloudinary: keep-alive connections
+    base_url: str = ""  # local: public URL of this server (see check_local_settings)
+    secret: str = ""  # local: URL signing key (random per process when empty)
+    ttl_seconds: float = 3600
+    directory: str = ""  # local: share files between workers (in memory when empty)
+    max_bytes: int = 512 * 1024 * 1024
+    fault_inner: str = "local"
+    fault_latency_ms: float = 0.0
+    fault_error_rate: float = 0.0
+    fault_timeout_rate: float = 0.0
+
+
+_REGISTRY: Dict[str, Callable[[StorageSettings], "CropStorage"]] = {}
+
+
+def register_storage(name: str):
+    """Decorator: make `factory(settings) -> CropStorage` available as `name`."""
+    def decorator(factory):
+        _REGISTRY[name] = factory
+        return factory
+    return decorator
+
+
+def available_storages() -> List[str]:
+    return sorted(_REGISTRY)
+
+
+def create_storage(name: str, settings: StorageSettings) -> "CropStorage":
+    if name not in _REGISTRY:
+        raise ValueError(f"Unknown crop storage {name!r} (available: {', '.join(available_storages())})")
+    return _REGISTRY[name](settings)
+
+
+def check_local_settings(settings: StorageSettings, workers: int = 1) -> None:
+    """
+    Raise ValueError for local storage settings whose URLs the search API
+    couldn't fetch: no public base URL, or state private to one of several
+    workers (a GET can land on any worker).
+    """
+    problems = []
+    if not settings.base_url:
+        problems.append("no base URL for the search API to fetch crops from")
+    if workers > 1 and not settings.directory:
+        problems.append(f"in-memory store with {workers} workers")
+    if workers > 1 and not settings.secret:
+        problems.append(f"no signing secret shared by the {workers} workers")
+    if problems:
+        raise ValueError(f"Local crop storage misconfigured: {'; '.join(problems)}")
+
+
+def jpeg_size(data: bytes) -> tuple:
+    with Image.open(io.BytesIO(data)) as image:
+        return image.size
+
+
+class CropStorage:
+    """Interface every backend implements."""
+
+    name = ""
+    # Serves Cloudinary URL transformations (needed by CLOUDINARY_CROP_BY_URL)
+    supports_transformations = False
+
+    def put(self, data: bytes, timeout: float, public_id: Optional[str] = None, overwrite: bool = True) -> dict:
+        """Store `data`; raise on failure. `timeout` bounds the whole call."""
+        raise NotImplementedError
+
+    def refresh(self, upload: dict) -> Optional[dict]:
+        """An earlier `put` response made current again, or None if it must be uploaded again."""
+        return upload
+
+    def info(self) -> dict:
+        return {"name": self.name}
+
+
+@register_storage("cloudinary")
+class CloudinaryStorage(CropStorage):
+    name = "cloudinary"
+    supports_transformations = True
+
+    def __init__(self, settings: StorageSettings):
+        import cloudinary
+        import cloudinary.uploader
+        import cloudinary.utils
+
+        self.folder = settings.folder
+        self.pool_size = settings.pool_size
+        # The SDK's default pool keeps a single connection per host, so parallel uploads
+        # reconnected (TCP + TLS) every time. urllib3's own retries are off: UploadClient retries
+        cloudinary.uploader._http = cloudinary.utils.get_http_connector(
+            cloudinary.config(),
+            {**cloudinary.CERT_KWARGS, "maxsize": settings.pool_size, "retries": False},
+        )
+
+    def put(self, data: bytes, timeout: float, public_id: Optional[str] = None, overwrite: bool = True) -> dict:
+        import cloudinary.uploader
+
+        options = {"public_id": public_id, "overwrite": overwrite} if public_id else {}
+        # Upload to Cloudinary with minimal processing for speed
+        result = cloudinary.uploader.upload(
+            io.BytesIO(data),
+            folder=self.folder,
+            resource_type="image",
+            format="jpg",
+            timeout=timeout,
+            **options,
+        )
+        if not result or not result.get("secure_url"):
+            raise ValueError("Cloudinary response without secure_url")
+        return result
+
+    def info(self) -> dict:
+        return {"name": self.name, "folder": self.folder, "pool_size": self.pool_size}
+
+
+@register_storage("local")
+class LocalStorage(CropStorage):
+    """
+    Crops kept for `ttl_seconds`, in memory (one worker only: the GET may land
+    on any worker) or as files in `directory` (shared by the workers of a
+    host). URLs carry an expiry and an HMAC of (id, expiry), so they can't be
+    guessed or used after the TTL. The oldest entries go first beyond
+    `max_bytes`.
+    """
+
+    name = "local"
+    ROUTE = "/crops"
+
+    def __init__(self, settings: StorageSettings, clock: Callable[[], float] = time.time):
+        self.base_url = settings.base_url.rstrip("/")
+        self.secret = (settings.secret or os.urandom(32).hex()).encode()
+        self.ttl_seconds = settings.ttl_seconds
+        self.max_bytes = settings.max_bytes
+        self.directory = Path(settings.directory) if settings.directory else None
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (created, data)
+        self._bytes = 0
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def signature(self, public_id: str, expires: int) -> str:
+        return hmac.new(self.secret, f"{public_id}:{expires}".encode(), hashlib.sha256).hexdigest()[:32]
+
+    def url(self, public_id: str) -> str:
+        expires = int(self.clock() + self.ttl_seconds)
+        return f"{self.base_url}{self.ROUTE}/{public_id}.jpg?expires={expires}&sig={self.signature(public_id, expires)}"
+
+    def put(self, data: bytes, timeout: float, public_id: Optional[str] = None, overwrite: bool = True) -> dict:
+        public_id = public_id or uuid.uuid4().hex
+        if not public_id.isalnum():
+            raise ValueError(f"Invalid public id {public_id!r}")
+        width, height = jpeg_size(data)
+        if self.directory is not None:
+            self._put_file(public_id, data, overwrite)
+        else:
+            self._put_memory(public_id, data, overwrite)
+        return {"secure_url": self.url(public_id), "public_id": public_id, "version": 1, "width": width, "height": height}
+
+    def _put_memory(self, public_id: str, data: bytes, overwrite: bool) -> None:
+        with self._lock:
+            previous = self._entries.pop(public_id, None)
+            if previous is not None and not overwrite:
+                data = previous[1]  # Keep the stored bytes, but restart their TTL like the URL's
+            if previous is not None:
+                self._bytes -= len(previous[1])
+            self._entries[public_id] = (self.clock(), data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _put_file(self, public_id: str, data: bytes, overwrite: bool) -> None:
+        path = self.directory / f"{public_id}.jpg"
+        try:
+            previous = path.stat().st_size
+        except FileNotFoundError:
+            previous = 0
+        if previous and not overwrite:
+            os.utime(path)
+            return
+        # Write then rename, so readers in other workers never see a partial file
+        partial = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        partial.write_bytes(data)
+        os.replace(partial, path)
+        with self._lock:
+            self._bytes += len(data) - previous
+            if self._bytes > self.max_bytes:
+                self._bytes = self.trim()
+
+    def trim(self) -> int:
+        """Delete expired files, then the oldest beyond max_bytes; returns the bytes kept."""
+        files = sorted(
+            ((entry.stat().st_mtime, entry.stat().st_size, entry) for entry in self.directory.glob("*.jpg")),
+            reverse=True,
+        )
+        kept = 0
+        oldest_allowed = self.clock() - self.ttl_seconds
+        for mtime, size, path in files:
+            if mtime < oldest_allowed or kept + size > self.max_bytes:
+                path.unlink(missing_ok=True)
+            else:
+                kept += size
+        return kept
+
+    def get(self, public_id: str, expires: int, signature: str) -> Optional[bytes]:
+        """The stored bytes, if the URL is genuine, unexpired and the entry still exists."""
+        if not public_id.isalnum() or expires < self.clock():
+            return None
+        if not hmac.compare_digest(signature, self.signature(public_id, expires)):
+            return None
+        if self.directory is not None:
+            path = self.directory / f"{public_id}.jpg"
+            try:
+                if path.stat().st_mtime < self.clock() - self.ttl_seconds:
+                    return None
+                return path.read_bytes()
+            except FileNotFoundError:
+                return None
+        with self._lock:
+            entry = self._entries.get(public_id)
+        if entry is None or entry[0] < self.clock() - self.ttl_seconds:
+            return None
+        return entry[1]
+
+    def refresh(self, upload: dict) -> Optional[dict]:
+        public_id = upload.get("public_id", "")
+        if self.directory is not None:
+            path = self.directory / f"{public_id}.jpg"
+            present = path.exists() and path.stat().st_mtime >= self.clock() - self.ttl_seconds
+        else:
+            with self._lock:
+                entry = self._entries.get(public_id)
+            present = entry is not None and entry[0] >= self.clock() - self.ttl_seconds
+        # A fresh signature would outlive the entry itself; callers upload again instead
+        return {**upload, "secure_url": self.url(public_id)} if present and public_id.isalnum() else None
+
+    def get_url(self, url: str) -> Optional[bytes]:
+        """`get` for a URL returned by `put`."""
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        try:
+            expires = int(query["expires"][0])
+            signature = query["sig"][0]
+        except (KeyError, ValueError):
+            return None
+        return self.get(Path(parsed.path).stem, expires, signature)
+
+    def info(self) -> dict:
+        with self._lock:
+            entries, stored = len(self._entries), self._bytes
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "directory": str(self.directory) if self.directory else None,
+            "ttl_seconds": self.ttl_seconds,
+            "entries": entries if self.directory is None else None,
+            "bytes": stored,
+        }
+
+
+@register_storage("faulty")
+class FaultyStorage(CropStorage):
+    """
+    Wraps `fault_inner` with injected faults: every put waits ~`latency_ms`
+    (+-50%), then fails with probability `error_rate`, or hangs until its
+    timeout with probability `timeout_rate`.
+    """
+
+    name = "faulty"
+
+    def __init__(
+        self,
+        settings: StorageSettings,
+        inner: Optional[CropStorage] = None,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None,
+    ):
+        self.inner = inner or create_storage(settings.fault_inner, settings)
+        self.latency_ms = settings.fault_latency_ms
+        self.error_rate = settings.fault_error_rate
+        self.timeout_rate = settings.fault_timeout_rate
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self.supports_transformations = self.inner.supports_transformations
+        self.faults = {"errors": 0, "timeouts": 0}
+
+    def put(self, data: bytes, timeout: float, public_id: Optional[str] = None, overwrite: bool = True) -> dict:
+        roll = self.rng.random()
+        if roll < self.timeout_rate:
+            self.faults["timeouts"] += 1
+            self.sleep(timeout)
+            raise TimeoutError(f"injected timeout after {timeout:.2f}s")
+        delay = self.latency_ms / 1000 * self.rng.uniform(0.5, 1.5)
+        if delay >= timeout:
+            self.sleep(timeout)
+            raise TimeoutError(f"injected latency of {delay:.2f}s exceeds the {timeout:.2f}s timeout")
+        self.sleep(delay)
+        if roll < self.timeout_rate + self.error_rate:
+            self.faults["errors"] += 1
+            raise ConnectionError("injected upload error")
+        return self.inner.put(data, timeout - delay, public_id=public_id, overwrite=overwrite)
+
+    def refresh(self, upload: dict) -> Optional[dict]:
+        return self.inner.refresh(upload)
+
+    def info(self) -> dict:
+        return {
+            "name": f"{self.name}({self.inner.name})",
+            "latency_ms": self.latency_ms,
+            "error_rate": self.error_rate,
+            "timeout_rate": self.timeout_rate,
+            **self.faults,
+            "inner": self.inner.info(),
+        }
@@ -0,0 +1,204 @@
+"""
+Cache of run_detection results keyed by image content.
+
+The same photo is often analysed again (reshared posts, client retries after
+a timeout, one screenshot sent by several users). DetectionCache keeps the
+final, filtered detections for recent images in an in-process LRU with a TTL
+and can sit in front of a SqliteStore, a sqlite file on local disk that every
+gunicorn worker on the host reads and writes.
+
+Values are stored as JSON, so every hit returns a fresh copy that callers are
+free to mutate.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from perf_stats import Histogram
+
+
+class SqliteStore:
+    """
+    Detection results shared by all processes on the host.
+
+    Entries older than `ttl_seconds` are ignored on read and deleted, together
+    with the oldest rows beyond `max_entries`, every `trim_every` writes.
+    Connections are opened per thread and per process, so the store can be
+    created before gunicorn forks. Caches sharing one file use their own `table`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: float,
+        max_entries: int = 10_000,
+        trim_every: int = 100,
+        clock: Callable[[], float] = time.time,
+        table: str = "detections",
+    ):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table!r}")
+        self.path = path
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.trim_every = max(1, trim_every)
+        self.clock = clock
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            f"SELECT value FROM {self.table} WHERE key = ? AND created >= ?",
+            (key, self.clock() - self.ttl_seconds),
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, value: str) -> None:
+        conn = self._connection()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, created) VALUES (?, ?, ?)",
+            (key, value, self.clock()),
+        )
+        self._writes += 1
+        if self._writes % self.trim_every == 0:
+            self.trim()
+
+    def trim(self) -> None:
+        conn = self._connection()
+        conn.execute(f"DELETE FROM {self.table} WHERE created < ?", (self.clock() - self.ttl_seconds,))
+        conn.execute(
+            f"DELETE FROM {self.table} WHERE key NOT IN "
+            f"(SELECT key FROM {self.table} ORDER BY created DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def __len__(self) -> int:
+        return self._connection().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class DetectionCache:
+    """
+    LRU of detection results with a TTL, optionally backed by a shared store.
+
+    A miss in memory falls through to `store`; a store hit is copied into
+    memory. Store errors are logged and treated as misses - the cache must
+    never fail a request.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float = 3600,
+        store: Optional[SqliteStore] = None,
+        clock: Callable[[], float] = time.time,
+        log: Callable[..., None] = print,
+        name: str = "DetectionCache",
+    ):
+        self.name = name
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self.clock = clock
+        self.log = log
+
+        self.lookup_hist = Histogram()
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._counters = {"hits": 0, "store_hits": 0, "misses": 0, "evictions": 0, "expired": 0, "store_errors": 0}
+
+    def get(self, key: str) -> Optional[Any]:
+        start = time.perf_counter()
+        try:
+            value = self._get(key)
+        finally:
+            self.lookup_hist.observe((time.perf_counter() - start) * 1000)
+        return None if value is None else json.loads(value)
+
+    def _get(self, key: str) -> Optional[str]:
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return value
+                del self._entries[key]
+                self._counters["expired"] += 1
+
+        value = None
+        if self.store is not None:
+            try:
+                value = self.store.get(key)
+            except sqlite3.Error as exc:
+                self._store_error("read", exc)
+
+        with self._lock:
+            if value is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["store_hits"] += 1
+            self._remember(key, value, now)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        encoded = json.dumps(value)
+        with self._lock:
+            self._remember(key, encoded, self.clock())
+        if self.store is not None:
+            try:
+                self.store.put(key, encoded)
+            except sqlite3.Error as exc:
+                self._store_error("write", exc)
+
+    def _remember(self, key: str, value: str, now: float) -> None:
+        self._entries[key] = (now + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _store_error(self, action: str, exc: Exception) -> None:
+        with self._lock:
+            self._counters["store_errors"] += 1
+        self.log(f"[{self.name}] Store {action} failed: {exc}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+        lookups = counters["hits"] + counters["store_hits"] + counters["misses"]
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "store": self.store.path if self.store else None,
+            **counters,
+            "hit_rate": round((counters["hits"] + counters["store_hits"]) / lookups, 4) if lookups else None,
+            "lookup_ms": self.lookup_hist.snapshot(),
+        }
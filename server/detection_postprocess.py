@@ -0,0 +1,158 @@
+"""
+Numpy post-processing for YOLOS detection outputs.
+Mirrors `YolosImageProcessor.post_process_object_detection` without torch,
+plus vectorised label/threshold filtering of the resulting detections.
+"""
+
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+
+def softmax(x: np.ndarray, axis: int = -1) -> np.ndarray:
+    shifted = x - x.max(axis=axis, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=axis, keepdims=True)
+
+
+def center_to_corners(boxes: np.ndarray) -> np.ndarray:
+    """Convert (cx, cy, w, h) boxes to (x1, y1, x2, y2)."""
+    cx, cy, w, h = np.moveaxis(boxes, -1, 0)
+    return np.stack([cx - 0.5 * w, cy - 0.5 * h, cx + 0.5 * w, cy + 0.5 * h], axis=-1)
+
+
+def post_process_object_detection(
+    logits: np.ndarray,
+    pred_boxes: np.ndarray,
+    target_sizes: Sequence[Sequence[float]],
+    threshold: float = 0.5,
+) -> List[Dict[str, np.ndarray]]:
+    """
+    Turn raw model outputs into per-image scores, labels and boxes.
+
+    Args:
+        logits: (batch, queries, num_classes + 1) class logits; the last class is "no object"
+        pred_boxes: (batch, queries, 4) normalised (cx, cy, w, h) boxes
+        target_sizes: (batch, 2) of (height, width) to scale boxes to
+        threshold: keep predictions with score strictly above this value
+
+    Returns:
+        One dict per image with "scores", "labels" and "boxes" (x1, y1, x2, y2) arrays
+    """
+    probs = softmax(logits.astype(np.float32, copy=False), axis=-1)[..., :-1]
+    labels = probs.argmax(axis=-1)
+    scores = np.take_along_axis(probs, labels[..., None], axis=-1)[..., 0]
+
+    sizes = np.asarray(target_sizes, dtype=np.float32)
+    scale = np.stack([sizes[:, 1], sizes[:, 0], sizes[:, 1], sizes[:, 0]], axis=-1)
+    boxes = center_to_corners(pred_boxes.astype(np.float32, copy=False)) * scale[:, None, :]
+
+    results = []
+    for image_scores, image_labels, image_boxes in zip(scores, labels, boxes):
+        keep = image_scores > threshold
+        results.append({
+            "scores": image_scores[keep],
+            "labels": image_labels[keep],
+            "boxes": image_boxes[keep],
+        })
+    return results
+
+
+class DetectionFilter:
+    """
+    Vectorised post-processing and label/threshold filtering.
+
+    Built once per loaded model: a per-class-id boolean keep-mask (labels we
+    care about) and a per-class threshold vector (NaN where the request
+    threshold applies). A whole batch of raw outputs is then filtered with a
+    handful of numpy ops, and boxes are only converted for kept queries.
+    """
+
+    def __init__(
+        self,
+        id2label: Dict[int, str],
+        allowed_labels: Iterable[str],
+        category_thresholds: Dict[str, float],
+    ):
+        num_classes = max(id2label) + 1 if id2label else 0
+        allowed = set(allowed_labels)
+
+        self.label_names = [id2label.get(idx, "") for idx in range(num_classes)]
+        self.keep_mask = np.array(
+            [name in allowed for name in self.label_names], dtype=bool
+        )
+        self.class_thresholds = np.array(
+            [category_thresholds.get(name, np.nan) for name in self.label_names],
+            dtype=np.float64,
+        )
+        self._has_class_threshold = ~np.isnan(self.class_thresholds)
+
+    def detect(
+        self,
+        logits: np.ndarray,
+        pred_boxes: np.ndarray,
+        target_sizes: Sequence[Sequence[float]],
+        thresholds: Sequence[float],
+    ) -> List[List[dict]]:
+        """Turn a batch of raw logits/pred_boxes into one detection list per image."""
+        logits = np.asarray(logits, dtype=np.float32)
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+
+        # Softmax score of the best real class, without normalising every class
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        labels = exp[..., :-1].argmax(axis=-1)
+        scores = np.take_along_axis(exp, labels[..., None], axis=-1)[..., 0] / exp.sum(axis=-1)
+
+        batch_idx, query_idx = np.nonzero(self._keep(labels, scores, thresholds[:, None]))
+        sizes = np.asarray(target_sizes, dtype=np.float32)[batch_idx]
+        scale = np.stack([sizes[:, 1], sizes[:, 0], sizes[:, 1], sizes[:, 0]], axis=-1)
+        boxes = center_to_corners(np.asarray(pred_boxes, dtype=np.float32)[batch_idx, query_idx]) * scale
+
+        return self._collect(
+            len(thresholds), batch_idx, labels[batch_idx, query_idx], scores[batch_idx, query_idx], boxes
+        )
+
+    def filter_rows(self, rows: np.ndarray, thresholds: Sequence[float]) -> List[List[dict]]:
+        """
+        Filter the compact rows of a fused-post-processing ONNX graph:
+        (num_rows, 7) of (batch_index, label_id, score, x1, y1, x2, y2).
+        """
+        rows = np.asarray(rows, dtype=np.float32).reshape(-1, 7)
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+
+        batch_idx = rows[:, 0].astype(np.int64)
+        labels = rows[:, 1].astype(np.int64)
+        scores = rows[:, 2]
+        keep = self._keep(labels, scores, thresholds[batch_idx])
+
+        return self._collect(len(thresholds), batch_idx[keep], labels[keep], scores[keep], rows[keep, 3:])
+
+    def _keep(self, labels: np.ndarray, scores: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+        """
+        Score > the image's threshold, an allowed label, and score >= that
+        label's category threshold (falling back to the image's threshold).
+        """
+        class_thresholds = np.where(
+            self._has_class_threshold[labels], self.class_thresholds[labels], thresholds
+        )
+        return (
+            (scores > thresholds.astype(np.float32))
+            & self.keep_mask[labels]
+            & (scores >= class_thresholds)
+        )
+
+    def _collect(
+        self,
+        batch_size: int,
+        batch_idx: np.ndarray,
+        labels: np.ndarray,
+        scores: np.ndarray,
+        boxes: np.ndarray,
+    ) -> List[List[dict]]:
+        detections: List[List[dict]] = [[] for _ in range(batch_size)]
+        names = self.label_names
+        for b, label, score, bbox in zip(
+            batch_idx.tolist(), labels.tolist(), scores.tolist(), boxes.astype(np.int64).tolist()
+        ):
+            detections[b].append({"label": names[label], "score": score, "bbox": bbox})
+        return detections
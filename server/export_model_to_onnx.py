@@ -4,17 +4,98 @@ Export YOLOS model to ONNX format for faster inference.
 Run this script once to create the ONNX model file:
     python export_model_to_onnx.py
 
-This creates 'yolos_fashionpedia.onnx' in the server directory.
+This creates 'yolos_fashionpedia.onnx' in the server directory, plus a
+'yolos_fashionpedia.json' sidecar with the label map and preprocessing
+settings so the server can run ONNX inference without torch/transformers.
+
+With --fused-postprocess the softmax, "no object" removal, box conversion
+and score threshold are appended to the graph, which then returns compact
+detection rows instead of the full logits/pred_boxes tensors:
+    python export_model_to_onnx.py --fused-postprocess
+
+With --quantize a dynamically quantized INT8 copy is also written as
+'yolos_fashionpedia_int8.onnx' (load it with ONNX_MODEL_VARIANT=int8):
+    python export_model_to_onnx.py --quantize
 """
 
+import argparse
+import json
 import torch
 from transformers import YolosForObjectDetection, AutoImageProcessor
 from PIL import Image
 import numpy as np
 
+from onnx_engine import FUSED_OUTPUT_NAME, ModelMetadata, metadata_path_for, variant_model_path
+
 MODEL_ID = "valentinafeve/yolos-fashionpedia"
 
-def export_to_onnx():
+
+class YolosWithPostprocess(torch.nn.Module):
+    """
+    YOLOS followed by the post-processing the server used to run in Python.
+
+    Inputs:
+        pixel_values: (batch, 3, H, W) normalised images
+        image_size: (batch, 2) float (height, width) to scale boxes to
+        score_threshold: (batch,) float; queries scoring <= this are dropped
+
+    Output:
+        detections: (num_kept, 7) float rows of
+            (batch_index, label_id, score, x1, y1, x2, y2)
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values, image_size, score_threshold):
+        outputs = self.model(pixel_values=pixel_values)
+
+        # Softmax over classes, drop the trailing "no object" class
+        probs = outputs.logits.softmax(-1)[..., :-1]
+        scores, labels = probs.max(-1)
+
+        cx, cy, w, h = outputs.pred_boxes.unbind(-1)
+        boxes = torch.stack([cx - 0.5 * w, cy - 0.5 * h, cx + 0.5 * w, cy + 0.5 * h], dim=-1)
+        img_h, img_w = image_size.unbind(-1)
+        boxes = boxes * torch.stack([img_w, img_h, img_w, img_h], dim=-1)[:, None, :]
+
+        batch_index = torch.arange(scores.shape[0], device=scores.device)[:, None].expand_as(scores)
+        rows = torch.cat(
+            [batch_index[..., None].to(scores.dtype), labels[..., None].to(scores.dtype), scores[..., None], boxes],
+            dim=-1,
+        )
+        return rows[scores > score_threshold[:, None]]
+
+
+def quantize_model(fp32_path, int8_path):
+    """
+    Dynamic INT8 quantization: MatMul/Gemm weights are stored as int8 and
+    activations are quantized on the fly, so no calibration data is needed.
+    The patch-embedding conv and the heads' non-linearities stay fp32.
+    """
+    import tempfile
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Shape inference + graph optimisation first lets more MatMuls be quantized
+        source_path = f"{tmp_dir}/preprocessed.onnx"
+        try:
+            quant_pre_process(str(fp32_path), source_path)
+        except Exception as e:
+            print(f"[ONNX EXPORT] Quantization pre-processing failed ({e}), quantizing the raw graph")
+            source_path = str(fp32_path)
+
+        quantize_dynamic(
+            source_path,
+            str(int8_path),
+            op_types_to_quantize=['MatMul', 'Gemm'],
+            weight_type=QuantType.QInt8,
+        )
+
+
+def export_to_onnx(output_path="yolos_fashionpedia.onnx", fused_postprocess=False, quantize=False):
     print("[ONNX EXPORT] Loading PyTorch model...")
     model = YolosForObjectDetection.from_pretrained(MODEL_ID)
     model.eval()
@@ -25,38 +106,98 @@ def export_to_onnx():
     # Create a dummy image for tracing
     dummy_image = Image.new('RGB', (800, 600), color='white')
     inputs = processor(images=dummy_image, return_tensors="pt")
+    pixel_values = inputs['pixel_values']
 
-    print("[ONNX EXPORT] Exporting to ONNX format...")
-    torch.onnx.export(
-        model,
-        (inputs['pixel_values'],),
-        "yolos_fashionpedia.onnx",
-        input_names=['pixel_values'],
-        output_names=['logits', 'pred_boxes'],
-        dynamic_axes={
-            'pixel_values': {0: 'batch_size', 2: 'height', 3: 'width'},
-            'logits': {0: 'batch_size'},
-            'pred_boxes': {0: 'batch_size'}
-        },
-        opset_version=14,
-        do_constant_folding=True
-    )
+    if fused_postprocess:
+        print("[ONNX EXPORT] Exporting to ONNX format (fused post-processing)...")
+        image_size = torch.tensor([[600.0, 800.0]])
+        score_threshold = torch.tensor([0.0])
+        torch.onnx.export(
+            YolosWithPostprocess(model).eval(),
+            (pixel_values, image_size, score_threshold),
+            output_path,
+            input_names=['pixel_values', 'image_size', 'score_threshold'],
+            output_names=[FUSED_OUTPUT_NAME],
+            dynamic_axes={
+                'pixel_values': {0: 'batch_size', 2: 'height', 3: 'width'},
+                'image_size': {0: 'batch_size'},
+                'score_threshold': {0: 'batch_size'},
+                FUSED_OUTPUT_NAME: {0: 'num_detections'}
+            },
+            opset_version=14,
+            do_constant_folding=True,
+            dynamo=False
+        )
+    else:
+        print("[ONNX EXPORT] Exporting to ONNX format...")
+        torch.onnx.export(
+            model,
+            (pixel_values,),
+            output_path,
+            input_names=['pixel_values'],
+            output_names=['logits', 'pred_boxes'],
+            dynamic_axes={
+                'pixel_values': {0: 'batch_size', 2: 'height', 3: 'width'},
+                'logits': {0: 'batch_size'},
+                'pred_boxes': {0: 'batch_size'}
+            },
+            opset_version=14,
+            do_constant_folding=True
+        )
+
+    print(f"[ONNX EXPORT] Export complete: {output_path}")
+
+    metadata = ModelMetadata.from_configs(model.config.to_dict(), processor.to_dict())
+    metadata.extra["fused_postprocess"] = fused_postprocess
+    metadata_path = metadata_path_for(output_path)
+    with open(metadata_path, "w", encoding="utf-8") as f:
+        json.dump(metadata.to_dict(), f, indent=2)
+    print(f"[ONNX EXPORT] Metadata written: {metadata_path}")
 
-    print("[ONNX EXPORT] Export complete: yolos_fashionpedia.onnx")
-    print("[ONNX EXPORT] Verifying ONNX model...")
+    model_paths = [output_path]
+    if quantize:
+        int8_path = variant_model_path(output_path, "int8")
+        print("[ONNX EXPORT] Quantizing to INT8 (dynamic)...")
+        quantize_model(output_path, int8_path)
+        metadata.extra["quantization"] = "dynamic-int8"
+        with open(metadata_path_for(int8_path), "w", encoding="utf-8") as f:
+            json.dump(metadata.to_dict(), f, indent=2)
+        print(f"[ONNX EXPORT] Quantized model written: {int8_path}")
+        model_paths.append(str(int8_path))
 
-    # Verify the exported model works
+    # Verify the exported model(s) work
     import onnxruntime as ort
 
-    session = ort.InferenceSession("yolos_fashionpedia.onnx", providers=['CPUExecutionProvider'])
+    for path in model_paths:
+        print(f"[ONNX EXPORT] Verifying {path}...")
+        session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
 
-    # Test inference
-    onnx_inputs = {session.get_inputs()[0].name: inputs['pixel_values'].numpy()}
-    outputs = session.run(None, onnx_inputs)
+        # Test inference
+        onnx_inputs = {session.get_inputs()[0].name: pixel_values.numpy()}
+        if fused_postprocess:
+            onnx_inputs['image_size'] = image_size.numpy()
+            onnx_inputs['score_threshold'] = score_threshold.numpy()
+        outputs = session.run(None, onnx_inputs)
 
-    print(f"[ONNX EXPORT] Verification successful!")
-    print(f"[ONNX EXPORT] Output shapes: logits={outputs[0].shape}, pred_boxes={outputs[1].shape}")
+        print(f"[ONNX EXPORT] Verification successful!")
+        if fused_postprocess:
+            print(f"[ONNX EXPORT] Output shape: {FUSED_OUTPUT_NAME}={outputs[0].shape}")
+        else:
+            print(f"[ONNX EXPORT] Output shapes: logits={outputs[0].shape}, pred_boxes={outputs[1].shape}")
     print(f"[ONNX EXPORT] Model ready to use!")
 
 if __name__ == "__main__":
-    export_to_onnx()
+    parser = argparse.ArgumentParser(description="Export the YOLOS fashion model to ONNX")
+    parser.add_argument("--output", default="yolos_fashionpedia.onnx", help="ONNX file to write")
+    parser.add_argument(
+        "--fused-postprocess",
+        action="store_true",
+        help="Append softmax/box conversion/score threshold to the graph and output compact detection rows",
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Also write a dynamically quantized INT8 model (<output>_int8.onnx)",
+    )
+    args = parser.parse_args()
+    export_to_onnx(args.output, fused_postprocess=args.fused_postprocess, quantize=args.quantize)
@@ -5,24 +5,24 @@ import json
 import base64
 import time
 import gc
-import torch
+import threading
 import requests
 import re
 import uuid
 import numpy as np
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, List, Set, Union
+from typing import Optional, List, Set, Tuple, Union
 from urllib.parse import urlparse
-from concurrent.futures import ThreadPoolExecutor, as_completed, wait  # parallel workloads
+from concurrent.futures import ThreadPoolExecutor, wait  # parallel workloads
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
 from pydantic import BaseModel, Field, model_validator
-from PIL import Image, ImageDraw, ImageEnhance, ImageOps, ImageStat
-from transformers import AutoImageProcessor, YolosForObjectDetection
+from PIL import Image, ImageDraw, ImageEnhance, ImageOps
 import cloudinary
 import cloudinary.uploader
 
@@ -34,6 +34,36 @@ load_dotenv(dotenv_path=Path(__file__).parent.parent / '.env')
 load_dotenv(dotenv_path=Path(__file__).parent / '.env', override=True)
 
 from supabase_client import supabase_manager
+from inference_batcher import InferenceBatcher
+from inference_backends import (
+    BackendSettings,
+    InferenceBackend,
+    RunPodBackend,
+    cached_selection,
+    create_backend,
+    register_backend,
+    select_backend_isolated,
+)
+from inference_router import CircuitBreaker, InferenceRouter
+from inference_service import InferenceClient
+from perf_stats import current_rss_mb
+from onnx_engine import get_resize_size, variant_model_path
+from warmup import WarmupTracker
+from image_codec import (
+    JpegBudget,
+    SourceImage,
+    decode_oriented,
+    encode_jpeg_base64_within,
+    encode_jpeg_budget,
+    pixels_of,
+    resize_within,
+)
+from detection_cache import DetectionCache, SqliteStore
+from image_stats import luma_stats
+from hash_utils import NearDuplicateIndex, hash_bytes, hash_pixels, hash_to_hex, phash
+from upload_cache import UploadCache, content_public_id
+from upload_client import UploadClient
+from crop_storage import CropStorage, LocalStorage, StorageSettings, check_local_settings, create_storage
 
 # Cache lookup control (disable cache hits but still store history)
 CACHE_RESULTS = os.getenv("CACHE_RESULTS", "").lower() in {"1", "true", "yes"}
@@ -41,12 +71,139 @@ CACHE_RESULTS = os.getenv("CACHE_RESULTS", "").lower() in {"1", "true", "yes"}
 # ONNX feature flag - set USE_ONNX=true to enable ONNX inference (2-3x faster)
 # Set USE_ONNX=false or remove to use standard PyTorch (safe default)
 USE_ONNX = os.getenv("USE_ONNX", "false").lower() in {"1", "true", "yes"}
+# Which exported model to load in ONNX mode: "fp32" (yolos_fashionpedia.onnx) or
+# "int8" (dynamically quantized, from `export_model_to_onnx.py --quantize`)
+ONNX_MODEL_VARIANT = os.getenv("ONNX_MODEL_VARIANT", "fp32").lower()
+
+# Shared inference service - set INFERENCE_SOCKET to a Unix socket path to run the
+# model once in a separate process (inference_service.py, started by gunicorn.conf.py)
+# that batches across all workers; workers fall back to in-process inference if it
+# fails or takes longer than INFERENCE_SOCKET_TIMEOUT seconds
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET", "")
+INFERENCE_SOCKET_TIMEOUT = float(os.getenv("INFERENCE_SOCKET_TIMEOUT", 10))
+
+# Inference backend (inference_backends.py) - "pytorch", "onnx", "onnx-int8" or "auto":
+# time each of AUTO_CANDIDATES on this host at startup and keep the fastest one whose
+# detections agree with pytorch's (>= AUTO_MIN_AGREEMENT); the choice is cached in
+# AUTO_CACHE per host + model files. Unset = from USE_ONNX / ONNX_MODEL_VARIANT.
+# The PyTorch stack (~1s import, hundreds of MB RSS) is only imported by the pytorch backend
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "").lower() or (
+    ("onnx-int8" if ONNX_MODEL_VARIANT == "int8" else "onnx") if USE_ONNX else "pytorch"
+)
+INFERENCE_AUTO_CANDIDATES = os.getenv("INFERENCE_AUTO_CANDIDATES", "pytorch,onnx,onnx-int8")
+INFERENCE_AUTO_MIN_AGREEMENT = float(os.getenv("INFERENCE_AUTO_MIN_AGREEMENT", 0.9))
+INFERENCE_AUTO_CACHE = os.getenv("INFERENCE_AUTO_CACHE", "/tmp/snaplook-backend-choice.json")
+INFERENCE_AUTO_SAMPLES = os.getenv("INFERENCE_AUTO_SAMPLES", "")  # folder of photos; default synthetic
 
 # RunPod GPU feature flag - set USE_RUNPOD=true to use GPU serverless (10x faster)
 # Requires RUNPOD_API_KEY and RUNPOD_ENDPOINT_ID environment variables
 USE_RUNPOD = os.getenv("USE_RUNPOD", "false").lower() in {"1", "true", "yes"}
 RUNPOD_API_KEY = os.getenv("RUNPOD_API_KEY", "")
 RUNPOD_ENDPOINT_ID = os.getenv("RUNPOD_ENDPOINT_ID", "")
+# RunPod job batching - set RUNPOD_BATCHING=true to coalesce images from concurrent
+# requests into one RunPod job (up to MAX_SIZE images or MAX_WAIT_MS)
+RUNPOD_BATCHING = os.getenv("RUNPOD_BATCHING", "false").lower() in {"1", "true", "yes"}
+RUNPOD_BATCH_MAX_SIZE = int(os.getenv("RUNPOD_BATCH_MAX_SIZE", 8))
+RUNPOD_BATCH_MAX_WAIT_MS = float(os.getenv("RUNPOD_BATCH_MAX_WAIT_MS", 30))
+# RunPod payloads - images are sent downsized to the detection resolution as a JPEG
+# of at most MAX_BYTES (quality chosen to fit); with SEND_IMAGE_URL=true an image
+# that already has a public URL is sent as that URL and the handler fetches it
+RUNPOD_IMAGE_MAX_BYTES = int(os.getenv("RUNPOD_IMAGE_MAX_BYTES", 150_000))
+RUNPOD_SEND_IMAGE_URL = os.getenv("RUNPOD_SEND_IMAGE_URL", "false").lower() in {"1", "true", "yes"}
+RUNPOD_BASE_URL = os.getenv("RUNPOD_BASE_URL", "https://api.runpod.ai/v2").rstrip("/")
+RUNPOD_TIMEOUT_SECONDS = float(os.getenv("RUNPOD_TIMEOUT_SECONDS", 60))
+# RunPod circuit breaker - after FAILURES consecutive failed calls (or calls slower
+# than SLOW_CALL_SECONDS) detection stays local for RESET_SECONDS, then one probe
+# call decides whether RunPod is back
+RUNPOD_BREAKER_FAILURES = int(os.getenv("RUNPOD_BREAKER_FAILURES", 3))
+RUNPOD_SLOW_CALL_SECONDS = float(os.getenv("RUNPOD_SLOW_CALL_SECONDS", 20))
+RUNPOD_BREAKER_RESET_SECONDS = float(os.getenv("RUNPOD_BREAKER_RESET_SECONDS", 30))
+# RunPod hedging - set RUNPOD_HEDGE=true to also start local inference when RunPod
+# has not answered within its recent HEDGE_PERCENTILE latency (never sooner than
+# HEDGE_MIN_MS); the first result wins. Costs local CPU on slow calls.
+RUNPOD_HEDGE = os.getenv("RUNPOD_HEDGE", "false").lower() in {"1", "true", "yes"}
+RUNPOD_HEDGE_PERCENTILE = float(os.getenv("RUNPOD_HEDGE_PERCENTILE", 95))
+RUNPOD_HEDGE_MIN_MS = float(os.getenv("RUNPOD_HEDGE_MIN_MS", 1000))
+
+# Cross-request micro-batching - set INFERENCE_BATCHING=true to group concurrent
+# detection requests into one forward pass (up to MAX_SIZE images or MAX_WAIT_MS).
+# Only images with the same resized shape share a pass, so none is zero-padded
+# to another's size (YOLOS takes no pixel mask: padding would change the boxes)
+INFERENCE_BATCHING = os.getenv("INFERENCE_BATCHING", "false").lower() in {"1", "true", "yes"}
+INFERENCE_BATCH_MAX_SIZE = int(os.getenv("INFERENCE_BATCH_MAX_SIZE", 4))
+INFERENCE_BATCH_MAX_WAIT_MS = float(os.getenv("INFERENCE_BATCH_MAX_WAIT_MS", 15))
+
+# Low-light fused pass - set LOW_LIGHT_FUSED_PASS=true to run the original and
+# enhanced images as a single batch of 2 instead of two sequential passes
+LOW_LIGHT_FUSED_PASS = os.getenv("LOW_LIGHT_FUSED_PASS", "false").lower() in {"1", "true", "yes"}
+
+# Detection result cache - set DETECTION_CACHE=true to reuse run_detection results
+# for images seen in the last TTL_SECONDS (keyed by a hash of the decoded pixels plus
+# threshold / expand_ratio / max_crops), up to SIZE images per worker. With
+# DETECTION_CACHE_PATH set, results also go to a sqlite file shared by every worker
+# on the host. A hit skips inference and filtering; crops are still cut from the
+# request's own image
+DETECTION_CACHE = os.getenv("DETECTION_CACHE", "false").lower() in {"1", "true", "yes"}
+DETECTION_CACHE_SIZE = int(os.getenv("DETECTION_CACHE_SIZE", 256))
+DETECTION_CACHE_TTL_SECONDS = float(os.getenv("DETECTION_CACHE_TTL_SECONDS", 3600))
+DETECTION_CACHE_PATH = os.getenv("DETECTION_CACHE_PATH", "")
+
+# Upload dedupe - set CLOUDINARY_UPLOAD_DEDUPE=true to name Cloudinary uploads by a
+# hash of their JPEG bytes (so a repeat maps onto the same asset) and remember
+# hash -> URL for TTL_SECONDS, up to SIZE uploads per worker: a repeated full image
+# or crop (client retries, reshared posts) skips the upload. With UPLOAD_CACHE_PATH
+# set, the URLs go to a sqlite file shared by every worker on the host
+CLOUDINARY_UPLOAD_DEDUPE = os.getenv("CLOUDINARY_UPLOAD_DEDUPE", "false").lower() in {"1", "true", "yes"}
+UPLOAD_CACHE_SIZE = int(os.getenv("UPLOAD_CACHE_SIZE", 2048))
+UPLOAD_CACHE_TTL_SECONDS = float(os.getenv("UPLOAD_CACHE_TTL_SECONDS", 86400))
+UPLOAD_CACHE_PATH = os.getenv("UPLOAD_CACHE_PATH", "")
+
+# Near-duplicate cache - set NEAR_DUPLICATE_CACHE=true (after applying the image_phash
+# migration) to store a perceptual hash with every image_cache row and index them in
+# memory during warm-up. With CACHE_RESULTS, an image within MAX_DISTANCE bits (of 64)
+# of a cached one in the same country reuses its results
+NEAR_DUPLICATE_CACHE = os.getenv("NEAR_DUPLICATE_CACHE", "false").lower() in {"1", "true", "yes"}
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", 6))
+
+# ONNX Runtime session tuning. Threads default to this worker's share of the
+# box: available CPUs (affinity / cgroup quota) // WEB_CONCURRENCY workers
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", 0))  # 0 = per-worker budget
+ONNX_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", 1))
+ONNX_ALLOW_SPINNING = os.getenv("ONNX_ALLOW_SPINNING", "false").lower() in {"1", "true", "yes"}
+ONNX_GRAPH_OPTIMIZATION = os.getenv("ONNX_GRAPH_OPTIMIZATION", "all").lower()  # disable|basic|extended|all
+ONNX_CACHE_OPTIMIZED_MODEL = os.getenv("ONNX_CACHE_OPTIMIZED_MODEL", "true").lower() in {"1", "true", "yes"}
+ONNX_CPU_MEM_ARENA = os.getenv("ONNX_CPU_MEM_ARENA", "true").lower() in {"1", "true", "yes"}
+ONNX_MEM_PATTERN = os.getenv("ONNX_MEM_PATTERN", "false").lower() in {"1", "true", "yes"}
+
+# Model preloading - set PRELOAD_MODEL=true to load the model once in the gunicorn
+# master (gunicorn.conf.py turns on preload_app) so workers share it copy-on-write
+PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "false").lower() in {"1", "true", "yes"}
+
+# Detection resolution - images are downsized once (fast reduce + bilinear) so
+# the edges fit these limits before detection; boxes are mapped back and crops are
+# still cut from the full-resolution image. 800/1333 is the model's native size
+DETECTION_SHORTEST_EDGE = int(os.getenv("DETECTION_SHORTEST_EDGE", 800))
+DETECTION_LONGEST_EDGE = int(os.getenv("DETECTION_LONGEST_EDGE", 1333))
+
+# Draft decode - set JPEG_DRAFT_DECODE=true to decode large uploaded JPEGs at the
+# smallest 1/2, 1/4 or 1/8 DCT scale that still covers the detection resolution;
+# the full-resolution decode is deferred until a crop is cut (and skipped entirely
+# when nothing is cropped). Boxes stay in full-resolution coordinates
+JPEG_DRAFT_DECODE = os.getenv("JPEG_DRAFT_DECODE", "false").lower() in {"1", "true", "yes"}
+
+# Crop by URL - upload the full image once and address each garment as a
+# Cloudinary crop transformation of it, instead of uploading every crop
+CLOUDINARY_CROP_BY_URL = os.getenv("CLOUDINARY_CROP_BY_URL", "false").lower() in {"1", "true", "yes"}
+
+# Startup warm-up - each worker loads the model, runs dummy detections at these
+# WxH sizes and pre-opens outbound connections before /ready reports ready
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in {"1", "true", "yes"}
+WARMUP_IMAGE_SIZES = os.getenv("WARMUP_IMAGE_SIZES", "1080x1440,1440x1080")
+# How long warm-up waits for the shared inference service (INFERENCE_SOCKET).
+# Warm-up runs before the worker serves, so this has to stay below gunicorn's
+# --timeout (120 in render.yaml) or the master kills the worker first
+WARMUP_SERVICE_WAIT_SECONDS = float(os.getenv("WARMUP_SERVICE_WAIT_SECONDS", 90))
 
 # --- Logging control ---
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -92,6 +249,58 @@ CLOUDINARY_CROP_MAX_DIM = int(os.getenv("CLOUDINARY_CROP_MAX_DIM", 768))
 CLOUDINARY_FULL_MAX_DIM = int(os.getenv("CLOUDINARY_FULL_MAX_DIM", 1600))
 CLOUDINARY_CROP_QUALITY = int(os.getenv("CLOUDINARY_CROP_QUALITY", 72))
 CLOUDINARY_FULL_QUALITY = int(os.getenv("CLOUDINARY_FULL_QUALITY", 80))
+# Byte-budget uploads - set CLOUDINARY_BYTE_BUDGET=true to encode crops / full images at
+# the highest quality (5-point steps from the QUALITY above down to 50) that fits
+# CROP_MAX_BYTES / FULL_MAX_BYTES, shrinking the image when even quality 50 does not.
+# Downsizing uses a box reduce + bilinear instead of LANCZOS, and Huffman tables are
+# optimised (CLOUDINARY_JPEG_PROGRESSIVE=true also writes progressive scans)
+CLOUDINARY_BYTE_BUDGET = os.getenv("CLOUDINARY_BYTE_BUDGET", "false").lower() in {"1", "true", "yes"}
+CLOUDINARY_CROP_MAX_BYTES = int(os.getenv("CLOUDINARY_CROP_MAX_BYTES", 60_000))
+CLOUDINARY_FULL_MAX_BYTES = int(os.getenv("CLOUDINARY_FULL_MAX_BYTES", 200_000))
+CLOUDINARY_JPEG_PROGRESSIVE = os.getenv("CLOUDINARY_JPEG_PROGRESSIVE", "false").lower() in {"1", "true", "yes"}
+CLOUDINARY_CROP_BUDGET = JpegBudget(
+    max_bytes=CLOUDINARY_CROP_MAX_BYTES,
+    max_dim=CLOUDINARY_CROP_MAX_DIM,
+    max_quality=max(50, min(95, CLOUDINARY_CROP_QUALITY)),
+    progressive=CLOUDINARY_JPEG_PROGRESSIVE,
+)
+CLOUDINARY_FULL_BUDGET = JpegBudget(
+    max_bytes=CLOUDINARY_FULL_MAX_BYTES,
+    max_dim=CLOUDINARY_FULL_MAX_DIM,
+    max_quality=max(50, min(95, CLOUDINARY_FULL_QUALITY)),
+    progressive=CLOUDINARY_JPEG_PROGRESSIVE,
+)
+# Uploads run on one pool of UPLOAD_WORKERS threads per worker process, over as many
+# keep-alive connections, with up to UPLOAD_ATTEMPTS attempts of at most UPLOAD_TIMEOUT
+# seconds. Retries back off with jitter and stop once a useful attempt no longer fits
+# in the UPLOAD_DEADLINE_SECONDS a request allows for its uploads
+CLOUDINARY_UPLOAD_WORKERS = int(os.getenv("CLOUDINARY_UPLOAD_WORKERS", 8))
+CLOUDINARY_UPLOAD_ATTEMPTS = int(os.getenv("CLOUDINARY_UPLOAD_ATTEMPTS", 3))
+CLOUDINARY_UPLOAD_TIMEOUT = float(os.getenv("CLOUDINARY_UPLOAD_TIMEOUT", 8))
+CLOUDINARY_UPLOAD_DEADLINE_SECONDS = float(os.getenv("CLOUDINARY_UPLOAD_DEADLINE_SECONDS", 25))
+
+# Crop storage (crop_storage.py) - where the full images and crops go:
+#   cloudinary  the Cloudinary CDN (default)
+#   local       this server's own GET /crops/<id>.jpg route, with URLs signed with
+#               CROP_STORAGE_SECRET that expire after CROP_STORAGE_TTL_SECONDS.
+#               CROP_STORAGE_BASE_URL (required) must be reachable by the search API.
+#               Files go to CROP_STORAGE_DIR (shared by the workers of a host), or
+#               stay in memory when it is empty. With WEB_CONCURRENCY > 1 both the
+#               directory and the secret are required; the worker refuses to start
+#               uploading otherwise
+#   faulty      CROP_STORAGE_FAULT_INNER with injected latency, errors and timeouts,
+#               for load tests that must not hit the CDN
+# Upload latency in /metrics is labelled with the storage in use
+CROP_STORAGE = os.getenv("CROP_STORAGE", "cloudinary").lower()
+CROP_STORAGE_BASE_URL = os.getenv("CROP_STORAGE_BASE_URL", "")
+CROP_STORAGE_SECRET = os.getenv("CROP_STORAGE_SECRET", "")
+CROP_STORAGE_TTL_SECONDS = float(os.getenv("CROP_STORAGE_TTL_SECONDS", 3600))
+CROP_STORAGE_DIR = os.getenv("CROP_STORAGE_DIR", "")
+CROP_STORAGE_MAX_MB = float(os.getenv("CROP_STORAGE_MAX_MB", 512))
+CROP_STORAGE_FAULT_INNER = os.getenv("CROP_STORAGE_FAULT_INNER", "local").lower()
+CROP_STORAGE_FAULT_LATENCY_MS = float(os.getenv("CROP_STORAGE_FAULT_LATENCY_MS", 0))
+CROP_STORAGE_FAULT_ERROR_RATE = float(os.getenv("CROP_STORAGE_FAULT_ERROR_RATE", 0))
+CROP_STORAGE_FAULT_TIMEOUT_RATE = float(os.getenv("CROP_STORAGE_FAULT_TIMEOUT_RATE", 0))
 
 # Debug crop saving
 # Cloudinary configuration
@@ -106,6 +315,12 @@ cloudinary.config(
 SEARCHAPI_KEY = os.getenv("SEARCHAPI_KEY", "")
 SEARCHAPI_LOCATION = os.getenv("SEARCHAPI_LOCATION", "United States")  # Location for results
 SEARCHAPI_DEVICE = os.getenv("SEARCHAPI_DEVICE", "mobile")  # mobile or desktop
+SEARCHAPI_URL = "https://www.searchapi.io/api/v1/search"
+
+# Shared outbound HTTP session: keeps TLS connections to SearchAPI / RunPod /
+# image hosts alive between calls (up to 8 parallel searches per request)
+http_session = requests.Session()
+http_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=8))
 
 # Tiny/irrelevant crop guard (pixels)
 MIN_CROP_W = 80
@@ -491,7 +706,14 @@ GARMENT_KEYWORDS = [
 STYLE_HINT_KEYWORDS = ['silk', 'satin', 'lace', 'bias', 'midi', 'maxi', 'slip', 'trim']
 
 # === FASTAPI SETUP ===
-app = FastAPI(title="Fashion Detector API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in every worker once it has forked, before it accepts requests (see start_warmup)
+    start_warmup()
+    yield
+
+
+app = FastAPI(title="Fashion Detector API", lifespan=lifespan)
 
 # Import and mount caching routes
 try:
@@ -526,52 +748,175 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     return JSONResponse(status_code=422, content={"detail": exc.errors()})
 
 # === MODELS ===
-# Delay loading - load on first use to avoid Gunicorn fork issues
-processor = None
-model = None
-model_config = None
-onnx_session = None
+# The local inference backend, loaded on first use in each worker, or once in the
+# gunicorn master with PRELOAD_MODEL=true (see preload_model / reinit_after_fork)
+local_backend: Optional[InferenceBackend] = None
+backend_selection: Optional[dict] = None  # INFERENCE_BACKEND=auto report
+_model_lock = threading.Lock()
+
+ONNX_MODEL_PATH = variant_model_path(Path(__file__).parent / "yolos_fashionpedia.onnx", ONNX_MODEL_VARIANT)
+
+def onnx_session_config():
+    """Session settings from the ONNX_* environment variables."""
+    from onnx_engine import SessionConfig, available_cpus, per_worker_threads
+
+    cpus = available_cpus()
+    intra_op_threads = ONNX_INTRA_OP_THREADS or per_worker_threads(WEB_CONCURRENCY, cpus)
+    print(
+        f"[MODEL] Thread budget: {cpus} CPUs / {WEB_CONCURRENCY} workers "
+        f"-> intra_op={intra_op_threads}, inter_op={ONNX_INTER_OP_THREADS}"
+    )
+    return SessionConfig(
+        intra_op_threads=intra_op_threads,
+        inter_op_threads=ONNX_INTER_OP_THREADS,
+        allow_spinning=ONNX_ALLOW_SPINNING,
+        graph_optimization=ONNX_GRAPH_OPTIMIZATION,
+        cache_optimized_model=ONNX_CACHE_OPTIMIZED_MODEL,
+        cpu_mem_arena=ONNX_CPU_MEM_ARENA,
+        mem_pattern=ONNX_MEM_PATTERN,
+    )
+
 
-def ensure_model_loaded():
+def backend_settings(backend_names: List[str]) -> BackendSettings:
+    """Model settings shared by every local backend (ONNX session config only if needed)."""
+    base_path = Path(__file__).parent / "yolos_fashionpedia.onnx"
+    onnx_paths = {"onnx": variant_model_path(base_path, "fp32"), "onnx-int8": variant_model_path(base_path, "int8")}
+    # ONNX_MODEL_PATH (overridable, e.g. by benchmarks) is the ONNX_MODEL_VARIANT model
+    onnx_paths["onnx-int8" if ONNX_MODEL_VARIANT == "int8" else "onnx"] = ONNX_MODEL_PATH
+    return BackendSettings(
+        model_id=MODEL_ID,
+        shortest_edge=DETECTION_SHORTEST_EDGE,
+        longest_edge=DETECTION_LONGEST_EDGE,
+        allowed_labels=frozenset(MAJOR_GARMENTS),
+        category_thresholds=dict(CATEGORY_THRESHOLDS),
+        onnx_paths=onnx_paths,
+        session_config=onnx_session_config() if any(name.startswith("onnx") for name in backend_names) else None,
+    )
+
+
+def auto_sample_images() -> List[Image.Image]:
+    """Images for the INFERENCE_BACKEND=auto self-benchmark, at detection resolution."""
+    if INFERENCE_AUTO_SAMPLES:
+        paths = sorted(p for p in Path(INFERENCE_AUTO_SAMPLES).iterdir() if p.suffix.lower() in {".jpg", ".jpeg", ".png", ".webp"})
+        images = [ImageOps.exif_transpose(Image.open(p)).convert("RGB") for p in paths[:4]]
+    else:
+        images = [warmup_image(width, height) for width, height in parse_warmup_sizes(WARMUP_IMAGE_SIZES)]
+    return [resize_for_detection(image) for image in images]
+
+
+def select_local_backend() -> str:
+    """INFERENCE_BACKEND=auto: benchmark the candidates once per host (cached) and pick one."""
+    global backend_selection
+
+    candidates = [name.strip() for name in INFERENCE_AUTO_CANDIDATES.split(",") if name.strip()]
+    settings = backend_settings(candidates)
+    images = auto_sample_images()
+    key = {
+        "candidates": candidates,
+        "cpus": os.cpu_count(),
+        "resolution": [DETECTION_SHORTEST_EDGE, DETECTION_LONGEST_EDGE],
+        "samples": [list(image.size) for image in images],
+        "min_agreement": INFERENCE_AUTO_MIN_AGREEMENT,
+        "models": {
+            name: [path.stat().st_size, int(path.stat().st_mtime)] if path.exists() else None
+            for name, path in settings.onnx_paths.items()
+        },
+    }
+    print(f"[MODEL] INFERENCE_BACKEND=auto: self-benchmarking {', '.join(candidates)} in PID {os.getpid()}...")
+    report = cached_selection(
+        Path(INFERENCE_AUTO_CACHE),
+        key,
+        lambda: select_backend_isolated(settings, candidates, images, min_agreement=INFERENCE_AUTO_MIN_AGREEMENT),
+    )
+    for name, result in report["candidates"].items():
+        if "error" in result:
+            print(f"[MODEL]   {name}: unavailable ({result['error']})")
+        else:
+            print(
+                f"[MODEL]   {name}: {result['latency_ms']:.0f}ms/image, agreement {result['agreement']:.2f}"
+                f"{'' if result['ok'] else ' (failed parity)'}"
+            )
+    print(f"[MODEL] Selected {report['selected']}{' (cached)' if report['cached'] else ''}")
+    backend_selection = report
+    return report["selected"]
+
+
+def create_local_backend() -> InferenceBackend:
+    name = select_local_backend() if INFERENCE_BACKEND == "auto" else INFERENCE_BACKEND
+    return create_backend(name, backend_settings([name]))
+
+
+def ensure_model_loaded() -> InferenceBackend:
     """
-    Lazy load model on first use in each worker process.
-    Loads either PyTorch or ONNX based on USE_ONNX flag.
+    Lazy load the local backend on first use in each worker process and
+    return it. Which one is set by INFERENCE_BACKEND (USE_ONNX for older
+    configs). ONNX backends are torch-free: preprocessing and post-processing
+    run in numpy and metadata comes from the export sidecar JSON (or the hub
+    configs).
 
-    To switch back to PyTorch: Set USE_ONNX=false in environment
+    To switch back to PyTorch: Set INFERENCE_BACKEND=pytorch (or USE_ONNX=false)
     """
-    global processor, model, model_config, onnx_session
-
-    if USE_ONNX:
-        # ONNX MODE - 2-3x faster inference
-        if onnx_session is None or processor is None:
-            print(f"[MODEL] Loading ONNX model in PID {os.getpid()}...")
-            import onnxruntime as ort
-            from transformers import AutoConfig
-
-            processor = AutoImageProcessor.from_pretrained(MODEL_ID)
-            model_config = AutoConfig.from_pretrained(MODEL_ID)
-
-            onnx_path = Path(__file__).parent / "yolos_fashionpedia.onnx"
-            if not onnx_path.exists():
-                raise FileNotFoundError(
-                    f"ONNX model not found at {onnx_path}. "
-                    f"Run 'python export_model_to_onnx.py' first, or set USE_ONNX=false"
-                )
+    global local_backend
+
+    # The warm-up thread and the first requests may race to load the model
+    with _model_lock:
+        if local_backend is None:
+            local_backend = create_local_backend()
+        if not local_backend.loaded:
+            start = time.time()
+            print(f"[MODEL] Loading {local_backend.name} backend in PID {os.getpid()}...")
+            local_backend.load()
+            print(f"[MODEL] {local_backend.name} ready in PID {os.getpid()} in {time.time() - start:.2f}s")
+            print(f"[MODEL] Backend: {json.dumps(local_backend.info())}")
+    return local_backend
+
+
+def preload_model():
+    """
+    Load the model in the gunicorn master before workers fork (PRELOAD_MODEL=true).
+
+    Only fork-safe state is created here (InferenceBackend.preload) and then
+    treated as read-only: PyTorch weights are shared copy-on-write by every
+    worker, ONNX sessions are built per worker in reinit_after_fork().
+    """
+    global local_backend
+
+    if INFERENCE_SOCKET:
+        print("[MODEL] INFERENCE_SOCKET set - the inference service holds the model, nothing to preload")
+        return
+
+    start = time.time()
+    with _model_lock:
+        local_backend = create_local_backend()
+        local_backend.preload()
+
+    # Keep the GC from touching (and so un-sharing) everything loaded so far
+    gc.collect()
+    gc.freeze()
+    print(f"[MODEL] Preloaded {local_backend.name} in master PID {os.getpid()} in {time.time() - start:.2f}s")
 
-            onnx_session = ort.InferenceSession(
-                str(onnx_path),
-                providers=['CPUExecutionProvider']
-            )
-            print(f"[MODEL] ONNX ready in PID {os.getpid()}")
-    else:
-        # PYTORCH MODE - Standard, safe, well-tested
-        if processor is None or model is None:
-            print(f"[MODEL] Loading PyTorch YOLOS in PID {os.getpid()}...")
-            processor = AutoImageProcessor.from_pretrained(MODEL_ID)
-            model = YolosForObjectDetection.from_pretrained(MODEL_ID)
-            model.eval()
-            model_config = model.config
-            print(f"[MODEL] PyTorch ready in PID {os.getpid()}")
+
+def reinit_after_fork():
+    """
+    Rebuild fork-unsafe state in a freshly forked worker (gunicorn post_fork):
+    the backend's (ONNX session and its thread pools, torch's thread count),
+    and the inference batcher and router (their threads don't survive the fork).
+    """
+    global _inference_batcher, _runpod_batcher, _inference_router, _service_router
+
+    _inference_batcher = None
+    _runpod_batcher = None
+    _inference_router = None
+    _service_router = None
+    if local_backend is not None:
+        local_backend.after_fork()
+
+
+def release_torch_cache():
+    """Free cached CUDA memory when running the PyTorch model on GPU."""
+    torch = sys.modules.get("torch")  # only imported by the pytorch backend
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
 
 # === INPUT SCHEMA ===
 class DetectRequest(BaseModel):
@@ -921,13 +1266,6 @@ def compute_person_context_bbox(detections: List[dict], image: Image.Image) -> O
     y2 = min(image.height, y2 + pad_h)
     return [int(x1), int(y1), int(x2), int(y2)]
 
-def get_luma_stats(image: Image.Image) -> tuple[float, float]:
-    gray = image.convert("L")
-    stat = ImageStat.Stat(gray)
-    mean = stat.mean[0] if stat.mean else 0.0
-    stddev = stat.stddev[0] if stat.stddev else 0.0
-    return mean, stddev
-
 def enhance_image_for_detection(image: Image.Image) -> Image.Image:
     enhanced = ImageOps.autocontrast(image)
     enhanced = ImageEnhance.Brightness(enhanced).enhance(1.15)
@@ -1425,46 +1763,80 @@ def deduplicate_and_limit_by_domain(results: List[dict]) -> List[dict]:
 
 # === DETECTION CORE ===
 
-def call_runpod_detection(image: Image.Image, threshold: float) -> List[dict]:
+def runpod_image_input(image: Image.Image, threshold: float, image_url: Optional[str] = None) -> tuple:
     """
-    Call RunPod serverless GPU endpoint for detection.
-    Returns detections in same format as local detection.
+    Build the RunPod input for one image. Returns (input_dict, sent_size) where
+    sent_size is the (width, height) the handler will detect on, if known.
+
+    Inline images are downsized to the detection resolution and JPEG-encoded
+    within RUNPOD_IMAGE_MAX_BYTES. With RUNPOD_SEND_IMAGE_URL the public URL
+    of the same picture is sent instead and the handler downloads it.
+    """
+    if RUNPOD_SEND_IMAGE_URL and image_url:
+        return {"image_url": image_url, "threshold": threshold}, None
+
+    small = resize_for_detection(image)
+    image_base64, quality = encode_jpeg_base64_within(small, RUNPOD_IMAGE_MAX_BYTES)
+    print(f"[PERF] RunPod payload: {small.width}x{small.height} JPEG q{quality}, {len(image_base64) // 1024} KB base64")
+    return {"image_base64": image_base64, "threshold": threshold}, small.size
+
+
+def call_runpod_detection_batch(
+    images: List[Image.Image],
+    thresholds: List[float],
+    image_urls: Optional[List[Optional[str]]] = None,
+) -> List[List[dict]]:
     """
-    import base64
+    Call RunPod serverless GPU endpoint for detection, one job for all images.
+    Returns one detection list per image, in the same format (and coordinates)
+    as local detection: boxes are mapped from the size the handler detected
+    on back to each image's own size.
 
+    A single image uses the original input format, so it also works against
+    handlers deployed before multi-image jobs.
+    """
     inference_start = time.time()
 
-    # Convert image to base64
-    buffered = io.BytesIO()
-    image.save(buffered, format="JPEG", quality=95)
-    image_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+    image_urls = image_urls or [None] * len(images)
+    inputs = [
+        runpod_image_input(image, threshold, image_url)
+        for image, threshold, image_url in zip(images, thresholds, image_urls)
+    ]
+    if len(images) == 1:
+        job_input = inputs[0][0]
+    else:
+        job_input = {"images": [item for item, _ in inputs]}
 
     # Call RunPod API
-    url = f"https://api.runpod.ai/v2/{RUNPOD_ENDPOINT_ID}/runsync"
+    url = f"{RUNPOD_BASE_URL}/{RUNPOD_ENDPOINT_ID}/runsync"
     headers = {
         "Authorization": f"Bearer {RUNPOD_API_KEY}",
         "Content-Type": "application/json"
     }
-    payload = {
-        "input": {
-            "image_base64": image_base64,
-            "threshold": threshold
-        }
-    }
 
-    response = requests.post(url, json=payload, headers=headers, timeout=60)
+    response = http_session.post(url, json={"input": job_input}, headers=headers, timeout=RUNPOD_TIMEOUT_SECONDS)
     response.raise_for_status()
 
     result = response.json()
 
     inference_time = time.time() - inference_start
-    _original_print(f"[PERF] RunPod GPU inference: {inference_time:.3f}s (includes network latency)")
+    _original_print(f"[PERF] RunPod GPU inference: {inference_time:.3f}s for {len(images)} image(s) (includes network latency)")
 
     # Handle RunPod response format
     if result.get("status") == "COMPLETED":
         output = result.get("output", {})
-        detections = output.get("detections", [])
-        _original_print(f"[PERF] RunPod returned {len(detections)} detections")
+        per_image = output.get("results", [output]) if len(images) > 1 else [output]
+        if len(per_image) != len(images):
+            raise Exception(f"RunPod returned {len(per_image)} results for {len(images)} images")
+        errors = [item["error"] for item in per_image if "error" in item]
+        if errors:
+            raise Exception(f"RunPod detection failed: {errors[0]}")
+        detections = []
+        for item, image, (_, sent_size) in zip(per_image, images, inputs):
+            size = item.get("image_size")
+            detected_size = (size["width"], size["height"]) if size else (sent_size or image.size)
+            detections.append(scale_detections(item.get("detections", []), detected_size, image.size))
+        _original_print(f"[PERF] RunPod returned {sum(len(d) for d in detections)} detections")
         return detections
     elif result.get("status") == "FAILED":
         error = result.get("error", "Unknown error")
@@ -1473,74 +1845,205 @@ def call_runpod_detection(image: Image.Image, threshold: float) -> List[dict]:
         raise Exception(f"Unexpected RunPod status: {result.get('status')}")
 
 
-def get_raw_detections(image: Image.Image, threshold: float) -> List[dict]:
+def call_runpod_detection(image: Image.Image, threshold: float, image_url: Optional[str] = None) -> List[dict]:
     """
-    Run object detection on image using PyTorch, ONNX, or RunPod GPU.
-    Returns list of detected garments with bbox, score, and label.
+    Call RunPod serverless GPU endpoint for detection.
+    Returns detections in same format as local detection.
+    """
+    return call_runpod_detection_batch([image], [threshold], [image_url])[0]
+
+
+_runpod_batcher: Optional[InferenceBatcher] = None
+
+
+def get_runpod_batcher() -> InferenceBatcher:
+    """Coalesces concurrent requests' images into shared RunPod jobs (created on first use)."""
+    global _runpod_batcher
+    if _runpod_batcher is None:
+        _runpod_batcher = InferenceBatcher(
+            lambda items: call_runpod_detection_batch(
+                [img for img, _, _ in items], [thr for _, thr, _ in items], [url for _, _, url in items]
+            ),
+            max_batch_size=RUNPOD_BATCH_MAX_SIZE,
+            max_wait_ms=RUNPOD_BATCH_MAX_WAIT_MS,
+            name="runpod",
+            # The handler only batches images of one resized shape, so a mixed job saves nothing
+            key=detection_batch_key,
+        )
+    return _runpod_batcher
+
+
+def infer_batch(images: List[Image.Image], thresholds: List[float]) -> List[List[dict]]:
+    """
+    Run local detection on a batch of images in a single forward pass.
+    Returns one detection list per image, in input order.
+    """
+    backend = ensure_model_loaded()
+    inference_start = time.time()
+    detections = backend.infer(images, thresholds)
+    print(f"[PERF] {backend.name} inference: {time.time() - inference_start:.3f}s (batch={len(images)})")
+    return detections
+
+
+_inference_batcher: Optional[InferenceBatcher] = None
+
 
-    Mode is determined by USE_RUNPOD or USE_ONNX environment variables.
+def detection_batch_key(item: tuple) -> Tuple[int, int]:
+    """Batcher key of an (image, threshold, ...) item: the (height, width) it is resized to for detection."""
+    image = item[0]
+    return get_resize_size(image.height, image.width, DETECTION_SHORTEST_EDGE, DETECTION_LONGEST_EDGE)
+
+
+def get_inference_batcher() -> InferenceBatcher:
+    """Shared micro-batcher for local inference (created on first use)."""
+    global _inference_batcher
+    if _inference_batcher is None:
+        _inference_batcher = InferenceBatcher(
+            lambda items: infer_batch([img for img, _ in items], [thr for _, thr in items]),
+            max_batch_size=INFERENCE_BATCH_MAX_SIZE,
+            max_wait_ms=INFERENCE_BATCH_MAX_WAIT_MS,
+            name="yolos",
+            key=detection_batch_key,
+        )
+    return _inference_batcher
+
+
+def get_raw_detections_batch(
+    images: List[Image.Image],
+    thresholds: List[float],
+    image_urls: Optional[List[Optional[str]]] = None,
+) -> List[List[dict]]:
+    """
+    Run object detection on several images using the local backend or RunPod GPU.
+    Returns one list of detected garments (bbox, score, label) per image.
+
+    Mode is determined by USE_RUNPOD and INFERENCE_BACKEND environment variables.
+    Local inference runs the images as one batch and RunPod as one job; with
+    INFERENCE_BATCHING / RUNPOD_BATCHING enabled they are queued together
+    with other concurrent requests. `image_urls` (public URLs of the same
+    pictures, None where there is none) are only used by RunPod.
     """
-    # Priority: RunPod GPU > ONNX > PyTorch
+    # RunPod GPU (when configured) in front of the local backend
+    image_urls = image_urls or [None] * len(images)
     if USE_RUNPOD:
         if not RUNPOD_API_KEY or not RUNPOD_ENDPOINT_ID:
             _original_print("[ERROR] USE_RUNPOD=true but RUNPOD_API_KEY or RUNPOD_ENDPOINT_ID not set. Falling back to local.")
         else:
-            _original_print("[PERF] Using RunPod GPU serverless...")
-            try:
-                return call_runpod_detection(image, threshold)
-            except Exception as e:
-                _original_print(f"[ERROR] RunPod failed: {e}. Falling back to local detection.")
+            # Breaker / fallback / hedging between RunPod and local inference
+            return get_inference_router().run(images, thresholds, image_urls)
+    return detect_local(images, thresholds, image_urls)
+
+
+def detect_local(images: List[Image.Image], thresholds: List[float], image_urls=None) -> List[List[dict]]:
+    """Local (ONNX / PyTorch) detection: the shared inference service if configured, else in-process."""
+    if INFERENCE_SOCKET:
+        return get_service_router().run(images, thresholds)
+    return detect_in_process(images, thresholds)
+
+
+def detect_in_process(images: List[Image.Image], thresholds: List[float]) -> List[List[dict]]:
+    """Detection with this worker's own model, through the inference batcher if enabled."""
+    if INFERENCE_BATCHING:
+        batcher = get_inference_batcher()
+        futures = [batcher.submit((image, threshold)) for image, threshold in zip(images, thresholds)]
+        return [future.result() for future in futures]
+    return infer_batch(images, thresholds)
+
+
+def detect_runpod(images: List[Image.Image], thresholds: List[float], image_urls: List[Optional[str]]) -> List[List[dict]]:
+    """RunPod detection, through the RunPod job batcher if enabled."""
+    _original_print("[PERF] Using RunPod GPU serverless...")
+    if RUNPOD_BATCHING:
+        batcher = get_runpod_batcher()
+        futures = [batcher.submit(item) for item in zip(images, thresholds, image_urls)]
+        return [future.result() for future in futures]
+    return call_runpod_detection_batch(images, thresholds, image_urls)
+
+
+_inference_client = InferenceClient(INFERENCE_SOCKET, timeout=INFERENCE_SOCKET_TIMEOUT) if INFERENCE_SOCKET else None
+_service_router: Optional[InferenceRouter] = None
+
+
+def get_service_router() -> InferenceRouter:
+    """Inference service first, this worker's own model as the fallback (created on first use)."""
+    global _service_router
+    if _service_router is None:
+        _service_router = InferenceRouter(
+            remote=_inference_client.detect_batch,
+            local=detect_in_process,
+            breaker=CircuitBreaker(failure_threshold=3, slow_call_seconds=INFERENCE_SOCKET_TIMEOUT, reset_timeout=10),
+            remote_name="inference_service",
+            local_name="in_process",
+            log=_original_print,
+        )
+    return _service_router
+
+
+register_backend("runpod")(lambda settings: RunPodBackend(settings, detect_runpod))
+_inference_router: Optional[InferenceRouter] = None
+
+
+def get_inference_router() -> InferenceRouter:
+    """RunPod-first router with local fallback (created on first use)."""
+    global _inference_router
+    if _inference_router is None:
+        _inference_router = InferenceRouter(
+            remote=create_backend("runpod", backend_settings(["runpod"])).infer,
+            local=detect_local,
+            breaker=CircuitBreaker(
+                failure_threshold=RUNPOD_BREAKER_FAILURES,
+                slow_call_seconds=RUNPOD_SLOW_CALL_SECONDS,
+                reset_timeout=RUNPOD_BREAKER_RESET_SECONDS,
+            ),
+            hedge=RUNPOD_HEDGE,
+            hedge_percentile=RUNPOD_HEDGE_PERCENTILE,
+            hedge_min_ms=RUNPOD_HEDGE_MIN_MS,
+            log=_original_print,
+        )
+    return _inference_router
 
-    ensure_model_loaded()
 
-    inputs = processor(images=image, return_tensors="pt")
+def get_raw_detections(image: Image.Image, threshold: float, image_url: Optional[str] = None) -> List[dict]:
+    """
+    Run object detection on a single image.
+    Returns list of detected garments with bbox, score, and label.
+    """
+    return get_raw_detections_batch([image], [threshold], [image_url])[0]
 
-    inference_start = time.time()
-    if USE_ONNX:
-        # ONNX INFERENCE - Faster execution
-        import numpy as np
-        from types import SimpleNamespace
-
-        onnx_inputs = {onnx_session.get_inputs()[0].name: inputs['pixel_values'].numpy()}
-        onnx_outputs = onnx_session.run(None, onnx_inputs)
-
-        # ONNX returns outputs as list - wrap in object with attributes
-        # Post-processor expects .logits and .pred_boxes attributes
-        outputs = SimpleNamespace(
-            logits=torch.from_numpy(onnx_outputs[0]),
-            pred_boxes=torch.from_numpy(onnx_outputs[1])
-        )
-    else:
-        # PYTORCH INFERENCE - Standard path
-        with torch.no_grad():
-            outputs = model(**inputs)
 
-    inference_time = time.time() - inference_start
-    mode = "ONNX" if USE_ONNX else "PyTorch"
-    print(f"[PERF] {mode} inference: {inference_time:.3f}s")
-
-    # Post-processing is identical for both modes
-    results = processor.post_process_object_detection(
-        outputs,
-        threshold=threshold,
-        target_sizes=torch.tensor([[image.height, image.width]])
-    )[0]
-
-    detections = []
-    for box, score, label_idx in zip(results["boxes"], results["scores"], results["labels"]):
-        score = score.item()
-        label = model_config.id2label[label_idx.item()]
-        if label not in MAJOR_GARMENTS:
-            continue
+def resize_for_detection(image: Image.Image) -> Image.Image:
+    """
+    Downsize once to the detection resolution (DETECTION_SHORTEST_EDGE /
+    DETECTION_LONGEST_EDGE) so the processor has nothing left to resize.
+    reducing_gap=1.0 does most of the shrink with an integer box reduce() and
+    only the remainder with bilinear: about half the cost of a plain bilinear
+    resize of a 12 MP photo, for a sub-1-level mean pixel difference.
+    Small images are returned as-is (the processor upsizes them).
+    """
+    height, width = get_resize_size(image.height, image.width, DETECTION_SHORTEST_EDGE, DETECTION_LONGEST_EDGE)
+    if width >= image.width or height >= image.height:
+        return image
+    return image.resize((width, height), Image.BILINEAR, reducing_gap=1.0)
 
-        # Use category-specific threshold if available, otherwise fall back to global threshold
-        category_threshold = CATEGORY_THRESHOLDS.get(label, threshold)
-        if score < category_threshold:
-            continue
 
-        x1, y1, x2, y2 = map(int, box.tolist())
-        detections.append({"label": label, "score": score, "bbox": [x1, y1, x2, y2]})
-    return detections
+def scale_detections(detections: List[dict], from_size: tuple, to_size: tuple) -> List[dict]:
+    """Map boxes detected at (width, height) `from_size` onto the same picture at `to_size`."""
+    if tuple(from_size) == tuple(to_size):
+        return detections
+    to_width, to_height = to_size
+    scale_x = to_width / from_size[0]
+    scale_y = to_height / from_size[1]
+    scaled = []
+    for det in detections:
+        x1, y1, x2, y2 = det["bbox"]
+        scaled.append({
+            **det,
+            "bbox": [
+                int(x1 * scale_x), int(y1 * scale_y),
+                min(to_width, int(x2 * scale_x)), min(to_height, int(y2 * scale_y)),
+            ],
+        })
+    return scaled
 
 
 def merge_detections(primary: List[dict], extras: List[dict], iou_threshold: float = 0.6) -> List[dict]:
@@ -1560,17 +2063,120 @@ def merge_detections(primary: List[dict], extras: List[dict], iou_threshold: flo
     return merged
 
 
-def run_detection(image: Image.Image, threshold: float, expand_ratio: float, max_crops: int):
-    detections = get_raw_detections(image, threshold)
+_detection_cache: Optional[DetectionCache] = None
+
+
+def get_detection_cache() -> Optional[DetectionCache]:
+    global _detection_cache
+    if DETECTION_CACHE and _detection_cache is None:
+        store = None
+        if DETECTION_CACHE_PATH:
+            store = SqliteStore(DETECTION_CACHE_PATH, ttl_seconds=DETECTION_CACHE_TTL_SECONDS)
+        _detection_cache = DetectionCache(
+            max_entries=DETECTION_CACHE_SIZE,
+            ttl_seconds=DETECTION_CACHE_TTL_SECONDS,
+            store=store,
+            log=_original_print,
+        )
+    return _detection_cache
+
+
+_upload_cache: Optional[UploadCache] = None
+
+
+def get_upload_cache() -> Optional[UploadCache]:
+    global _upload_cache
+    if CLOUDINARY_UPLOAD_DEDUPE and _upload_cache is None:
+        store = None
+        if UPLOAD_CACHE_PATH:
+            store = SqliteStore(UPLOAD_CACHE_PATH, ttl_seconds=UPLOAD_CACHE_TTL_SECONDS, table="uploads")
+        _upload_cache = UploadCache(DetectionCache(
+            max_entries=UPLOAD_CACHE_SIZE,
+            ttl_seconds=UPLOAD_CACHE_TTL_SECONDS,
+            store=store,
+            log=_original_print,
+            name="UploadCache",
+        ))
+    return _upload_cache
+
+
+def detection_cache_key(
+    image: Union[Image.Image, SourceImage], threshold: float, expand_ratio: float, max_crops: int
+) -> str:
+    # The detection resolution changes the boxes, so it is part of the key too
+    return (
+        f"{hash_pixels(pixels_of(image))}:{image.width}x{image.height}:{threshold}:{expand_ratio}:{max_crops}:"
+        f"{DETECTION_SHORTEST_EDGE}x{DETECTION_LONGEST_EDGE}"
+    )
+
 
-    mean_luma, std_luma = get_luma_stats(image)
-    if (mean_luma < 65 or (mean_luma < 85 and std_luma < 25)) and len(detections) < max(2, max_crops):
-        print(f"[Detection] Low light (mean {mean_luma:.1f}, std {std_luma:.1f}) - running enhanced pass")
-        enhanced = enhance_image_for_detection(image)
-        relaxed_threshold = max(0.2, threshold * 0.9)
-        extra_detections = get_raw_detections(enhanced, relaxed_threshold)
+def run_detection(
+    image: Union[Image.Image, SourceImage],
+    threshold: float,
+    expand_ratio: float,
+    max_crops: int,
+    image_url: Optional[str] = None,
+):
+    """
+    Detect and filter garments in `image`; returns (detections, initial_count).
+    Served from the detection cache when DETECTION_CACHE is on and these exact
+    pixels were analysed recently with the same parameters.
+    """
+    cache = get_detection_cache()
+    if cache is None:
+        return detect_and_filter(image, threshold, expand_ratio, max_crops, image_url)
+
+    key = detection_cache_key(image, threshold, expand_ratio, max_crops)
+    cached = cache.get(key)
+    if cached is not None:
+        detections, initial_count = cached
+        print(f"[DetectionCache] HIT - reusing {len(detections)} garments for {key[:12]}")
+        return detections, initial_count
+
+    detections, initial_count = detect_and_filter(image, threshold, expand_ratio, max_crops, image_url)
+    cache.put(key, [detections, initial_count])
+    return detections, initial_count
+
+
+def detect_and_filter(
+    image: Union[Image.Image, SourceImage],
+    threshold: float,
+    expand_ratio: float,
+    max_crops: int,
+    image_url: Optional[str] = None,
+):
+    # image_url: public URL of `image`, if any (RunPod can fetch it instead of an upload)
+    # Every detection pass (and the low-light enhancement) works on one downsized
+    # copy; boxes are mapped back so the crops below come from the full image.
+    # A SourceImage only has full-resolution dimensions; its pixels are the preview
+    detect_image = resize_for_detection(pixels_of(image))
+
+    # Global statistics come from the same small copy, not the full photo
+    luma = luma_stats(detect_image)
+    mean_luma, std_luma = luma.mean, luma.std
+    low_light = luma.low_light
+    relaxed_threshold = max(0.2, threshold * 0.9)
+
+    if low_light and LOW_LIGHT_FUSED_PASS:
+        # Decide up front and run original + enhanced as one batch of 2;
+        # both share a size, so they go through a single preprocessing call
+        print(f"[Detection] Low light (mean {mean_luma:.1f}, std {std_luma:.1f}) - running fused enhanced pass")
+        enhanced = enhance_image_for_detection(detect_image)
+        detections, extra_detections = get_raw_detections_batch(
+            [detect_image, enhanced], [threshold, relaxed_threshold], [image_url, None]
+        )
         if extra_detections:
             detections = merge_detections(detections, extra_detections)
+    else:
+        detections = get_raw_detections(detect_image, threshold, image_url)
+        if low_light and len(detections) < max(2, max_crops):
+            print(f"[Detection] Low light (mean {mean_luma:.1f}, std {std_luma:.1f}) - running enhanced pass")
+            enhanced = enhance_image_for_detection(detect_image)
+            extra_detections = get_raw_detections(enhanced, relaxed_threshold)
+            if extra_detections:
+                detections = merge_detections(detections, extra_detections)
+
+    detections = scale_detections(detections, detect_image.size, image.size)
 
     # === Smart Headwear False Positive Filter (v3) ===
     filtered_detections = []
@@ -1925,18 +2531,30 @@ def run_detection(image: Image.Image, threshold: float, expand_ratio: float, max
 
 # === SERP API SEARCH HELPERS ===
 def load_image_from_bytes(img_bytes: bytes) -> Image.Image:
-    image = Image.open(io.BytesIO(img_bytes))
-    image = ImageOps.exif_transpose(image)
-    return image.convert("RGB")
+    # Oriented in place and converted only if not RGB already (no full-size copies)
+    return decode_oriented(img_bytes)
+
+
+def detection_min_size(width: int, height: int) -> tuple:
+    """Smallest (width, height) a decode of a width x height photo may have for detection."""
+    target_height, target_width = get_resize_size(height, width, DETECTION_SHORTEST_EDGE, DETECTION_LONGEST_EDGE)
+    return min(width, target_width), min(height, target_height)
 
 
-def download_image_from_url(image_url: str) -> Image.Image:
-    """Download image from URL and return PIL Image."""
+def load_source_image(img_bytes: bytes) -> Union[Image.Image, SourceImage]:
+    """Decode an upload for the detection pipeline (draft-decoded with JPEG_DRAFT_DECODE)."""
+    if JPEG_DRAFT_DECODE:
+        return SourceImage(img_bytes, detection_min_size)
+    return load_image_from_bytes(img_bytes)
+
+
+def download_image_from_url(image_url: str) -> Union[Image.Image, SourceImage]:
+    """Download image from URL and decode it for the detection pipeline."""
     print(f"📥 Downloading image from: {image_url}")
-    response = requests.get(image_url, timeout=15)
+    response = http_session.get(image_url, timeout=15)
     if response.status_code != 200:
         raise Exception(f"Failed to download image: {response.status_code}")
-    return load_image_from_bytes(response.content)
+    return load_source_image(response.content)
 
 def search_serp_api(
     image_url: str,
@@ -1978,7 +2596,7 @@ def search_serp_api(
 
     try:
         # Increased timeout to 20s to allow for slower SerpAPI responses
-        response = requests.get('https://serpapi.com/search', params=params, timeout=20)
+        response = http_session.get('https://serpapi.com/search', params=params, timeout=20)
         if response.status_code != 200:
             print(f"⚠️ SerpAPI products failed: {response.status_code}")
             return results
@@ -2115,63 +2733,35 @@ def format_detection_result(serp_result: dict, garment_label: str, index: int) -
 # === MAIN ENDPOINT (Optimized for Speed) ===
 @app.post("/detect")
 def detect(req: DetectRequest):
+    deadline = upload_deadline()
     try:
         img_bytes = base64.b64decode(req.image_base64)
-        image = load_image_from_bytes(img_bytes)
+        image = load_source_image(img_bytes)
 
         # Step 1 — Run YOLOS detection
         filtered, initial_count = run_detection(image, req.threshold, req.expand_ratio, req.max_crops)
 
-        # Step 2 — Prepare crops
-        crops = []
+        # Step 2 — Expand boxes
         context_bbox = compute_person_context_bbox(filtered, image)
         for det in filtered:
             ratio = compute_expand_ratio(det, req.expand_ratio, image)
             expanded_bbox = expand_bbox(det["bbox"], image.width, image.height, ratio)
             if context_bbox and det["label"] in PERSON_CONTEXT_LABELS:
                 expanded_bbox = clamp_bbox(expanded_bbox, context_bbox)
-            x1, y1, x2, y2 = expanded_bbox
             det["expanded_bbox"] = expanded_bbox
-            crop = image.crop((x1, y1, x2, y2))
-            crops.append((det, crop, expanded_bbox))
-        save_debug_crops(crops, "detect")
 
         # Step 3 — Parallel Cloudinary uploads
-        results = []
-        if len(crops) > 0:
-            _cloudinary_log(f"[Cloudinary] Uploading {len(crops)} crops in parallel...")
-            with ThreadPoolExecutor(max_workers=min(4, len(crops))) as executor:
-                future_to_item = {
-                    executor.submit(upload_to_cloudinary, crop, det.get('label')): (det, bbox, crop)
-                    for det, crop, bbox in crops
-                }
-                for future in as_completed(future_to_item):
-                    det, bbox, crop = future_to_item[future]
-                    upload_url = None
-                    try:
-                        upload_url = future.result(timeout=25)
-                    except Exception as e:
-                        _cloudinary_log(f"[Cloudinary] Upload failed for {det['label']}: {e}")
-                    finally:
-                        crop.close()
-
-                    results.append({
-                        "id": det["id"],
-                        "label": det["label"],
-                        "score": round(det["score"], 3),
-                        "bbox": bbox,
-                        "image_url": upload_url,
-                    })
-        else:
-            # No crops to upload
-            for det, crop, bbox in crops:
-                results.append({
-                    "id": det["id"],
-                    "label": det["label"],
-                    "score": round(det["score"], 3),
-                    "bbox": bbox,
-                    "image_url": None,
-                })
+        _, uploads = upload_garments(image, filtered, deadline=deadline)
+        results = [
+            {
+                "id": det["id"],
+                "label": det["label"],
+                "score": round(det["score"], 3),
+                "bbox": det["expanded_bbox"],
+                "image_url": upload_url,
+            }
+            for det, upload_url in uploads
+        ]
 
         print(f"✅ Detection complete. {len(results)} garments processed.")
 
@@ -2186,14 +2776,14 @@ def detect(req: DetectRequest):
         }
 
         image.close()
-        torch.cuda.empty_cache() if torch.cuda.is_available() else None
+        release_torch_cache()
         gc.collect()
         return response
 
     except Exception as e:
         if 'image' in locals():
             image.close()
-        torch.cuda.empty_cache() if torch.cuda.is_available() else None
+        release_torch_cache()
         gc.collect()
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -2216,6 +2806,7 @@ def run_full_detection_pipeline(
     Returns dict with: success, message (if failed), cloudinary_url, detected_garments, results, total_results
     """
     t0 = time.time()
+    deadline = upload_deadline()
     threshold = threshold or CONF_THRESHOLD
     expand_ratio = expand_ratio or EXPAND_RATIO
     max_crops = max_crops or MAX_GARMENTS
@@ -2244,7 +2835,7 @@ def run_full_detection_pipeline(
         if image_base64:
             try:
                 img_bytes = base64.b64decode(image_base64)
-                image = load_image_from_bytes(img_bytes)
+                image = load_source_image(img_bytes)
                 print(f"Image decoded from base64: {image.width}x{image.height}")
             except Exception as e:
                 return {'success': False, 'message': f'Unable to decode base64 image: {e}'}
@@ -2259,7 +2850,10 @@ def run_full_detection_pipeline(
 
         # Step 2: YOLOS detection
         t_detect = time.time()
-        filtered, initial_count = run_detection(image, threshold, expand_ratio, max_crops)
+        filtered, initial_count = run_detection(
+            image, threshold, expand_ratio, max_crops,
+            image_url=None if image_base64 else image_url,
+        )
         print(f"Detection completed in {time.time()-t_detect:.2f}s with {len(filtered)} garments")
 
     # Handle no garments detected - use full image for search
@@ -2267,7 +2861,7 @@ def run_full_detection_pipeline(
         print("[Detection] No garments detected - will use full image for search")
         if image is not None:
             # Upload full image and use it for search
-            uploaded_url = upload_to_cloudinary(image, "clothing", is_full=True)
+            uploaded_url = upload_to_cloudinary(image, "clothing", is_full=True, deadline=deadline)
             if uploaded_url:
                 full_image_url = uploaded_url
                 # Create a synthetic garment entry for the full image
@@ -2293,7 +2887,7 @@ def run_full_detection_pipeline(
         crops_with_urls = [{"garment": filtered[0], "crop_url": uploaded_cloudinary_url}]
     elif initial_count == 1 and image is not None:
         print(f"Only 1 garment - uploading full image")
-        full_image_url = upload_to_cloudinary(image, filtered[0].get('label'), is_full=True)
+        full_image_url = upload_to_cloudinary(image, filtered[0].get('label'), is_full=True, deadline=deadline)
         if full_image_url:
             crops_with_urls = [{"garment": filtered[0], "crop_url": full_image_url}]
             uploaded_cloudinary_url = full_image_url
@@ -2303,32 +2897,16 @@ def run_full_detection_pipeline(
             return {'success': False, 'message': 'Failed to upload image to CDN'}
     elif image is not None:
         context_bbox = compute_person_context_bbox(filtered, image)
-        crop_data = []
         for det in filtered:
             ratio = compute_expand_ratio(det, expand_ratio, image)
             expanded = expand_bbox(det["bbox"], image.width, image.height, ratio)
             if context_bbox and det["label"] in PERSON_CONTEXT_LABELS:
                 expanded = clamp_bbox(expanded, context_bbox)
             det["expanded_bbox"] = expanded
-            crop_data.append((det, image.crop(tuple(expanded))))
-        save_debug_crops(crop_data, "analyze")
 
-        def upload_crop_safe(crop_tuple):
-            det, crop = crop_tuple
-            try:
-                url = upload_to_cloudinary(crop, det.get('label'))
-                if url:
-                    return det, url
-            except Exception as e:
-                print(f"Upload failed for {det['label']}: {e}")
-            finally:
-                crop.close()
-            return det, None
-
-        print(f"Uploading {len(crop_data)} crops in parallel...")
+        print(f"Uploading {len(filtered)} crops in parallel...")
         t_upload = time.time()
-        with ThreadPoolExecutor(max_workers=min(6, len(crop_data))) as ex:
-            results = list(ex.map(upload_crop_safe, crop_data))
+        full_image_url, results = upload_garments(image, filtered, deadline=deadline)
         print(f"Uploads complete in {time.time()-t_upload:.2f}s")
 
         crops_with_urls = [
@@ -2337,7 +2915,8 @@ def run_full_detection_pipeline(
         ]
         if crops_with_urls:
             # Upload the full original image so we can persist a holistic preview for history.
-            full_image_url = upload_to_cloudinary(image, "full-image", is_full=True)
+            # (Already uploaded when the crops are URLs of it.)
+            full_image_url = full_image_url or upload_to_cloudinary(image, "full-image", is_full=True, deadline=deadline)
             if full_image_url:
                 uploaded_cloudinary_url = full_image_url
             else:
@@ -2355,7 +2934,7 @@ def run_full_detection_pipeline(
             uploaded_cloudinary_url = full_image_url
         elif image is not None:
             print("All uploads failed - attempting fallback")
-            fallback_url = upload_to_cloudinary(image, filtered[0].get('label'), is_full=True)
+            fallback_url = upload_to_cloudinary(image, filtered[0].get('label'), is_full=True, deadline=deadline)
             if fallback_url:
                 full_image_url = fallback_url
                 crops_with_urls = [{"garment": filtered[0], "crop_url": fallback_url}]
@@ -2439,7 +3018,7 @@ def run_full_detection_pipeline(
     if image is not None:
         image.close()
 
-    torch.cuda.empty_cache() if torch.cuda.is_available() else None
+    release_torch_cache()
     gc.collect()
 
     return {
@@ -2459,6 +3038,54 @@ def run_full_detection_pipeline(
     }
 
 
+# === NEAR-DUPLICATE CACHE ===
+near_duplicate_index = NearDuplicateIndex(max_distance=NEAR_DUPLICATE_MAX_DISTANCE)
+
+
+def load_near_duplicate_index():
+    rows = supabase_manager.load_perceptual_hashes()
+    near_duplicate_index.load(rows)
+    print(f"[NearDup] Indexed {len(rows)} cached images")
+
+
+def find_near_duplicate(image_phash: int, country: str, max_candidates: int = 3) -> Optional[dict]:
+    """Closest unexpired image_cache entry within NEAR_DUPLICATE_MAX_DISTANCE, if any."""
+    for distance, cache_id in near_duplicate_index.find(image_phash, country)[:max_candidates]:
+        cache_entry = supabase_manager.get_cache_entry(cache_id)
+        if cache_entry:
+            print(f"[NearDup] HIT for {country} at distance {distance}: {cache_id}")
+            return cache_entry
+    return None
+
+
+def cached_search_response(cache_entry: dict, req: "DetectAndSearchRequest") -> dict:
+    """Response for a detect-and-search cache hit; records the hit in user history."""
+    # Create or update user_search entry for this cache hit (avoid duplicates)
+    search_id = None
+    if req.user_id:
+        search_id = supabase_manager.create_or_update_user_search(
+            user_id=req.user_id,
+            image_cache_id=cache_entry['id'],
+            search_type=req.search_type or 'unknown',
+            source_url=req.image_url,
+            source_username=None
+        )
+        print(f"[Supabase] Search entry for cache hit: {search_id}")
+
+        # Increment cache hit counter
+        supabase_manager.increment_cache_hit(cache_entry['id'])
+
+    return {
+        'success': True,
+        'cached': True,
+        'detected_garment': cache_entry.get('detected_garments', [{}])[0] if cache_entry.get('detected_garments') else {},
+        'total_results': cache_entry.get('total_results', 0),
+        'results': cache_entry.get('search_results', []),
+        'search_id': search_id,
+        'cloudinary_url': cache_entry.get('cloudinary_url')
+    }
+
+
 # === DETECT AND SEARCH ENDPOINT (Optimized) ===
 @app.post("/detect-and-search")
 def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
@@ -2468,6 +3095,7 @@ def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
     """
     try:
         t0 = time.time()
+        deadline = upload_deadline()
         source_desc = req.image_url[:80] if req.image_url else f"<base64:{len(req.image_base64 or '')} chars>"
         print(f"\U0001f680 Starting detect-and-search pipeline for: {source_desc}...")
         print(f"[DEBUG] Request country: '{req.country}', language: '{req.language}', search_type: '{req.search_type}'")
@@ -2479,34 +3107,11 @@ def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
             cache_entry = supabase_manager.check_cache(image_url=cache_lookup_url, country=request_country)
             if cache_entry:
                 print(f"[Cache] HIT for {request_country} - returning cached results for {cache_lookup_url[:50]}...")
-
-                # Create or update user_search entry for this cache hit (avoid duplicates)
-                search_id = None
-                if req.user_id:
-                    search_id = supabase_manager.create_or_update_user_search(
-                        user_id=req.user_id,
-                        image_cache_id=cache_entry['id'],
-                        search_type=req.search_type or 'unknown',
-                        source_url=req.image_url,
-                        source_username=None
-                    )
-                    print(f"[Supabase] Search entry for cache hit: {search_id}")
-
-                    # Increment cache hit counter
-                    supabase_manager.increment_cache_hit(cache_entry['id'])
-
-                return {
-                    'success': True,
-                    'cached': True,
-                    'detected_garment': cache_entry.get('detected_garments', [{}])[0] if cache_entry.get('detected_garments') else {},
-                    'total_results': cache_entry.get('total_results', 0),
-                    'results': cache_entry.get('search_results', []),
-                    'search_id': search_id,
-                    'cloudinary_url': cache_entry.get('cloudinary_url')
-                }
+                return cached_search_response(cache_entry, req)
 
         # Step 1: Acquire image (skip if user provided pre-cropped URL)
         image = None
+        image_phash = None
         initial_count = 0
         if req.skip_detection and req.image_url:
             print("βœ‚οΈ User cropped image - skipping download and detection")
@@ -2526,7 +3131,7 @@ def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
                 except Exception as e:
                     raise HTTPException(status_code=400, detail=f"Invalid image_base64 payload: {e}")
                 try:
-                    image = load_image_from_bytes(img_bytes)
+                    image = load_source_image(img_bytes)
                 except Exception as e:
                     raise HTTPException(status_code=400, detail=f"Unable to decode base64 image: {e}")
                 print(f"\u2705 Image decoded from base64: {image.width}x{image.height} ({time.time()-t0:.2f}s)")
@@ -2534,9 +3139,21 @@ def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
                 image = download_image_from_url(req.image_url)
                 print(f"\u2705 Image downloaded: {image.width}x{image.height} ({time.time()-t0:.2f}s)")
 
+            # Step 1b: Same picture under another URL / re-encoded / resized?
+            if NEAR_DUPLICATE_CACHE:
+                image_phash = phash(pixels_of(image))
+                if CACHE_RESULTS and supabase_manager.enabled:
+                    cache_entry = find_near_duplicate(image_phash, request_country)
+                    if cache_entry:
+                        image.close()
+                        return cached_search_response(cache_entry, req)
+
             # Step 2: YOLOS detection
             t_detect = time.time()
-            filtered, initial_count = run_detection(image, req.threshold, req.expand_ratio, req.max_crops)
+            filtered, initial_count = run_detection(
+                image, req.threshold, req.expand_ratio, req.max_crops,
+                image_url=None if req.image_base64 else req.image_url,
+            )
             print(f"🧠 Detection completed in {time.time()-t_detect:.2f}s with {len(filtered)} garments")
 
         # Track full image URL for cache (separate from crop URLs for search)
@@ -2547,7 +3164,7 @@ def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
             print("[Detection] No garments detected - will use full image for search")
             if image is not None:
                 # Upload full image and use it for search
-                uploaded_url = upload_to_cloudinary(image, "clothing", is_full=True)
+                uploaded_url = upload_to_cloudinary(image, "clothing", is_full=True, deadline=deadline)
                 if uploaded_url:
                     full_image_url = uploaded_url
                     # Create a synthetic garment entry for the full image
@@ -2571,7 +3188,7 @@ def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
         elif initial_count == 1 and image is not None:
             _cloudinary_log(f"[Cloudinary] Only 1 garment initially detected - uploading full image instead of cropping")
             # Upload the full image once
-            uploaded_url = upload_to_cloudinary(image, filtered[0].get('label'), is_full=True)
+            uploaded_url = upload_to_cloudinary(image, filtered[0].get('label'), is_full=True, deadline=deadline)
             if uploaded_url:
                 full_image_url = uploaded_url
                 crops_with_urls = [{"garment": filtered[0], "crop_url": uploaded_url}]
@@ -2580,53 +3197,13 @@ def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
                 crops_with_urls = []
         elif image is not None:
             context_bbox = compute_person_context_bbox(filtered, image)
-            crop_data = []
             for det in filtered:
                 ratio = compute_expand_ratio(det, req.expand_ratio, image)
                 expanded = expand_bbox(det["bbox"], image.width, image.height, ratio)
                 if context_bbox and det["label"] in PERSON_CONTEXT_LABELS:
                     expanded = clamp_bbox(expanded, context_bbox)
                 det["expanded_bbox"] = expanded
-                crop_data.append((det, image.crop(tuple(expanded))))
-            save_debug_crops(crop_data, "detect_search")
-
-            def upload_crop_safe(crop_tuple):
-                det, crop = crop_tuple
-                try:
-                    url = upload_to_cloudinary(crop, det.get('label'))
-                    if url:
-                        return det, url
-                    _cloudinary_log(f"[Cloudinary] Empty response for {det.get('label') or 'unknown'}")
-                except Exception as e:
-                    _cloudinary_log(f"[Cloudinary] Upload failed for {det['label']}: {e}")
-                finally:
-                    crop.close()
-                return det, None
-
-            def upload_full_image():
-                """Upload full image in parallel with crops"""
-                try:
-                    url = upload_to_cloudinary(image, "full", is_full=True)
-                    if url:
-                        _cloudinary_log(f"[Cloudinary] Full image uploaded: {url}")
-                    return url
-                except Exception as e:
-                    _cloudinary_log(f"[Cloudinary] Full image upload failed: {e}")
-                    return None
-
-            _cloudinary_log(f"[Cloudinary] Uploading {len(crop_data)} crops + full image in parallel...")
-            t_upload = time.time()
-            with ThreadPoolExecutor(max_workers=min(7, len(crop_data) + 1)) as ex:
-                # Submit all crop uploads
-                crop_futures = [ex.submit(upload_crop_safe, crop) for crop in crop_data]
-                # Submit full image upload in parallel
-                full_image_future = ex.submit(upload_full_image)
-
-                # Collect crop results
-                results = [f.result() for f in crop_futures]
-                # Get full image URL
-                full_image_url = full_image_future.result()
-            _cloudinary_log(f"[Cloudinary] Uploads complete in {time.time()-t_upload:.2f}s")
+            full_image_url, results = upload_garments(image, filtered, include_full=True, deadline=deadline)
 
             crops_with_urls = [
                 {"garment": det, "crop_url": url}
@@ -2641,7 +3218,7 @@ def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
                 crops_with_urls = [{"garment": filtered[0], "crop_url": full_image_url}]
             elif image is not None:
                 _cloudinary_log("[Cloudinary] All crop uploads failed - attempting fallback with entire image")
-                fallback_url = upload_to_cloudinary(image, filtered[0].get('label'), is_full=True)
+                fallback_url = upload_to_cloudinary(image, filtered[0].get('label'), is_full=True, deadline=deadline)
                 if fallback_url:
                     full_image_url = fallback_url
                     crops_with_urls = [{"garment": filtered[0], "crop_url": fallback_url}]
@@ -2748,8 +3325,11 @@ def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
                         'bbox': filtered[0].get('expanded_bbox', filtered[0]['bbox'])
                     }],
                     search_results=deduped_results,
-                    country=request_country  # Cache results are country-specific
+                    country=request_country,  # Cache results are country-specific
+                    image_phash=hash_to_hex(image_phash) if image_phash is not None else None,
                 )
+                if cache_id and image_phash is not None:
+                    near_duplicate_index.add(image_phash, cache_id, request_country)
 
                 # Create or update user_search entry (avoid duplicates)
                 if cache_id:
@@ -2771,7 +3351,7 @@ def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
         if image is not None:
             image.close()
 
-        torch.cuda.empty_cache() if torch.cuda.is_available() else None
+        release_torch_cache()
         gc.collect()
 
         return {
@@ -2790,7 +3370,7 @@ def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
     except Exception as e:
         if 'image' in locals() and image is not None:
             image.close()
-        torch.cuda.empty_cache() if torch.cuda.is_available() else None
+        release_torch_cache()
         gc.collect()
         print(f"❌ detect-and-search failed: {e}")
         import traceback; traceback.print_exc()
@@ -2800,17 +3380,9 @@ def detect_and_search(req: DetectAndSearchRequest, http_request: Request):
 # === Optimized helpers ===
 
 
-def upload_to_cloudinary(
-    image: Image.Image,
-    label: Optional[str] = None,
-    is_full: bool = False,
-) -> Optional[str]:
-    """Upload image to Cloudinary CDN for global availability."""
-    image = image.convert("RGB")
-    w, h = image.size
+def crop_meets_min_size(label: Optional[str], w: int, h: int) -> bool:
+    """Minimum crop dimensions based on garment type; smaller crops are not worth searching."""
     label_lower = (label or "").lower()
-
-    # Validate minimum dimensions based on garment type
     min_w = 80
     min_h = 80
     min_area = 14400
@@ -2830,48 +3402,235 @@ def upload_to_cloudinary(
 
     if w < min_w or h < min_h or (w * h) < min_area:
         _cloudinary_log(f"[Cloudinary] Skipping crop {w}x{h} (label={label_lower or 'unknown'})")
-        return None
+        return False
+    return True
+
+
+_crop_storage: Optional[CropStorage] = None
+_upload_client: Optional[UploadClient] = None
+_upload_client_lock = threading.Lock()
+
+
+def crop_storage_settings() -> StorageSettings:
+    return StorageSettings(
+        pool_size=CLOUDINARY_UPLOAD_WORKERS,
+        base_url=CROP_STORAGE_BASE_URL,
+        secret=CROP_STORAGE_SECRET,
+        ttl_seconds=CROP_STORAGE_TTL_SECONDS,
+        directory=CROP_STORAGE_DIR,
+        max_bytes=int(CROP_STORAGE_MAX_MB * 1024 * 1024),
+        fault_inner=CROP_STORAGE_FAULT_INNER,
+        fault_latency_ms=CROP_STORAGE_FAULT_LATENCY_MS,
+        fault_error_rate=CROP_STORAGE_FAULT_ERROR_RATE,
+        fault_timeout_rate=CROP_STORAGE_FAULT_TIMEOUT_RATE,
+    )
+
+
+def get_crop_storage() -> CropStorage:
+    """The CROP_STORAGE backend uploads go to (the Cloudinary one sizes the SDK's connection pool)."""
+    global _crop_storage
+    with _upload_client_lock:
+        if _crop_storage is None:
+            settings = crop_storage_settings()
+            if "local" in {CROP_STORAGE, CROP_STORAGE_FAULT_INNER if CROP_STORAGE == "faulty" else None}:
+                try:
+                    check_local_settings(settings, WEB_CONCURRENCY)
+                except ValueError as e:
+                    _original_print(f"[Storage] ERROR {e}")
+                    raise
+            _crop_storage = create_storage(CROP_STORAGE, settings)
+            if CROP_STORAGE != "cloudinary":
+                print(f"[Storage] Uploads go to {_crop_storage.info()['name']} storage")
+        return _crop_storage
+
+
+def get_upload_client() -> UploadClient:
+    """The worker's upload pool, calling the crop storage."""
+    global _upload_client
+    storage = get_crop_storage()
+    with _upload_client_lock:
+        if _upload_client is None:
+            _upload_client = UploadClient(
+                storage.put,
+                max_workers=CLOUDINARY_UPLOAD_WORKERS,
+                attempts=CLOUDINARY_UPLOAD_ATTEMPTS,
+                attempt_timeout=CLOUDINARY_UPLOAD_TIMEOUT,
+                log=_cloudinary_log,
+                backend=storage.info()["name"],
+            )
+        return _upload_client
 
+
+def upload_deadline() -> float:
+    """Deadline (time.monotonic) for the uploads of a request starting now."""
+    return time.monotonic() + CLOUDINARY_UPLOAD_DEADLINE_SECONDS
+
+
+def upload_to_cloudinary(
+    image: Union[Image.Image, SourceImage],
+    label: Optional[str] = None,
+    is_full: bool = False,
+    deadline: Optional[float] = None,
+) -> Optional[str]:
+    """Upload image to Cloudinary CDN for global availability (None once past `deadline`)."""
+    result = upload_to_cloudinary_result(image, label, is_full, deadline)
+    return result["secure_url"] if result else None
+
+
+def upload_to_cloudinary_result(
+    image: Union[Image.Image, SourceImage],
+    label: Optional[str] = None,
+    is_full: bool = False,
+    deadline: Optional[float] = None,
+) -> Optional[dict]:
+    """upload_to_cloudinary, returning Cloudinary's whole upload response (public_id, width, height...)."""
     max_dim = CLOUDINARY_FULL_MAX_DIM if is_full else CLOUDINARY_CROP_MAX_DIM
-    if max_dim > 0 and max(w, h) > max_dim:
-        image.thumbnail((max_dim, max_dim), Image.LANCZOS)
-        w, h = image.size
+    if isinstance(image, SourceImage):
+        # Downsized to max_dim below anyway: no need for the full-resolution decode
+        image = image.within(max_dim)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    w, h = image.size
+    label_lower = (label or "").lower()
+
+    if not crop_meets_min_size(label, w, h):
+        return None
 
-    quality = CLOUDINARY_FULL_QUALITY if is_full else CLOUDINARY_CROP_QUALITY
-    quality = max(40, min(95, quality))
     t_upload = time.time()
+    if CLOUDINARY_BYTE_BUDGET:
+        data, quality, (w, h) = encode_jpeg_budget(image, CLOUDINARY_FULL_BUDGET if is_full else CLOUDINARY_CROP_BUDGET)
+    else:
+        # Same size and filter as thumbnail(), without mutating the caller's image
+        image = resize_within(image, max_dim, Image.LANCZOS, reducing_gap=2.0)
+        w, h = image.size
 
-    for attempt in range(1, 3):  # Two attempts
-        try:
-            buf = io.BytesIO()
-            # Lower quality for faster uploads - images only used for visual search
-            image.save(buf, format="JPEG", quality=quality)
-            buf.seek(0)
-
-            # Upload to Cloudinary with minimal processing for speed
-            result = cloudinary.uploader.upload(
-                buf,
-                folder="snaplook_crops",
-                resource_type="image",
-                format="jpg",
-                timeout=8
-            )
+        quality = CLOUDINARY_FULL_QUALITY if is_full else CLOUDINARY_CROP_QUALITY
+        quality = max(40, min(95, quality))
+        buf = io.BytesIO()
+        # Lower quality for faster uploads - images only used for visual search
+        image.save(buf, format="JPEG", quality=quality)
+        data = buf.getvalue()
+
+    upload_cache = get_upload_cache()
+    naming = {}
+    if upload_cache is not None:
+        digest = hash_bytes(data)
+        cached = upload_cache.get(digest, len(data))
+        if cached is not None:
+            # Signed URLs of local storage expire sooner than the cache: re-sign, or upload again
+            cached = get_crop_storage().refresh(cached)
+        if cached is not None:
+            _cloudinary_log(f"[Cloudinary] Reusing upload of {label_lower or 'garment'} {w}x{h}: {cached['secure_url']}")
+            return cached
+        # Same bytes, same asset: a repeat from another worker or instance replaces nothing
+        naming = {"public_id": content_public_id(digest), "overwrite": False}
 
-            if result and result.get("secure_url"):
-                url = result["secure_url"]
-                elapsed = time.time() - t_upload
-                _cloudinary_log(
-                    f"[Cloudinary] Uploaded {label_lower or 'garment'} {w}x{h} in {elapsed:.2f}s: {url}"
-                )
-                return url
+    try:
+        result = get_upload_client().call(data, deadline=deadline, **naming)
+    except Exception as e:
+        _cloudinary_log(f"[Cloudinary] Upload of {label_lower or 'garment'} {w}x{h} failed: {e}")
+        return None
+
+    elapsed = time.time() - t_upload
+    _cloudinary_log(
+        f"[Cloudinary] Uploaded {label_lower or 'garment'} {w}x{h} q{quality} {len(data) / 1024:.0f}KB "
+        f"in {elapsed:.2f}s: {result['secure_url']}"
+    )
+    if upload_cache is not None:
+        upload_cache.put(digest, result, len(data))
+    return result
+
+
+def cloudinary_crop_url(upload: dict, bbox, source_size: Tuple[int, int], label: Optional[str] = None) -> Optional[str]:
+    """
+    URL of `bbox` (full-resolution coordinates of an image of `source_size`)
+    cut out of an uploaded full image by Cloudinary itself: c_crop in the
+    uploaded image's coordinates, then the same size limit and quality as an
+    uploaded crop. None when the crop is below the label's minimum size.
+    """
+    x1, y1, x2, y2 = (int(v) for v in bbox)
+    if not crop_meets_min_size(label, x2 - x1, y2 - y1):
+        return None
+    width, height = upload["width"], upload["height"]
+    scale_x = width / source_size[0]
+    scale_y = height / source_size[1]
+    x, y = min(width - 1, int(x1 * scale_x)), min(height - 1, int(y1 * scale_y))
+    w = max(1, min(width - x, round((x2 - x1) * scale_x)))
+    h = max(1, min(height - y, round((y2 - y1) * scale_y)))
+    quality = max(40, min(95, CLOUDINARY_CROP_QUALITY))
+    transformation = f"c_crop,h_{h},w_{w},x_{x},y_{y}"
+    if CLOUDINARY_CROP_MAX_DIM > 0:
+        transformation += f"/c_limit,h_{CLOUDINARY_CROP_MAX_DIM},w_{CLOUDINARY_CROP_MAX_DIM}"
+    transformation += f"/q_{quality}"
+    return upload["secure_url"].replace("/image/upload/", f"/image/upload/{transformation}/", 1)
+
+
+def upload_garments(
+    image: Union[Image.Image, SourceImage],
+    detections: List[dict],
+    include_full: bool = False,
+    deadline: Optional[float] = None,
+) -> Tuple[Optional[str], List[Tuple[dict, Optional[str]]]]:
+    """
+    Upload the expanded_bbox crop of every detection, plus the full image
+    when `include_full`, in parallel on the worker's upload pool, retrying
+    until `deadline`. Returns (full image URL, [(det, crop URL or None)]).
+
+    With CLOUDINARY_CROP_BY_URL (and a crop storage that serves Cloudinary
+    transformations) only the full image is uploaded and each crop URL is a
+    Cloudinary crop transformation of it (so the full image URL is returned
+    even without `include_full`).
+    """
+    t_upload = time.time()
+    if CLOUDINARY_CROP_BY_URL and get_crop_storage().supports_transformations:
+        upload = upload_to_cloudinary_result(image, "full-image", is_full=True, deadline=deadline)
+        if not upload:
+            _cloudinary_log("[Cloudinary] Full image upload failed - no crop URLs")
+            return None, [(det, None) for det in detections]
+        results = [
+            (det, cloudinary_crop_url(upload, det["expanded_bbox"], image.size, det.get("label")))
+            for det in detections
+        ]
+        _cloudinary_log(
+            f"[Cloudinary] Full image uploaded once for {len(detections)} crop URLs in {time.time()-t_upload:.2f}s"
+        )
+        return upload["secure_url"], results
 
+    def upload_crop_safe(det):
+        crop = image.crop(tuple(det["expanded_bbox"]))
+        try:
+            url = upload_to_cloudinary(crop, det.get('label'), deadline=deadline)
+            if url:
+                return det, url
+            _cloudinary_log(f"[Cloudinary] Empty response for {det.get('label') or 'unknown'}")
         except Exception as e:
-            _cloudinary_log(f"[Cloudinary] Attempt {attempt} failed: {e}")
+            _cloudinary_log(f"[Cloudinary] Upload failed for {det['label']}: {e}")
+        finally:
+            crop.close()
+        return det, None
 
-        if attempt < 2:
-            time.sleep(0.5)
+    def upload_full_image():
+        try:
+            url = upload_to_cloudinary(image, "full", is_full=True, deadline=deadline)
+            if url:
+                _cloudinary_log(f"[Cloudinary] Full image uploaded: {url}")
+            return url
+        except Exception as e:
+            _cloudinary_log(f"[Cloudinary] Full image upload failed: {e}")
+            return None
 
-    return None
+    if not detections and not include_full:
+        return None, []
+    _cloudinary_log(
+        f"[Cloudinary] Uploading {len(detections)} crops{' + full image' if include_full else ''} in parallel..."
+    )
+    client = get_upload_client()
+    crop_futures = [client.submit(upload_crop_safe, det) for det in detections]
+    full_image_future = client.submit(upload_full_image) if include_full else None
+    results = [f.result() for f in crop_futures]
+    full_image_url = full_image_future.result() if full_image_future is not None else None
+    _cloudinary_log(f"[Cloudinary] Uploads complete in {time.time()-t_upload:.2f}s")
+    return full_image_url, results
 
 
 def search_visual_products(
@@ -2970,7 +3729,7 @@ def search_visual_products(
         http_timeout = 15.0  # Reduced from 30s for faster failure/retry
 
         try:
-            response = requests.get("https://www.searchapi.io/api/v1/search", params=params, timeout=http_timeout)
+            response = http_session.get(SEARCHAPI_URL, params=params, timeout=http_timeout)
             response.raise_for_status()
         except requests.exceptions.Timeout:
             print(f"[SearchAPI] HTTP timeout after {http_timeout:.1f}s on page {page}")
@@ -3096,10 +3855,143 @@ def debug_detect(req: DetectRequest):
         "results": cropped_items
     }
 
+# === WARM-UP / READINESS ===
+warmup_tracker = WarmupTracker()
+
+
+def parse_warmup_sizes(value: str) -> List[tuple]:
+    """'1080x1440,1440x1080' -> [(1080, 1440), (1440, 1080)] as (width, height)."""
+    sizes = []
+    for item in value.split(","):
+        if item.strip():
+            width, height = item.lower().split("x")
+            sizes.append((int(width), int(height)))
+    return sizes
+
+
+def warmup_image(width: int, height: int) -> Image.Image:
+    """Smooth random texture at a photo's size (a flat image is not representative)."""
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 255, (max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+    return Image.fromarray(small).resize((width, height), Image.BILINEAR)
+
+
+def preconnect_targets() -> List[tuple]:
+    """(name, callable) pairs that open a keep-alive connection to each outbound API in use."""
+    targets = []
+    if SEARCHAPI_KEY:
+        targets.append(("searchapi", lambda: http_session.head("https://www.searchapi.io/", timeout=5)))
+    if USE_RUNPOD and RUNPOD_ENDPOINT_ID:
+        targets.append(("runpod", lambda: http_session.head(RUNPOD_BASE_URL, timeout=5)))
+    if supabase_manager.enabled:
+        targets.append(("supabase", supabase_manager.ping))
+    return targets
+
+
+def warmup_steps() -> List[tuple]:
+    """Warm-up steps: (name, callable, required)."""
+    steps = []
+    if not USE_RUNPOD or RUNPOD_HEDGE:
+        # Hedged RunPod calls race local inference, so it has to be warm too
+        if INFERENCE_SOCKET:
+            # The service binds its socket only once its model is loaded and warm
+            steps.append((
+                "wait_inference_service",
+                lambda: _inference_client.wait_until_ready(timeout=WARMUP_SERVICE_WAIT_SECONDS),
+                True,
+            ))
+        else:
+            steps.append(("load_model", ensure_model_loaded, True))
+        for width, height in parse_warmup_sizes(WARMUP_IMAGE_SIZES):
+            # First pass at a new input shape pays allocation / kernel selection
+            image = warmup_image(width, height)
+            steps.append((f"detect_{width}x{height}", lambda image=image: detect_local([image], [CONF_THRESHOLD]), True))
+    # Upload pool (and, for Cloudinary, the SDK's connection pool sized to it). A
+    # misconfigured local storage keeps the worker from reporting ready
+    steps.append(("upload_client", get_upload_client, CROP_STORAGE != "cloudinary"))
+    for name, connect in preconnect_targets():
+        steps.append((f"connect_{name}", connect, False))
+    if NEAR_DUPLICATE_CACHE and supabase_manager.enabled:
+        steps.append(("load_near_duplicate_index", load_near_duplicate_index, False))
+    return steps
+
+
+def log_warmup(state: dict) -> None:
+    steps = ", ".join(f"{step['name']}={step['seconds']:.2f}s{'' if step['ok'] else ' (failed)'}" for step in state["steps"])
+    print(f"[WARMUP] PID {state['pid']} {state['status']} after {state['elapsed_s']:.2f}s: {steps}")
+    if state["error"]:
+        print(f"[WARMUP] ERROR {state['error']}")
+
+
+def start_warmup():
+    """
+    Warm up this worker: the model and dummy detections before returning (the
+    worker starts serving after lifespan startup), connections in the background.
+    """
+    if WARMUP_ON_STARTUP:
+        print(f"[WARMUP] Warming up worker PID {os.getpid()}...")
+        warmup_tracker.run(warmup_steps(), on_finish=log_warmup)
+    else:
+        warmup_tracker.skip()
+
+
 # === ROOT ===
 @app.get("/")
 def root():
+    # Liveness: the process is up, even while the model is still warming up
     return {"message": "Fashion Detector API is running!"}
 
 
+@app.get("/ready")
+def ready():
+    # Readiness: workers only start serving once warm, so whichever answers is warm
+    # unless its warm-up failed (HTTP 503 then)
+    state = warmup_tracker.snapshot()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
 
+# === CROP STORAGE ===
+@app.get(LocalStorage.ROUTE + "/{public_id}.jpg")
+def serve_crop(public_id: str, expires: int, sig: str):
+    # Only CROP_STORAGE=local (directly or behind faulty) hands out these URLs
+    storage = get_crop_storage()
+    storage = getattr(storage, "inner", storage)
+    data = storage.get(public_id, expires, sig) if isinstance(storage, LocalStorage) else None
+    if data is None:
+        raise HTTPException(status_code=404, detail="Crop not found or link expired")
+    return Response(content=data, media_type="image/jpeg", headers={"Cache-Control": "private, max-age=300"})
+
+
+# === METRICS ===
+def inference_service_metrics() -> Optional[dict]:
+    if not INFERENCE_SOCKET:
+        return None
+    try:
+        service = _inference_client.stats()
+    except Exception as e:
+        service = {"error": str(e)}
+    return {
+        "socket": INFERENCE_SOCKET,
+        "worker_rss_mb": current_rss_mb(),
+        "service": service,
+        "router": _service_router.snapshot() if _service_router else None,
+    }
+
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "pid": os.getpid(),
+        "inference_batcher": _inference_batcher.stats() if _inference_batcher else None,
+        "runpod_batcher": _runpod_batcher.stats() if _runpod_batcher else None,
+        "inference_router": _inference_router.snapshot() if _inference_router else None,
+        "inference_service": inference_service_metrics(),
+        "inference_backend": local_backend.info() if local_backend else None,
+        "backend_selection": backend_selection,
+        "detection_cache": _detection_cache.stats() if _detection_cache else None,
+        "upload_cache": _upload_cache.stats() if _upload_cache else None,
+        "upload_client": _upload_client.stats() if _upload_client else None,
+        "crop_storage": _crop_storage.info() if _crop_storage else None,
+        "near_duplicate_index": near_duplicate_index.stats() if NEAR_DUPLICATE_CACHE else None,
+        "warmup": warmup_tracker.snapshot(),
+    }
@@ -0,0 +1,56 @@
+"""
+Gunicorn settings, picked up automatically from the server directory.
+
+Worker count, timeouts etc. stay on the command line (render.yaml / Procfile);
+this file only wires up where the model lives:
+
+- PRELOAD_MODEL=true: the app is imported and the model loaded once in the
+  master, workers are forked from it and share the weights copy-on-write,
+  and each worker rebuilds only its fork-unsafe state (ONNX session, thread
+  pools, batcher) in post_fork.
+- INFERENCE_SOCKET=/path.sock: the master starts inference_service.py, the
+  single process that holds the model, and stops it on exit. Workers send
+  it their images over that Unix socket.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+preload_app = os.getenv("PRELOAD_MODEL", "false").lower() in {"1", "true", "yes"}
+inference_socket = os.getenv("INFERENCE_SOCKET", "")
+
+_inference_service = None
+
+
+def on_starting(server):
+    global _inference_service
+    if inference_socket:
+        service_script = Path(__file__).resolve().parent / "inference_service.py"
+        _inference_service = subprocess.Popen([sys.executable, str(service_script), "--socket", inference_socket])
+        server.log.info("Started inference service PID %s on %s", _inference_service.pid, inference_socket)
+
+
+def on_exit(server):
+    if _inference_service is not None and _inference_service.poll() is None:
+        _inference_service.terminate()
+        try:
+            _inference_service.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            _inference_service.kill()
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported, before any worker forks
+    if preload_app:
+        import fashion_detector_server
+
+        fashion_detector_server.preload_model()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import fashion_detector_server
+
+        fashion_detector_server.reinit_after_fork()
@@ -1,43 +1,146 @@
 """
 Image hashing utilities for duplicate detection.
-Uses SHA256 for content-based hashing.
+Content hashes cover the uploaded bytes or the decoded pixels (no
+re-encode); perceptual hashes (dHash / pHash) plus a multi-index hash
+table serve near-duplicate lookups.
 """
 
+import binascii
 import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from PIL import Image
-import io
-from typing import Union, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+def hash_bytes(data: bytes) -> str:
+    """SHA-256 of raw bytes (e.g. the uploaded file), as hex: the image_cache key."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_pixels(image: Image.Image, digest_size: int = 16) -> str:
+    """
+    Hash the decoded pixels (plus mode and size) of a PIL image.
+
+    Unlike a hash of an encoded file, the same picture always gets the same
+    key, whatever format or quality it arrived in.
+    """
+    return _update_with_pixels(hashlib.blake2b(digest_size=digest_size), image).hexdigest()
+
+
+def _update_with_pixels(digest, image: Image.Image):
+    digest.update(f"{image.mode}:{image.width}x{image.height}:".encode())
+    digest.update(image.tobytes())
+    return digest
 
 
 def hash_image(image: Union[Image.Image, bytes]) -> str:
     """
-    Generate SHA256 hash of image content.
+    Content hash of an image, as hex.
+
+    Bytes are hashed as-is. A PIL Image is hashed by its decoded pixels
+    (plus mode and size), so it needs no encode.
 
     Args:
         image: PIL Image or bytes
 
     Returns:
-        SHA256 hash as hex string
+        SHA-256 hash as hex string ("" on error)
     """
     try:
         if isinstance(image, Image.Image):
-            # Convert PIL Image to bytes
-            buffer = io.BytesIO()
-            image.save(buffer, format='JPEG')
-            image_bytes = buffer.getvalue()
-        else:
-            # Already bytes
-            image_bytes = image
-
-        # Generate SHA256 hash
-        hash_obj = hashlib.sha256(image_bytes)
-        return hash_obj.hexdigest()
+            return _update_with_pixels(hashlib.sha256(), image).hexdigest()
+        return hash_bytes(image)
 
     except Exception as e:
         print(f"Image hashing error: {e}")
         return ""
 
 
+def hash_images(images: Sequence[Union[Image.Image, bytes]], max_workers: int = 4) -> List[str]:
+    """
+    hash_image over many images, in input order. hashlib releases the GIL on
+    large buffers, so the work is spread over up to max_workers threads.
+    """
+    if len(images) <= 1 or max_workers <= 1:
+        return [hash_image(image) for image in images]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(images))) as executor:
+        return list(executor.map(hash_image, images))
+
+
+class Base64Hasher:
+    """
+    Decode base64 text incrementally while hashing the decoded bytes.
+
+    Feed chunks of any size to update(); whitespace is ignored, as in
+    base64.b64decode. decoded() and hexdigest() are available once every
+    chunk has been fed. The digest equals hash_bytes() of the decoded data,
+    so the upload is decoded and hashed in a single pass.
+    """
+
+    _WHITESPACE = b" \t\r\n\x0b\x0c"
+
+    def __init__(self, keep_decoded: bool = True):
+        self._digest = hashlib.sha256()
+        self._pending = b""
+        self._parts: Optional[List[bytes]] = [] if keep_decoded else None
+        self._finished = False
+        self.size = 0
+
+    def update(self, chunk: Union[str, bytes]) -> None:
+        if self._finished:
+            raise ValueError("Base64Hasher already finished")
+        if isinstance(chunk, str):
+            chunk = chunk.encode("ascii")
+        chunk = self._pending + chunk.translate(None, self._WHITESPACE)
+        usable = len(chunk) - len(chunk) % 4
+        self._pending = chunk[usable:]
+        if usable:
+            self._feed(binascii.a2b_base64(chunk[:usable]))
+
+    def _feed(self, data: bytes) -> None:
+        self._digest.update(data)
+        self.size += len(data)
+        if self._parts is not None:
+            self._parts.append(data)
+
+    def _finish(self) -> None:
+        if not self._finished:
+            if self._pending:
+                # Tolerate missing padding on the last block
+                self._feed(binascii.a2b_base64(self._pending + b"=" * (-len(self._pending) % 4)))
+                self._pending = b""
+            self._finished = True
+
+    def hexdigest(self) -> str:
+        self._finish()
+        return self._digest.hexdigest()
+
+    def decoded(self) -> bytes:
+        self._finish()
+        if self._parts is None:
+            raise ValueError("created with keep_decoded=False")
+        return b"".join(self._parts)
+
+
+def decode_base64_with_hash(data: Union[str, bytes], chunk_size: int = 1 << 20) -> Tuple[bytes, str]:
+    """base64.b64decode(data) and hash_bytes() of the result, in one pass."""
+    hasher = Base64Hasher()
+    for start in range(0, len(data), chunk_size):
+        hasher.update(data[start:start + chunk_size])
+    return hasher.decoded(), hasher.hexdigest()
+
+
+def hash_base64_stream(chunks: Iterable[Union[str, bytes]]) -> str:
+    """hash_bytes() of base64 text arriving in chunks, without keeping the decoded data."""
+    hasher = Base64Hasher(keep_decoded=False)
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
 def hash_url(url: str) -> str:
     """
     Generate hash of URL string.
@@ -67,3 +170,153 @@ def normalize_url(url: str) -> str:
         return normalized
     except:
         return url
+
+
+# === PERCEPTUAL HASHES ===
+# 64-bit hashes of a tiny grayscale thumbnail. Recompressing, resizing or
+# screenshotting a photo flips only a few bits, so near-duplicates are images
+# within a small Hamming distance of each other.
+
+
+def _gray_thumbnail(image: Image.Image, width: int, height: int) -> np.ndarray:
+    # reducing_gap: integer box reduce() first, so a 12 MP photo costs a few ms
+    thumb = image.convert("RGB") if image.mode not in {"RGB", "L"} else image
+    thumb = thumb.resize((width, height), Image.BILINEAR, reducing_gap=2.0)
+    return np.asarray(thumb.convert("L"), dtype=np.float64)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big")
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """Difference hash: is each pixel brighter than its right-hand neighbour?"""
+    pixels = _gray_thumbnail(image, hash_size + 1, hash_size)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+@lru_cache(maxsize=4)
+def _dct_matrix(size: int) -> np.ndarray:
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / size)
+
+
+def phash(image: Image.Image, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """
+    DCT hash: is each of the lowest-frequency DCT coefficients of a 32x32
+    thumbnail above their median? More robust to resizing and colour changes
+    than dHash.
+    """
+    size = hash_size * highfreq_factor
+    dct = _dct_matrix(size)
+    coefficients = dct @ _gray_thumbnail(image, size, size) @ dct.T
+    low = coefficients[:hash_size, :hash_size]
+    # The DC term only reflects overall brightness
+    return _bits_to_int(low > np.median(low.flatten()[1:]))
+
+
+def hash_to_hex(value: int, bits: int = 64) -> str:
+    return f"{value:0{bits // 4}x}"
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing for Hamming-distance lookups over perceptual hashes.
+
+    Each hash is split into max_distance + 1 chunks, and each chunk position
+    has its own table. Two hashes within max_distance bits of each other
+    differ in at most max_distance chunks, so at least one chunk matches
+    exactly. A lookup therefore only checks the entries that share a chunk
+    with the query (about N / 2**chunk_bits per table) instead of all N.
+    Thread-safe.
+    """
+
+    def __init__(self, max_distance: int = 6, bits: int = 64):
+        self.max_distance = max_distance
+        self.bits = bits
+        chunks = max_distance + 1
+        widths = [bits // chunks + (1 if i < bits % chunks else 0) for i in range(chunks)]
+        self._chunks = []  # (shift, mask) per chunk
+        shift = 0
+        for width in widths:
+            self._chunks.append((shift, (1 << width) - 1))
+            shift += width
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in self._chunks]
+        self._entries: List[Tuple[int, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, value_hash: int, value: Any) -> None:
+        with self._lock:
+            entry = len(self._entries)
+            self._entries.append((value_hash, value))
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                table.setdefault((value_hash >> shift) & mask, []).append(entry)
+
+    def find(self, value_hash: int, max_distance: Optional[int] = None) -> List[Tuple[int, Any]]:
+        """(distance, value) for every entry within max_distance, closest first."""
+        if max_distance is None:
+            max_distance = self.max_distance
+        if max_distance > self.max_distance:
+            raise ValueError(f"index built for distances up to {self.max_distance}, got {max_distance}")
+        with self._lock:
+            candidates = set()
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                candidates.update(table.get((value_hash >> shift) & mask, ()))
+            matches = []
+            for entry in candidates:
+                entry_hash, value = self._entries[entry]
+                distance = hamming_distance(value_hash, entry_hash)
+                if distance <= max_distance:
+                    matches.append((distance, value))
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class NearDuplicateIndex:
+    """
+    In-memory pHash index of image_cache rows, one MultiIndexHash per
+    country (cached results are country-specific).
+    """
+
+    def __init__(self, max_distance: int = 6):
+        self.max_distance = max_distance
+        self._by_country: Dict[str, MultiIndexHash] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def add(self, image_phash: Union[int, str], cache_id: Any, country: str) -> None:
+        if isinstance(image_phash, str):
+            image_phash = int(image_phash, 16)
+        with self._lock:
+            table = self._by_country.get(country)
+            if table is None:
+                table = self._by_country[country] = MultiIndexHash(self.max_distance)
+        table.add(image_phash, cache_id)
+
+    def load(self, rows: List[Dict[str, Any]]) -> int:
+        """Add {'id', 'image_phash', 'country'} rows (as stored in image_cache)."""
+        for row in rows:
+            if row.get("image_phash"):
+                self.add(row["image_phash"], row["id"], row.get("country") or "US")
+        self.loaded = True
+        return len(rows)
+
+    def find(self, image_phash: int, country: str, max_distance: Optional[int] = None) -> List[Tuple[int, Any]]:
+        table = self._by_country.get(country)
+        if table is None:
+            return []
+        return table.find(image_phash, max_distance)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = {country: len(table) for country, table in self._by_country.items()}
+        return {"loaded": self.loaded, "entries": sum(sizes.values()), "countries": sizes, "max_distance": self.max_distance}
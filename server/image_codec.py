@@ -0,0 +1,231 @@
+"""
+JPEG helpers for images sent over the wire and photos received from it.
+
+`encode_jpeg_within` picks the highest JPEG quality whose output fits a byte
+budget (binary search over quality), so payload size is bounded no matter
+how detailed the photo is, without always paying for the lowest quality.
+`encode_jpeg_budget` adds the image size to the search for a `JpegBudget`.
+
+`SourceImage` decodes an uploaded JPEG at the smallest DCT (draft) scale
+that still covers what detection needs and defers the full-resolution
+decode until a crop is actually cut from it.
+"""
+
+import base64
+import io
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple, Union
+
+from PIL import ExifTags, Image, ImageOps
+
+
+def encode_jpeg(image: Image.Image, quality: int, optimize: bool = False, progressive: bool = False) -> bytes:
+    """`optimize` computes Huffman tables for the image (a few % smaller, ~1.5x the encode time)."""
+    buffered = io.BytesIO()
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.save(buffered, format="JPEG", quality=quality, optimize=optimize, progressive=progressive)
+    return buffered.getvalue()
+
+
+def encode_jpeg_within(
+    image: Image.Image,
+    max_bytes: int,
+    min_quality: int = 50,
+    max_quality: int = 90,
+    quality_step: int = 1,
+    **jpeg_options,
+) -> Tuple[bytes, int]:
+    """
+    Encode at the highest quality in [min_quality, max_quality] that fits in
+    `max_bytes`, trying every `quality_step` below max_quality (and
+    min_quality). Returns (jpeg_bytes, quality). If even `min_quality` is too
+    big, that encoding is returned anyway (the budget is a target, not a hard
+    limit). Costs one encode when the image already fits, ~log2(candidates)
+    otherwise. `jpeg_options` go to encode_jpeg.
+    """
+    data = encode_jpeg(image, max_quality, **jpeg_options)
+    if len(data) <= max_bytes:
+        return data, max_quality
+
+    qualities = sorted({min_quality, *range(max_quality - quality_step, min_quality, -quality_step)})
+    best, best_quality = None, None
+    lowest = None  # The min_quality encoding, once tried
+    low, high = 0, len(qualities) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        candidate = encode_jpeg(image, qualities[middle], **jpeg_options)
+        if middle == 0:
+            lowest = candidate
+        if len(candidate) <= max_bytes:
+            best, best_quality = candidate, qualities[middle]
+            low = middle + 1
+        else:
+            high = middle - 1
+
+    if best is None:
+        return lowest if lowest is not None else encode_jpeg(image, min_quality, **jpeg_options), min_quality
+    return best, best_quality
+
+
+def resize_within(
+    image: Image.Image,
+    max_dim: int,
+    resample: int = Image.LANCZOS,
+    reducing_gap: Optional[float] = None,
+) -> Image.Image:
+    """`image` scaled so its longest edge is at most `max_dim` (the image itself if it already is)."""
+    w, h = image.size
+    if max_dim <= 0 or max(w, h) <= max_dim:
+        return image
+    scale = max_dim / max(w, h)
+    return image.resize((max(1, round(w * scale)), max(1, round(h * scale))), resample, reducing_gap=reducing_gap)
+
+
+@dataclass(frozen=True)
+class JpegBudget:
+    """
+    Encoding target for one class of image. The defaults trade sharpness
+    nobody looks at for speed: a box reduce to within 2x of the target and a
+    bilinear pass (~4x faster than LANCZOS on a 12 MP photo), 5-point
+    quality steps and optimised Huffman tables.
+    """
+
+    max_bytes: int
+    max_dim: int
+    min_quality: int = 50
+    max_quality: int = 85
+    quality_step: int = 5
+    min_dim: int = 320
+    optimize: bool = True
+    progressive: bool = False
+    resample: int = Image.BILINEAR
+    reducing_gap: Optional[float] = 1.0
+
+
+def encode_jpeg_budget(image: Image.Image, budget: JpegBudget) -> Tuple[bytes, int, Tuple[int, int]]:
+    """
+    Encode within `budget`: downsize to max_dim, then the highest quality that
+    fits max_bytes. When even min_quality does not fit, shrink the image (JPEG
+    size is roughly proportional to the pixel count) and search again, down to
+    min_dim. Returns (jpeg_bytes, quality, (width, height)).
+    """
+    image = resize_within(image, budget.max_dim, budget.resample, budget.reducing_gap)
+    while True:
+        data, quality = encode_jpeg_within(
+            image,
+            budget.max_bytes,
+            min_quality=budget.min_quality,
+            max_quality=budget.max_quality,
+            quality_step=budget.quality_step,
+            optimize=budget.optimize,
+            progressive=budget.progressive,
+        )
+        longest = max(image.size)
+        if len(data) <= budget.max_bytes or longest <= budget.min_dim:
+            return data, quality, image.size
+        scale = min(0.9, 0.95 * (budget.max_bytes / len(data)) ** 0.5)
+        image = resize_within(image, max(budget.min_dim, int(longest * scale)), budget.resample)
+
+
+def encode_jpeg_base64_within(image: Image.Image, max_bytes: int, **kwargs) -> Tuple[str, int]:
+    """`encode_jpeg_within`, base64-encoded for JSON payloads."""
+    data, quality = encode_jpeg_within(image, max_bytes, **kwargs)
+    return base64.b64encode(data).decode("utf-8"), quality
+
+
+# EXIF orientations that swap width and height (90/270 degree rotations)
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def decode_oriented(data: bytes, min_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """
+    Decode to an EXIF-oriented RGB image without extra full-size copies.
+
+    With `min_size` (width, height after orientation), JPEGs are decoded at
+    the smallest 1/2, 1/4 or 1/8 draft scale that is still at least that big.
+    """
+    image = Image.open(io.BytesIO(data))
+    if min_size and image.format == "JPEG":
+        width, height = min_size
+        if image.getexif().get(ExifTags.Base.Orientation, 1) in _TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+        image.draft("RGB", (width, height))
+    ImageOps.exif_transpose(image, in_place=True)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+class SourceImage:
+    """
+    An uploaded photo decoded at reduced scale, with full resolution on demand.
+
+    `width`, `height` and `size` are those of the full-resolution, oriented
+    photo, so boxes keep the coordinates clients already get back, and code
+    that only needs dimensions can take a SourceImage in place of a PIL image.
+    Pixels for detection come from `preview`. `crop` decodes the full image
+    the first time it is called (once, shared by later crops); `within`
+    serves downsized uploads from the cheapest decode that is big enough.
+    """
+
+    def __init__(self, data: bytes, min_size: Callable[[int, int], Tuple[int, int]]):
+        """`min_size(width, height)` -> smallest (width, height) the preview may have."""
+        self._data = data
+        self._full: Optional[Image.Image] = None
+        self._lock = threading.Lock()
+        with Image.open(io.BytesIO(data)) as probe:
+            width, height = probe.size
+            if probe.getexif().get(ExifTags.Base.Orientation, 1) in _TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+        self.size = (width, height)
+        self.preview = decode_oriented(data, min_size(width, height))
+        if self.preview.size == self.size:
+            # Small photo or not a JPEG: the preview already is full resolution
+            self._full = self.preview
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    @property
+    def full_decoded(self) -> bool:
+        return self._full is not None
+
+    def full(self) -> Image.Image:
+        """The full-resolution RGB image, decoded on first use."""
+        with self._lock:
+            if self._full is None:
+                self._full = decode_oriented(self._data)
+            return self._full
+
+    def crop(self, box) -> Image.Image:
+        """Crop in full-resolution coordinates, from the full-resolution pixels."""
+        return self.full().crop(box)
+
+    def within(self, max_dim: int) -> Image.Image:
+        """
+        An image whose longest edge is at least min(max_dim, full longest edge),
+        for uploads that get downsized to max_dim anyway. Reuses whatever is
+        already decoded when it is big enough, else draft-decodes at that size.
+        """
+        needed = min(max_dim, max(self.size)) if max_dim > 0 else max(self.size)
+        if self._full is not None or max(self.preview.size) >= needed:
+            return self._full if self._full is not None else self.preview
+        scale = needed / max(self.size)
+        return decode_oriented(self._data, (int(self.width * scale + 0.5), int(self.height * scale + 0.5)))
+
+    def close(self) -> None:
+        self.preview.close()
+        if self._full is not None:
+            self._full.close()
+
+
+def pixels_of(image: Union[Image.Image, SourceImage]) -> Image.Image:
+    """The PIL image to read pixels from: the preview of a SourceImage, else the image."""
+    return image.preview if isinstance(image, SourceImage) else image
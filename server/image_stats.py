@@ -0,0 +1,38 @@
+"""
+Global image statistics for the detection heuristics.
+
+They are computed once per request from the downsized detection image (a
+byproduct of the resize done for inference) instead of the full photo. For a
+12 MP photo that is ~1/15 of the pixels, and luma mean / standard deviation
+land within a fraction of a level of the full-resolution values, so the
+decisions built on them do not change.
+"""
+
+from dataclasses import dataclass
+
+from PIL import Image, ImageStat
+
+# Low light: dark overall, or dim and flat
+LOW_LIGHT_MEAN = 65
+DIM_MEAN = 85
+FLAT_STD = 25
+
+
+@dataclass(frozen=True)
+class LumaStats:
+    mean: float
+    std: float
+
+    @property
+    def low_light(self) -> bool:
+        return self.mean < LOW_LIGHT_MEAN or (self.mean < DIM_MEAN and self.std < FLAT_STD)
+
+
+def luma_stats(image: Image.Image) -> LumaStats:
+    """Mean and standard deviation of luma (ITU-R 601, as Pillow's "L" mode)."""
+    gray = image if image.mode == "L" else image.convert("L")
+    stat = ImageStat.Stat(gray)
+    return LumaStats(
+        mean=stat.mean[0] if stat.mean else 0.0,
+        std=stat.stddev[0] if stat.stddev else 0.0,
+    )
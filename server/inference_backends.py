@@ -0,0 +1,463 @@
+"""
+Pluggable inference backends.
+
+A backend loads a model, warms it up and runs `infer(images, thresholds)`,
+returning one detection list (bbox, score, label) per image, so the detection
+pipeline doesn't care what is behind it. Backends register a factory under a
+name with `register_backend`; the server picks one with INFERENCE_BACKEND.
+
+Built in: "pytorch" (transformers YOLOS), "onnx" (fp32 export) and
+"onnx-int8" (quantized export). `RunPodBackend` wraps the remote GPU call;
+the server registers it as "runpod" because it owns the HTTP plumbing.
+
+`select_backend` is the INFERENCE_BACKEND=auto path. It times each local
+candidate on sample images on this host, compares its detections with the
+reference backend's, and picks the fastest one that agrees.
+"""
+
+import fcntl
+import json
+import pickle
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+from detection_postprocess import DetectionFilter
+
+
+@dataclass(frozen=True)
+class BackendSettings:
+    """Everything a local backend needs to load the model (picklable, for auto selection)."""
+
+    model_id: str
+    shortest_edge: int
+    longest_edge: int
+    allowed_labels: FrozenSet[str]
+    category_thresholds: Dict[str, float]
+    onnx_paths: Dict[str, Path] = field(default_factory=dict)  # backend name -> exported model
+    session_config: Optional[object] = None  # onnx_engine.SessionConfig
+
+
+_REGISTRY: Dict[str, Callable[[BackendSettings], "InferenceBackend"]] = {}
+
+
+def register_backend(name: str):
+    """Decorator: make `factory(settings) -> InferenceBackend` available as `name`."""
+    def decorator(factory):
+        _REGISTRY[name] = factory
+        return factory
+    return decorator
+
+
+def available_backends() -> List[str]:
+    return sorted(_REGISTRY)
+
+
+def create_backend(name: str, settings: BackendSettings) -> "InferenceBackend":
+    if name not in _REGISTRY:
+        raise ValueError(f"Unknown inference backend {name!r} (available: {', '.join(available_backends())})")
+    return _REGISTRY[name](settings)
+
+
+class InferenceBackend:
+    """Interface every backend implements. `load` must be idempotent."""
+
+    name = ""
+    local = True  # runs on this host (an INFERENCE_BACKEND=auto candidate)
+
+    def __init__(self, settings: BackendSettings):
+        self.settings = settings
+        self.detection_filter: Optional[DetectionFilter] = None
+
+    @property
+    def loaded(self) -> bool:
+        raise NotImplementedError
+
+    def load(self) -> None:
+        raise NotImplementedError
+
+    def preload(self) -> None:
+        """Fork-safe part of `load`, run in the gunicorn master (PRELOAD_MODEL=true)."""
+        self.load()
+
+    def after_fork(self) -> None:
+        """Rebuild fork-unsafe state in a freshly forked worker."""
+
+    def warm_up(self, images: Sequence[Image.Image]) -> None:
+        """One pass per image: the first pass at a new shape pays allocation / kernel selection."""
+        for image in images:
+            self.infer([image], [0.5])
+
+    def infer(self, images: List[Image.Image], thresholds: List[float]) -> List[List[dict]]:
+        raise NotImplementedError
+
+    def info(self) -> dict:
+        return {"name": self.name}
+
+    def _build_filter(self, id2label: Dict[int, str]) -> None:
+        # Per-class keep-mask + threshold vector, built once per loaded model
+        if self.detection_filter is None:
+            self.detection_filter = DetectionFilter(
+                id2label, self.settings.allowed_labels, self.settings.category_thresholds
+            )
+
+
+def padded_target_sizes(images, resized_sizes, padded_shape) -> List[List[float]]:
+    """
+    Predicted boxes are normalised to the padded canvas, so scale by the
+    padded/resized ratio to land in original image coordinates.
+    """
+    padded_h, padded_w = padded_shape[-2], padded_shape[-1]
+    return [
+        [img.height * padded_h / h, img.width * padded_w / w]
+        for img, (h, w) in zip(images, resized_sizes)
+    ]
+
+
+@register_backend("pytorch")
+class PyTorchBackend(InferenceBackend):
+    """transformers YOLOS on torch: the reference implementation."""
+
+    name = "pytorch"
+
+    def __init__(self, settings: BackendSettings):
+        super().__init__(settings)
+        self.processor = None
+        self.model = None
+        self._threads = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self) -> None:
+        if self.model is not None:
+            return
+        # The PyTorch stack (~1s import, hundreds of MB RSS) is only imported here
+        from transformers import AutoImageProcessor, YolosForObjectDetection
+
+        self.processor = AutoImageProcessor.from_pretrained(
+            self.settings.model_id,
+            size={"shortest_edge": self.settings.shortest_edge, "longest_edge": self.settings.longest_edge},
+        )
+        model = YolosForObjectDetection.from_pretrained(self.settings.model_id)
+        model.eval()
+        self._build_filter(model.config.id2label)
+        self.model = model
+
+    def preload(self) -> None:
+        """
+        Processor, config and weights, shared copy-on-write by every worker.
+        No forward pass runs in the master and torch is held at one thread
+        meanwhile, so no OpenMP thread team exists at fork time.
+        """
+        import torch
+
+        self._threads = torch.get_num_threads()
+        torch.set_num_threads(1)
+        self.load()
+        self.model.requires_grad_(False)
+
+    def after_fork(self) -> None:
+        if self._threads:
+            import torch
+
+            torch.set_num_threads(self._threads)
+
+    def preprocess(self, images: List[Image.Image]):
+        """
+        Run the image processor over a batch and pad to a common size.
+
+        Images sharing a size go through a single processor call. Groups are
+        then zero-padded (bottom/right) to the largest resized size in the batch.
+        Returns (pixel_values, resized_sizes) where resized_sizes[i] is the
+        unpadded (height, width) of image i inside the batch tensor.
+        """
+        import torch
+
+        groups = {}
+        for idx, img in enumerate(images):
+            groups.setdefault(img.size, []).append(idx)
+
+        per_image = [None] * len(images)
+        for indices in groups.values():
+            pixel_values = self.processor(images=[images[i] for i in indices], return_tensors="pt")["pixel_values"]
+            for row, idx in enumerate(indices):
+                per_image[idx] = pixel_values[row]
+
+        resized_sizes = [(int(pv.shape[-2]), int(pv.shape[-1])) for pv in per_image]
+        max_h = max(h for h, _ in resized_sizes)
+        max_w = max(w for _, w in resized_sizes)
+        if len(groups) == 1:
+            return torch.stack(per_image), resized_sizes
+
+        batch = per_image[0].new_zeros((len(images), per_image[0].shape[0], max_h, max_w))
+        for idx, pv in enumerate(per_image):
+            h, w = resized_sizes[idx]
+            batch[idx, :, :h, :w] = pv
+        return batch, resized_sizes
+
+    def infer(self, images: List[Image.Image], thresholds: List[float]) -> List[List[dict]]:
+        import torch
+
+        pixel_values, resized_sizes = self.preprocess(images)
+        target_sizes = padded_target_sizes(images, resized_sizes, pixel_values.shape)
+        with torch.no_grad():
+            outputs = self.model(pixel_values=pixel_values)
+        # Softmax/argmax/box scaling plus label and per-class threshold filtering,
+        # vectorised over every query in the batch
+        return self.detection_filter.detect(
+            outputs.logits.cpu().numpy(), outputs.pred_boxes.cpu().numpy(), target_sizes, thresholds
+        )
+
+
+@register_backend("onnx")
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime, torch-free: numpy preprocessing and post-processing."""
+
+    name = "onnx"
+    export_command = "python export_model_to_onnx.py"
+
+    def __init__(self, settings: BackendSettings):
+        super().__init__(settings)
+        self.detector = None
+        self._metadata = None
+
+    @property
+    def model_path(self) -> Path:
+        return Path(self.settings.onnx_paths[self.name])
+
+    @property
+    def loaded(self) -> bool:
+        return self.detector is not None
+
+    def metadata(self):
+        """Export sidecar (or hub configs), with the detection resolution applied."""
+        if self._metadata is None:
+            from onnx_engine import load_model_metadata
+
+            metadata = load_model_metadata(self.model_path, self.settings.model_id)
+            self._metadata = replace(
+                metadata, shortest_edge=self.settings.shortest_edge, longest_edge=self.settings.longest_edge
+            )
+        return self._metadata
+
+    def load(self) -> None:
+        if self.detector is not None:
+            return
+        from onnx_engine import OnnxDetector
+
+        if not self.model_path.exists():
+            raise FileNotFoundError(
+                f"ONNX model not found at {self.model_path}. "
+                f"Run '{self.export_command}' first, or pick another INFERENCE_BACKEND"
+            )
+        self.detector = OnnxDetector.load(
+            self.model_path,
+            self.settings.model_id,
+            session_config=self.settings.session_config,
+            metadata=self.metadata(),
+        )
+        self._build_filter(self.detector.metadata.id2label)
+
+    def preload(self) -> None:
+        """
+        Metadata and the label filter only. A session owns thread pools and
+        copies/pre-packs its weights, so nothing about it can be shared; each
+        worker builds its own in after_fork(), before taking requests.
+        """
+        self._build_filter(self.metadata().id2label)
+
+    def after_fork(self) -> None:
+        self.load()
+
+    def infer(self, images: List[Image.Image], thresholds: List[float]) -> List[List[dict]]:
+        pixel_values, resized_sizes = self.detector.preprocessor.preprocess_batch(images)
+        target_sizes = padded_target_sizes(images, resized_sizes, pixel_values.shape)
+        if self.detector.fused_postprocess:
+            # Post-processing runs inside the graph, which only returns the
+            # (batch_index, label_id, score, x1, y1, x2, y2) rows it kept
+            rows = self.detector.run_fused(pixel_values, target_sizes, thresholds)
+            return self.detection_filter.filter_rows(rows, thresholds)
+        logits, pred_boxes = self.detector.run(pixel_values)
+        return self.detection_filter.detect(logits, pred_boxes, target_sizes, thresholds)
+
+    def info(self) -> dict:
+        return {
+            "name": self.name,
+            "model_path": str(self.model_path),
+            "fused_postprocess": self.detector.fused_postprocess if self.detector else None,
+            "session": self.detector.session_info if self.detector else None,
+        }
+
+
+@register_backend("onnx-int8")
+class OnnxInt8Backend(OnnxBackend):
+    """Dynamically quantized export (`export_model_to_onnx.py --quantize`)."""
+
+    name = "onnx-int8"
+    export_command = "python export_model_to_onnx.py --quantize"
+
+
+class RunPodBackend(InferenceBackend):
+    """Remote GPU inference; `detect(images, thresholds, image_urls)` makes the calls."""
+
+    name = "runpod"
+    local = False
+
+    def __init__(self, settings: BackendSettings, detect: Callable[..., List[List[dict]]]):
+        super().__init__(settings)
+        self.detect = detect
+
+    @property
+    def loaded(self) -> bool:
+        return True
+
+    def load(self) -> None:
+        pass
+
+    def warm_up(self, images: Sequence[Image.Image]) -> None:
+        pass  # cold starts are on RunPod's side; pre-connecting is done by the server
+
+    def infer(self, images, thresholds, image_urls=None) -> List[List[dict]]:
+        return self.detect(images, thresholds, image_urls or [None] * len(images))
+
+
+# --- INFERENCE_BACKEND=auto ---
+
+
+def box_iou(a: Sequence[float], b: Sequence[float]) -> float:
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def agreement(reference: List[List[dict]], candidate: List[List[dict]], iou_threshold: float = 0.5) -> float:
+    """
+    2 * matched / (reference boxes + candidate boxes) over all images, where a
+    match is the same label with IoU >= iou_threshold (greedy, best score
+    first). 1.0 when neither found anything.
+    """
+    matched = total = 0
+    for ref_dets, cand_dets in zip(reference, candidate):
+        total += len(ref_dets) + len(cand_dets)
+        unmatched = list(ref_dets)
+        for det in sorted(cand_dets, key=lambda d: -d["score"]):
+            best, best_iou = None, iou_threshold
+            for ref in unmatched:
+                if ref["label"] == det["label"]:
+                    iou = box_iou(ref["bbox"], det["bbox"])
+                    if iou >= best_iou:
+                        best, best_iou = ref, iou
+            if best is not None:
+                unmatched.remove(best)
+                matched += 1
+    return 2 * matched / total if total else 1.0
+
+
+def select_backend(
+    settings: BackendSettings,
+    candidates: Sequence[str],
+    images: Sequence[Image.Image],
+    reference: str = "pytorch",
+    threshold: float = 0.1,
+    runs: int = 3,
+    min_agreement: float = 0.9,
+) -> dict:
+    """
+    Load, warm up and time every candidate on `images` (one at a time, median
+    of `runs` passes), score its detections against `reference`, and return
+    a report whose "selected" is the fastest candidate that agrees. The low
+    `threshold` keeps more boxes in the comparison than production would.
+    """
+    thresholds = [threshold] * len(images)
+    order = [reference] + [name for name in candidates if name != reference]
+    results = {}
+    reference_detections = None
+    for name in order:
+        entry = results.setdefault(name, {})
+        backend = None
+        try:
+            backend = create_backend(name, settings)
+            start = time.perf_counter()
+            backend.load()
+            entry["load_s"] = round(time.perf_counter() - start, 3)
+            backend.warm_up(images)
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                detections = [backend.infer([image], [thr])[0] for image, thr in zip(images, thresholds)]
+                timings.append((time.perf_counter() - start) * 1000 / len(images))
+            entry["latency_ms"] = round(float(np.median(timings)), 1)
+        except Exception as exc:
+            entry.update(ok=False, error=f"{type(exc).__name__}: {exc}")
+            continue
+        finally:
+            del backend
+
+        if reference_detections is None:
+            # The reference itself, or the first backend that loads if it can't
+            reference_detections = detections
+            entry["reference"] = True
+        entry["agreement"] = round(agreement(reference_detections, detections), 3)
+        entry["ok"] = entry["agreement"] >= min_agreement
+
+    passing = [name for name in order if name in candidates and results[name].get("ok")]
+    if not passing:
+        raise RuntimeError(f"No inference backend passed the self-benchmark: {json.dumps(results)}")
+    selected = min(passing, key=lambda name: results[name]["latency_ms"])
+    return {"selected": selected, "reference": reference, "min_agreement": min_agreement, "candidates": results}
+
+
+def select_backend_isolated(*args, **kwargs) -> dict:
+    """
+    `select_backend` in a fresh interpreter, so the losers' models (and torch)
+    don't stay resident. A plain subprocess rather than multiprocessing: it
+    must not re-import the caller's __main__ (gunicorn, a script...).
+    """
+    result = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve())],
+        input=pickle.dumps((args, kwargs)),
+        stdout=subprocess.PIPE,
+        cwd=Path(__file__).resolve().parent,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Backend self-benchmark exited with status {result.returncode}")
+    return json.loads(result.stdout.decode("utf-8").splitlines()[-1])
+
+
+def cached_selection(cache_path: Path, key: dict, select: Callable[[], dict]) -> dict:
+    """
+    Reuse a previous report for the same `key` (host, models, settings) or
+    run `select` once. A lock file makes concurrently starting workers wait
+    for the first one's result instead of benchmarking against each other.
+    """
+    cache_path = Path(cache_path)
+    with open(cache_path.with_suffix(cache_path.suffix + ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            cached = json.loads(cache_path.read_text())
+            if cached.get("key") == key:
+                return {**cached["report"], "cached": True}
+        except (OSError, ValueError):
+            pass
+        report = select()
+        cache_path.write_text(json.dumps({"key": key, "report": report}, indent=2))
+        return {**report, "cached": False}
+
+
+if __name__ == "__main__":
+    # select_backend_isolated: pickled (args, kwargs) in, JSON report as the last stdout line.
+    # Use the module proper (the pickled settings refer to it), not this __main__ copy
+    import inference_backends
+
+    call_args, call_kwargs = pickle.load(sys.stdin.buffer)
+    print(json.dumps(inference_backends.select_backend(*call_args, **call_kwargs)))
@@ -0,0 +1,167 @@
+"""
+In-process micro-batching scheduler for detection inference.
+
+Concurrent requests submit single items (e.g. an image + threshold). A
+background thread groups them for up to `max_wait_ms` or `max_batch_size`
+items, runs one batched call and fans the per-item results back out to
+the waiting callers. With a `key`, only items with equal keys share a batch
+(e.g. images with the same resized shape, so none is padded to another's).
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, List, Optional
+
+from perf_stats import Histogram
+
+
+BATCH_SIZE_BUCKETS = (1, 2, 3, 4, 6, 8, 12, 16, 32)
+
+
+class InferenceBatcher:
+    """
+    Groups concurrent submissions into batches for `run_batch`.
+
+    `run_batch` receives a list of submitted items and must return a list of
+    results of the same length and order. If it raises, every caller in
+    that batch receives the exception.
+
+    `key(item)`, if given, is computed on submit. A batch is the oldest
+    queued item plus later items with the same key; the others keep their
+    place in the queue for a following batch.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 4,
+        max_wait_ms: float = 10.0,
+        name: str = "inference",
+        key: Optional[Callable[[Any], Hashable]] = None,
+    ):
+        self.run_batch = run_batch
+        self.key = key
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.name = name
+
+        self.batch_size_hist = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_hist = Histogram()
+        self.batch_run_hist = Histogram()
+
+        self._cond = threading.Condition()
+        self._queue: deque = deque()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._closed = False
+
+    # --- public API ---
+
+    def submit(self, item: Any) -> Future:
+        """Enqueue an item and return a Future for its result."""
+        future: Future = Future()
+        key = self.key(item) if self.key is not None else None
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} batcher is closed")
+            self._ensure_worker()
+            self._queue.append((item, future, time.perf_counter(), key))
+            self._cond.notify()
+        return future
+
+    def run(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Submit an item and block until its result is available."""
+        return self.submit(item).result(timeout=timeout)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued = len(self._queue)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queued": queued,
+            "batch_size": self.batch_size_hist.snapshot(),
+            "queue_wait_ms": self.queue_wait_hist.snapshot(),
+            "batch_run_ms": self.batch_run_hist.snapshot(),
+        }
+
+    # --- worker ---
+
+    def _ensure_worker(self) -> None:
+        # Threads don't survive fork: restart the worker in a new process
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        if self._pid != pid:
+            self._queue.clear()
+        self._pid = pid
+        self._thread = threading.Thread(
+            target=self._loop, name=f"{self.name}-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def _next_batch(self) -> List[tuple]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return []
+
+            # Wait for more items until the oldest one has waited max_wait_ms
+            _, _, enqueued, key = self._queue[0]
+            deadline = enqueued + self.max_wait_ms / 1000.0
+            while self._matching(key) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch, rest = [], deque()
+            for entry in self._queue:
+                if len(batch) < self.max_batch_size and entry[3] == key:
+                    batch.append(entry)
+                else:
+                    rest.append(entry)
+            self._queue = rest
+            return batch
+
+    def _matching(self, key: Hashable) -> int:
+        return sum(1 for entry in self._queue if entry[3] == key)
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+
+            started = time.perf_counter()
+            self.batch_size_hist.observe(len(batch))
+            for _, _, enqueued, _ in batch:
+                self.queue_wait_hist.observe((started - enqueued) * 1000.0)
+
+            items = [item for item, _, _, _ in batch]
+            futures = [future for _, future, _, _ in batch]
+            try:
+                results = self.run_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name} batch returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as exc:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+            else:
+                for future, result in zip(futures, results):
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                self.batch_run_hist.observe((time.perf_counter() - started) * 1000.0)
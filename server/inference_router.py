@@ -0,0 +1,250 @@
+"""
+Routes detection between a remote backend (RunPod) and local inference.
+
+- `CircuitBreaker`: after `failure_threshold` consecutive failed or slow
+  remote calls, requests go straight to local inference for
+  `reset_timeout` seconds. Then a single probe call is let through
+  (half-open); its outcome closes the breaker or opens it again.
+- Hedging (optional): if the remote call has not answered within the
+  `hedge_percentile` of its recent latencies, local inference starts too
+  and the first successful result wins.
+- Per-backend latency histograms and call / error / hedge counters,
+  snapshotted for /metrics.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from perf_stats import Histogram
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        slow_call_seconds: float = 20.0,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.slow_call_seconds = float(slow_call_seconds)
+        self.reset_timeout = float(reset_timeout)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self._opened_at = 0.0
+
+    def allow_request(self) -> bool:
+        """Whether the next call may go to the remote backend."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                # Let exactly one probe through; everyone else stays local
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record(self, ok: bool, seconds: float) -> None:
+        """Record a finished remote call. Slow successes count as failures."""
+        healthy = ok and seconds < self.slow_call_seconds
+        with self._lock:
+            if healthy:
+                self.consecutive_failures = 0
+                self.state = self.CLOSED
+                return
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+                "failure_threshold": self.failure_threshold,
+                "slow_call_seconds": self.slow_call_seconds,
+                "reset_timeout": self.reset_timeout,
+            }
+
+
+class BackendStats:
+    """Latency histogram, call/error counts and a window of recent latencies."""
+
+    def __init__(self, window: int = 200):
+        self.latency_ms = Histogram()
+        self._lock = threading.Lock()
+        self._recent_ms = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+
+    def observe(self, ok: bool, elapsed_ms: float) -> None:
+        self.latency_ms.observe(elapsed_ms)
+        with self._lock:
+            self.calls += 1
+            if ok:
+                self._recent_ms.append(elapsed_ms)
+            else:
+                self.errors += 1
+
+    def percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """Percentile of recent successful latencies (ms), or None if too few."""
+        with self._lock:
+            if len(self._recent_ms) < max(1, min_samples):
+                return None
+            return float(np.percentile(self._recent_ms, q))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            calls, errors = self.calls, self.errors
+        return {
+            "calls": calls,
+            "errors": errors,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "latency_ms": self.latency_ms.snapshot(),
+        }
+
+
+class InferenceRouter:
+    """
+    Sends `run(*args)` to `remote` when the breaker allows it, falling back
+    to (or hedging with) `local`. Both callables take the same arguments and
+    return the same result type.
+    """
+
+    def __init__(
+        self,
+        remote: Callable[..., Any],
+        local: Callable[..., Any],
+        breaker: Optional[CircuitBreaker] = None,
+        hedge: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_ms: float = 500.0,
+        hedge_default_ms: float = 5000.0,
+        hedge_min_samples: int = 10,
+        remote_name: str = "runpod",
+        local_name: str = "local",
+        log: Optional[Callable[[str], None]] = None,
+    ):
+        self.remote = remote
+        self.local = local
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_ms = hedge_min_ms
+        self.hedge_default_ms = hedge_default_ms
+        self.hedge_min_samples = hedge_min_samples
+        self.remote_name = remote_name
+        self.local_name = local_name
+        self._log = log or (lambda message: None)
+
+        self.stats = {remote_name: BackendStats(), local_name: BackendStats()}
+        self._counters_lock = threading.Lock()
+        self.counters = {"short_circuited": 0, "fallbacks": 0, "hedged": 0, "hedge_wins": {remote_name: 0, local_name: 0}}
+        # Remote calls outlive a lost hedge race, so they run on their own pool
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="inference-router")
+
+    # --- public API ---
+
+    def run(self, *args):
+        if not self.breaker.allow_request():
+            self._count("short_circuited")
+            return self._call_local(*args)
+
+        if not self.hedge:
+            try:
+                return self._call_remote(*args)
+            except Exception as exc:
+                self._count("fallbacks")
+                self._log(f"[ERROR] {self.remote_name} failed: {exc}. Falling back to {self.local_name} detection.")
+                return self._call_local(*args)
+
+        remote_future = self._executor.submit(self._call_remote, *args)
+        try:
+            return remote_future.result(timeout=self.hedge_delay_ms() / 1000.0)
+        except FutureTimeoutError:
+            pass
+        except Exception as exc:
+            self._count("fallbacks")
+            self._log(f"[ERROR] {self.remote_name} failed: {exc}. Falling back to {self.local_name} detection.")
+            return self._call_local(*args)
+
+        # Remote is slower than usual: race it against local inference
+        self._count("hedged")
+        self._log(f"[PERF] {self.remote_name} slower than {self.hedge_delay_ms():.0f}ms - hedging with {self.local_name}")
+        local_future = self._executor.submit(self._call_local, *args)
+        pending = {remote_future, local_future}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = self.remote_name if future is remote_future else self.local_name
+                    with self._counters_lock:
+                        self.counters["hedge_wins"][winner] += 1
+                    return future.result()
+        return local_future.result()  # both failed: surface the local error
+
+    def hedge_delay_ms(self) -> float:
+        """How long to wait for the remote before hedging."""
+        observed = self.stats[self.remote_name].percentile(self.hedge_percentile, self.hedge_min_samples)
+        return max(self.hedge_min_ms, observed if observed is not None else self.hedge_default_ms)
+
+    def snapshot(self) -> dict:
+        with self._counters_lock:
+            counters = {**self.counters, "hedge_wins": dict(self.counters["hedge_wins"])}
+        return {
+            "breaker": self.breaker.snapshot(),
+            "hedge": self.hedge,
+            "hedge_delay_ms": round(self.hedge_delay_ms(), 1) if self.hedge else None,
+            **counters,
+            "backends": {name: stats.snapshot() for name, stats in self.stats.items()},
+        }
+
+    # --- internals ---
+
+    def _count(self, key: str) -> None:
+        with self._counters_lock:
+            self.counters[key] += 1
+
+    def _call_remote(self, *args):
+        start = time.perf_counter()
+        try:
+            result = self.remote(*args)
+        except Exception:
+            elapsed = time.perf_counter() - start
+            self.stats[self.remote_name].observe(False, elapsed * 1000.0)
+            self.breaker.record(False, elapsed)
+            raise
+        elapsed = time.perf_counter() - start
+        self.stats[self.remote_name].observe(True, elapsed * 1000.0)
+        self.breaker.record(True, elapsed)
+        return result
+
+    def _call_local(self, *args):
+        start = time.perf_counter()
+        try:
+            result = self.local(*args)
+        except Exception:
+            self.stats[self.local_name].observe(False, (time.perf_counter() - start) * 1000.0)
+            raise
+        self.stats[self.local_name].observe(True, (time.perf_counter() - start) * 1000.0)
+        return result
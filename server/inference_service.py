@@ -0,0 +1,294 @@
+"""
+Out-of-process inference server shared by every API worker on the host.
+
+One process loads the model, owns the whole CPU thread budget and batches
+detections from all gunicorn workers through an InferenceBatcher. Workers
+talk to it over a Unix socket with `InferenceClient`, so the model is held
+in memory once instead of once per worker.
+
+Wire format (both directions): 4-byte big-endian header length, a JSON
+header, then `payload_bytes` raw bytes.
+  request  {"op": "detect", "images": [{"width", "height", "threshold"}, ...]}
+           + the images' RGB pixels, concatenated
+  request  {"op": "stats"}
+  response {"results": [[detection, ...], ...]} | {"stats": {...}} | {"error": "..."}
+
+Usage:
+    python inference_service.py [--socket /tmp/snaplook-inference.sock]
+
+gunicorn.conf.py starts it automatically when INFERENCE_SOCKET is set.
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Callable, Hashable, List, Optional
+
+from PIL import Image
+
+from inference_batcher import InferenceBatcher
+from perf_stats import current_rss_mb
+
+HEADER_LENGTH = struct.Struct(">I")
+
+
+def send_frame(sock: socket.socket, header: dict, payload: bytes = b"") -> None:
+    data = json.dumps({**header, "payload_bytes": len(payload)}).encode("utf-8")
+    sock.sendall(HEADER_LENGTH.pack(len(data)) + data)
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if not count:
+            raise ConnectionError("inference socket closed mid-frame")
+        received += count
+    return bytes(buffer)
+
+
+def recv_frame(sock: socket.socket):
+    """Returns (header, payload), or (None, b"") if the peer closed cleanly."""
+    prefix = sock.recv(HEADER_LENGTH.size, socket.MSG_WAITALL)
+    if not prefix:
+        return None, b""
+    if len(prefix) < HEADER_LENGTH.size:
+        prefix += recv_exactly(sock, HEADER_LENGTH.size - len(prefix))
+    (length,) = HEADER_LENGTH.unpack(prefix)
+    header = json.loads(recv_exactly(sock, length))
+    payload_bytes = header.pop("payload_bytes", 0)
+    return header, recv_exactly(sock, payload_bytes) if payload_bytes else b""
+
+
+class InferenceService:
+    """
+    Serves `run_batch(images, thresholds) -> detections per image` on a Unix
+    socket. Each connection gets a thread; their images are queued into one
+    batcher so concurrent workers share forward passes.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        run_batch: Callable[[List[Image.Image], List[float]], List[List[dict]]],
+        max_batch_size: int = 4,
+        max_wait_ms: float = 15.0,
+        batch_key: Optional[Callable[[tuple], Hashable]] = None,
+    ):
+        self.socket_path = socket_path
+        self.batcher = InferenceBatcher(
+            lambda items: run_batch([img for img, _ in items], [thr for _, thr in items]),
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name="inference_service",
+            key=batch_key,
+        )
+        self.started_at = time.time()
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def bind(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # stale socket from a previous run
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, self._request_handler())
+        self._server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600)
+
+    def serve_forever(self) -> None:
+        if self._server is None:
+            self.bind()
+        self._server.serve_forever()
+
+    def start(self) -> "InferenceService":
+        """Serve from a background thread (tests, benchmarks)."""
+        self.bind()
+        self._thread = threading.Thread(target=self._server.serve_forever, name="inference-service", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self.batcher.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests, connections = self.requests, self.connections
+        return {
+            "pid": os.getpid(),
+            "rss_mb": current_rss_mb(),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "requests": requests,
+            "open_connections": connections,
+            "batcher": self.batcher.stats(),
+        }
+
+    def detect(self, header: dict, payload: bytes) -> List[List[dict]]:
+        images, thresholds, offset = [], [], 0
+        for item in header["images"]:
+            size = item["width"] * item["height"] * 3
+            images.append(Image.frombytes("RGB", (item["width"], item["height"]), payload[offset:offset + size]))
+            thresholds.append(item["threshold"])
+            offset += size
+        futures = [self.batcher.submit(pair) for pair in zip(images, thresholds)]
+        return [future.result() for future in futures]
+
+    def _request_handler(self):
+        service = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with service._lock:
+                    service.connections += 1
+                try:
+                    while True:
+                        header, payload = recv_frame(self.request)
+                        if header is None:
+                            return
+                        with service._lock:
+                            service.requests += 1
+                        try:
+                            if header.get("op") == "detect":
+                                response = {"results": service.detect(header, payload)}
+                            elif header.get("op") == "stats":
+                                response = {"stats": service.stats()}
+                            else:
+                                response = {"error": f"unknown op {header.get('op')!r}"}
+                        except Exception as exc:
+                            response = {"error": f"{type(exc).__name__}: {exc}"}
+                        send_frame(self.request, response)
+                except (ConnectionError, OSError):
+                    return
+                finally:
+                    with service._lock:
+                        service.connections -= 1
+
+        return Handler
+
+
+class InferenceClient:
+    """
+    Thin per-worker client. Keeps one connection per thread (reopened after a
+    fork or an error) and raises on timeouts or service errors so callers can
+    fall back to in-process inference.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 10.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def detect_batch(self, images: List[Image.Image], thresholds: List[float]) -> List[List[dict]]:
+        items, pixels = [], []
+        for image, threshold in zip(images, thresholds):
+            rgb = image if image.mode == "RGB" else image.convert("RGB")
+            items.append({"width": rgb.width, "height": rgb.height, "threshold": float(threshold)})
+            pixels.append(rgb.tobytes())
+        return self._request({"op": "detect", "images": items}, b"".join(pixels))["results"]
+
+    def stats(self) -> dict:
+        return self._request({"op": "stats"})["stats"]
+
+    def wait_until_ready(self, timeout: float = 300.0, interval: float = 0.5) -> dict:
+        """Poll until the service answers (it binds only once the model is warm)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.stats()
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(interval)
+
+    def close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None or self._local.pid != os.getpid():
+            # A forked child must not share its parent's connection
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock, self._local.pid = sock, os.getpid()
+        return sock
+
+    def _request(self, header: dict, payload: bytes = b"") -> dict:
+        sock = self._connection()
+        try:
+            send_frame(sock, header, payload)
+            response, _ = recv_frame(sock)
+        except OSError:
+            self.close()
+            raise
+        if response is None:
+            self.close()
+            raise ConnectionError("inference service closed the connection")
+        if "error" in response:
+            raise RuntimeError(f"inference service: {response['error']}")
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=os.getenv("INFERENCE_SOCKET") or "/tmp/snaplook-inference.sock")
+    args = parser.parse_args()
+
+    # This process is the only one running the model: give it the whole
+    # thread budget and make sure it doesn't try to reach itself
+    os.environ["WEB_CONCURRENCY"] = "1"
+    os.environ["INFERENCE_SOCKET"] = ""
+    import fashion_detector_server as server
+
+    start = time.time()
+    backend = server.ensure_model_loaded()
+    backend.warm_up([
+        server.resize_for_detection(server.warmup_image(width, height))
+        for width, height in server.parse_warmup_sizes(server.WARMUP_IMAGE_SIZES)
+    ])
+
+    service = InferenceService(
+        args.socket,
+        server.infer_batch,
+        max_batch_size=server.INFERENCE_BATCH_MAX_SIZE,
+        max_wait_ms=server.INFERENCE_BATCH_MAX_WAIT_MS,
+        batch_key=server.detection_batch_key,
+    )
+    service.bind()
+    print(
+        f"[INFERENCE] Service PID {os.getpid()} ({backend.name}) ready on {args.socket} in {time.time() - start:.2f}s "
+        f"(batch<={server.INFERENCE_BATCH_MAX_SIZE}, wait<={server.INFERENCE_BATCH_MAX_WAIT_MS}ms, "
+        f"rss={current_rss_mb()}MB)"
+    )
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Torch-free ONNX inference engine for YOLOS.
+
+Preprocessing (resize, rescale, normalise, pad) is done with Pillow + numpy
+and model metadata is read from plain JSON, so USE_ONNX workers never import
+torch or the transformers model classes. Sessions are built by
+`create_session` from an explicit `SessionConfig` (thread budget, spinning,
+graph optimisation + cached optimised model, memory arena).
+"""
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+DEFAULT_IMAGE_MEAN = (0.485, 0.456, 0.406)
+DEFAULT_IMAGE_STD = (0.229, 0.224, 0.225)
+
+# Output of graphs exported with --fused-postprocess:
+# (num_kept, 7) rows of (batch_index, label_id, score, x1, y1, x2, y2)
+FUSED_OUTPUT_NAME = "detections"
+
+# fp32 is the plain export; int8 is the dynamically quantized copy written by
+# export_model_to_onnx.py --quantize next to it
+ONNX_MODEL_VARIANTS = ("fp32", "int8")
+
+
+@dataclass
+class ModelMetadata:
+    """Label map and preprocessing settings needed to run the exported model."""
+    id2label: Dict[int, str]
+    shortest_edge: int = 800
+    longest_edge: Optional[int] = 1333
+    image_mean: Tuple[float, ...] = DEFAULT_IMAGE_MEAN
+    image_std: Tuple[float, ...] = DEFAULT_IMAGE_STD
+    rescale_factor: float = 1 / 255
+    resample: int = Image.BILINEAR
+    extra: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_configs(cls, config: dict, preprocessor_config: dict) -> "ModelMetadata":
+        """Build from Hugging Face config.json + preprocessor_config.json dicts."""
+        size = preprocessor_config.get("size", 800)
+        if isinstance(size, dict):
+            shortest_edge = size.get("shortest_edge", 800)
+            longest_edge = size.get("longest_edge", preprocessor_config.get("max_size"))
+        else:
+            shortest_edge = size
+            longest_edge = preprocessor_config.get("max_size", 1333)
+
+        return cls(
+            id2label={int(k): v for k, v in config["id2label"].items()},
+            shortest_edge=int(shortest_edge),
+            longest_edge=int(longest_edge) if longest_edge else None,
+            image_mean=tuple(preprocessor_config.get("image_mean", DEFAULT_IMAGE_MEAN)),
+            image_std=tuple(preprocessor_config.get("image_std", DEFAULT_IMAGE_STD)),
+            rescale_factor=float(preprocessor_config.get("rescale_factor", 1 / 255)),
+            resample=int(preprocessor_config.get("resample", Image.BILINEAR)),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "id2label": {str(k): v for k, v in self.id2label.items()},
+            "shortest_edge": self.shortest_edge,
+            "longest_edge": self.longest_edge,
+            "image_mean": list(self.image_mean),
+            "image_std": list(self.image_std),
+            "rescale_factor": self.rescale_factor,
+            "resample": self.resample,
+            **self.extra,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ModelMetadata":
+        known = {"id2label", "shortest_edge", "longest_edge", "image_mean", "image_std", "rescale_factor", "resample"}
+        return cls(
+            id2label={int(k): v for k, v in data["id2label"].items()},
+            shortest_edge=int(data.get("shortest_edge", 800)),
+            longest_edge=data.get("longest_edge", 1333),
+            image_mean=tuple(data.get("image_mean", DEFAULT_IMAGE_MEAN)),
+            image_std=tuple(data.get("image_std", DEFAULT_IMAGE_STD)),
+            rescale_factor=float(data.get("rescale_factor", 1 / 255)),
+            resample=int(data.get("resample", Image.BILINEAR)),
+            extra={k: v for k, v in data.items() if k not in known},
+        )
+
+
+def metadata_path_for(onnx_path: Path) -> Path:
+    """Sidecar JSON written next to the exported model."""
+    return Path(onnx_path).with_suffix(".json")
+
+
+def variant_model_path(onnx_path: Path, variant: str) -> Path:
+    """yolos_fashionpedia.onnx -> yolos_fashionpedia_int8.onnx for variant "int8"."""
+    if variant not in ONNX_MODEL_VARIANTS:
+        raise ValueError(f"Unknown ONNX model variant {variant!r}, expected one of {ONNX_MODEL_VARIANTS}")
+    onnx_path = Path(onnx_path)
+    if variant == "fp32":
+        return onnx_path
+    return onnx_path.with_name(f"{onnx_path.stem}_{variant}{onnx_path.suffix}")
+
+
+def load_model_metadata(onnx_path: Path, model_id: str) -> ModelMetadata:
+    """
+    Load metadata from the export sidecar if present, otherwise fetch the
+    model's config.json / preprocessor_config.json from the Hugging Face hub.
+    """
+    sidecar = metadata_path_for(onnx_path)
+    if sidecar.exists():
+        with open(sidecar, "r", encoding="utf-8") as f:
+            return ModelMetadata.from_dict(json.load(f))
+
+    from huggingface_hub import hf_hub_download
+
+    with open(hf_hub_download(model_id, "config.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    with open(hf_hub_download(model_id, "preprocessor_config.json"), "r", encoding="utf-8") as f:
+        preprocessor_config = json.load(f)
+    return ModelMetadata.from_configs(config, preprocessor_config)
+
+
+def get_resize_size(
+    height: int,
+    width: int,
+    shortest_edge: int,
+    longest_edge: Optional[int] = None,
+    mod_size: int = 16,
+) -> Tuple[int, int]:
+    """
+    Output (height, width) for YOLOS resizing: shortest edge to `shortest_edge`,
+    capped so the longest edge stays within `longest_edge`, both rounded down
+    to a multiple of the patch size.
+    """
+    size = shortest_edge
+    raw_size = None
+    if longest_edge is not None:
+        min_original = float(min(height, width))
+        max_original = float(max(height, width))
+        if max_original / min_original * size > longest_edge:
+            raw_size = longest_edge * min_original / max_original
+            size = int(round(raw_size))
+
+    if width < height:
+        ow = size
+        oh = int((raw_size if raw_size is not None else size) * height / width)
+    elif (height <= width and height == size) or (width <= height and width == size):
+        oh, ow = height, width
+    else:
+        oh = size
+        ow = int((raw_size if raw_size is not None else size) * width / height)
+
+    if mod_size:
+        ow -= ow % mod_size
+        oh -= oh % mod_size
+    return oh, ow
+
+
+class YolosPreprocessor:
+    """Pillow/numpy replacement for the YOLOS image processor."""
+
+    def __init__(self, metadata: ModelMetadata):
+        self.metadata = metadata
+        self._mean = np.asarray(metadata.image_mean, dtype=np.float32)
+        self._inv_std = 1.0 / np.asarray(metadata.image_std, dtype=np.float32)
+
+    def preprocess(self, image: Image.Image) -> np.ndarray:
+        """Resize and normalise one image into a (3, H, W) float32 array."""
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        oh, ow = get_resize_size(
+            image.height, image.width, self.metadata.shortest_edge, self.metadata.longest_edge
+        )
+        if (ow, oh) != image.size:
+            image = image.resize((ow, oh), self.metadata.resample)
+
+        pixels = np.asarray(image, dtype=np.float32)
+        pixels *= self.metadata.rescale_factor
+        pixels -= self._mean
+        pixels *= self._inv_std
+        return np.ascontiguousarray(pixels.transpose(2, 0, 1))
+
+    def preprocess_batch(self, images: Sequence[Image.Image]) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+        """
+        Preprocess a batch and zero-pad (bottom/right) to a common size.
+        Returns (pixel_values, resized_sizes) like the torch path.
+        """
+        arrays = [self.preprocess(image) for image in images]
+        resized_sizes = [(a.shape[1], a.shape[2]) for a in arrays]
+        max_h = max(h for h, _ in resized_sizes)
+        max_w = max(w for _, w in resized_sizes)
+
+        batch = np.zeros((len(arrays), 3, max_h, max_w), dtype=np.float32)
+        for idx, array in enumerate(arrays):
+            h, w = resized_sizes[idx]
+            batch[idx, :, :h, :w] = array
+        return batch, resized_sizes
+
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+@dataclass
+class SessionConfig:
+    """CPU session settings applied by `create_session`."""
+    intra_op_threads: int = 1
+    inter_op_threads: int = 1
+    # Spinning keeps idle pool threads busy-waiting for the next op; with
+    # several workers per box that burns CPU the other workers need
+    allow_spinning: bool = False
+    graph_optimization: str = "all"
+    # Save the optimised graph next to the model and load it directly next time
+    cache_optimized_model: bool = False
+    cpu_mem_arena: bool = True
+    # Memory patterns are planned per input shape; with variable image sizes
+    # they are rarely reused and only hold on to extra buffers
+    mem_pattern: bool = False
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: affinity mask, capped by a cgroup CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # Containers often see every host CPU but are throttled to a quota
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "r", encoding="utf-8") as f:  # cgroup v2
+            limit, period = f.read().split()[:2]
+            if limit != "max":
+                quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r", encoding="utf-8") as f:  # cgroup v1
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r", encoding="utf-8") as f:
+                period = int(f.read())
+            if limit > 0 and period > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        cpus = min(cpus, max(1, int(quota)))
+    return max(1, cpus)
+
+
+def per_worker_threads(workers: int, cpus: Optional[int] = None) -> int:
+    """Split the available CPUs evenly between the worker processes on this host."""
+    cpus = available_cpus() if cpus is None else cpus
+    return max(1, cpus // max(1, workers))
+
+
+def optimized_model_path(onnx_path: Path, graph_optimization: str) -> Path:
+    """
+    Cache file for the optimised graph. Level "all" applies hardware-specific
+    layout transforms, so the name pins the optimisation level and the ORT
+    version; the file is only reused on the host that wrote it.
+    """
+    import onnxruntime as ort
+
+    onnx_path = Path(onnx_path)
+    return onnx_path.with_name(f"{onnx_path.stem}.{graph_optimization}-ort{ort.__version__}.optimized.onnx")
+
+
+def create_session(onnx_path: Path, config: SessionConfig, providers: Optional[List[str]] = None):
+    """
+    Build an InferenceSession from `config`.
+
+    Returns (session, info) where info is the effective configuration plus
+    which file was loaded and what happened with the optimised-model cache.
+    """
+    import onnxruntime as ort
+
+    if config.graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(
+            f"Unknown graph optimization {config.graph_optimization!r}, "
+            f"expected one of {tuple(GRAPH_OPTIMIZATION_LEVELS)}"
+        )
+
+    onnx_path = Path(onnx_path)
+    providers = providers or ["CPUExecutionProvider"]
+    level = getattr(ort.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[config.graph_optimization])
+
+    def make_options(optimization_level, save_to=None):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = config.intra_op_threads
+        options.inter_op_num_threads = config.inter_op_threads
+        # Inter-op threads only matter when independent graph branches run in parallel
+        options.execution_mode = (
+            ort.ExecutionMode.ORT_PARALLEL if config.inter_op_threads > 1 else ort.ExecutionMode.ORT_SEQUENTIAL
+        )
+        spinning = "1" if config.allow_spinning else "0"
+        options.add_session_config_entry("session.intra_op.allow_spinning", spinning)
+        options.add_session_config_entry("session.inter_op.allow_spinning", spinning)
+        options.enable_cpu_mem_arena = config.cpu_mem_arena
+        options.enable_mem_pattern = config.mem_pattern
+        options.graph_optimization_level = optimization_level
+        if save_to is not None:
+            options.optimized_model_filepath = str(save_to)
+        return options
+
+    info = {**config.to_dict(), "model_path": str(onnx_path), "loaded_from": str(onnx_path)}
+
+    cache = None
+    if config.cache_optimized_model and config.graph_optimization != "disable":
+        cache = optimized_model_path(onnx_path, config.graph_optimization)
+        if cache.exists() and cache.stat().st_mtime >= onnx_path.stat().st_mtime:
+            try:
+                # Already optimised: skip the optimisation passes entirely
+                session = ort.InferenceSession(
+                    str(cache),
+                    sess_options=make_options(ort.GraphOptimizationLevel.ORT_DISABLE_ALL),
+                    providers=providers,
+                )
+                info.update(optimized_model_cache="hit", loaded_from=str(cache))
+                return session, info
+            except Exception as e:
+                print(f"[MODEL] Ignoring unreadable optimised model {cache}: {e}")
+
+    if cache is None:
+        info["optimized_model_cache"] = "off"
+        session = ort.InferenceSession(str(onnx_path), sess_options=make_options(level), providers=providers)
+        return session, info
+
+    if not os.access(cache.parent, os.W_OK):
+        info["optimized_model_cache"] = "read-only"
+        session = ort.InferenceSession(str(onnx_path), sess_options=make_options(level), providers=providers)
+        return session, info
+
+    # Workers may start together: write to a private file, then rename into place
+    tmp_path = cache.with_name(f"{cache.name}.{os.getpid()}.tmp")
+    session = ort.InferenceSession(
+        str(onnx_path), sess_options=make_options(level, save_to=tmp_path), providers=providers
+    )
+    try:
+        os.replace(tmp_path, cache)
+        info["optimized_model_cache"] = "written"
+    except OSError as e:
+        print(f"[MODEL] Could not save optimised model to {cache}: {e}")
+        info["optimized_model_cache"] = "write-failed"
+    return session, info
+
+
+class OnnxDetector:
+    """ONNX Runtime session plus the numpy preprocessor that feeds it."""
+
+    def __init__(self, session, metadata: ModelMetadata, session_info: Optional[dict] = None):
+        self.session = session
+        self.metadata = metadata
+        self.session_info = session_info or {}
+        self.preprocessor = YolosPreprocessor(metadata)
+        self.input_name = session.get_inputs()[0].name
+        # Graphs exported with --fused-postprocess return detection rows, not logits
+        self.fused_postprocess = FUSED_OUTPUT_NAME in {o.name for o in session.get_outputs()}
+
+    @classmethod
+    def load(
+        cls,
+        onnx_path: Path,
+        model_id: str,
+        providers: Optional[List[str]] = None,
+        session_config: Optional[SessionConfig] = None,
+        metadata: Optional[ModelMetadata] = None,
+    ) -> "OnnxDetector":
+        metadata = metadata or load_model_metadata(onnx_path, model_id)
+        session, session_info = create_session(
+            onnx_path,
+            session_config or SessionConfig(intra_op_threads=per_worker_threads(1)),
+            providers,
+        )
+        return cls(session, metadata, session_info)
+
+    def run(self, pixel_values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Forward pass; returns (logits, pred_boxes)."""
+        if self.fused_postprocess:
+            raise RuntimeError("Model was exported with fused post-processing; use run_fused()")
+        logits, pred_boxes = self.session.run(None, {self.input_name: pixel_values})[:2]
+        return logits, pred_boxes
+
+    def run_fused(
+        self,
+        pixel_values: np.ndarray,
+        target_sizes: Sequence[Sequence[float]],
+        score_thresholds: Sequence[float],
+    ) -> np.ndarray:
+        """
+        Forward pass through a fused-post-processing graph.
+
+        Returns (num_kept, 7) rows of (batch_index, label_id, score, x1, y1, x2, y2)
+        with boxes already scaled to `target_sizes` and scores above each
+        image's threshold.
+        """
+        (rows,) = self.session.run([FUSED_OUTPUT_NAME], {
+            self.input_name: pixel_values,
+            "image_size": np.asarray(target_sizes, dtype=np.float32),
+            "score_threshold": np.asarray(score_thresholds, dtype=np.float32),
+        })
+        return rows
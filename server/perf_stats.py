@@ -0,0 +1,74 @@
+"""
+Lightweight in-process performance statistics.
+Thread-safe histograms that can be snapshotted into plain dicts for /metrics.
+"""
+
+import bisect
+import os
+import threading
+from typing import Dict, Optional, Sequence
+
+
+# Default latency buckets in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram.
+
+    Each observation is counted in the first bucket whose upper bound is
+    >= the value; values above the last bound land in the "+Inf" bucket.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_MS):
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._count = 0
+            self._sum = 0.0
+            self._min: Optional[float] = None
+            self._max: Optional[float] = None
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._count += 1
+            self._sum += value
+            self._min = value if self._min is None else min(self._min, value)
+            self._max = value if self._max is None else max(self._max, value)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            buckets = {
+                f"le_{bound:g}": count
+                for bound, count in zip(self.buckets, self._counts)
+            }
+            buckets["+Inf"] = self._counts[-1]
+            return {
+                "count": self._count,
+                "sum": round(self._sum, 3),
+                "mean": round(self._sum / self._count, 3) if self._count else None,
+                "min": self._min,
+                "max": self._max,
+                "buckets": buckets,
+            }
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident set size of this process in MB (Linux /proc), or None elsewhere."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
@@ -1,11 +1,20 @@
-import runpod
+import os
 import torch
 import base64
 import io
-from PIL import Image
+import requests
+from PIL import Image, ImageOps
 from transformers import AutoImageProcessor, YolosForObjectDetection
 
 MODEL_ID = "valentinafeve/yolos-fashionpedia"
+DEFAULT_THRESHOLD = 0.275
+
+# Images per forward pass; larger jobs are split into several passes
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 8))
+IMAGE_URL_TIMEOUT = float(os.getenv("IMAGE_URL_TIMEOUT", 15))
+
+# Keep-alive connections for image_url inputs (usually the same CDN host)
+http_session = requests.Session()
 
 # Major garments to detect (same as server)
 MAJOR_GARMENTS = {
@@ -31,14 +40,134 @@ model.to(device)
 print(f"[RunPod] Model loaded on {device}")
 
 
+def decode_image(item):
+    """Image from an input item: inline image_base64, or image_url fetched here."""
+    if item.get('image_base64'):
+        data = base64.b64decode(item['image_base64'])
+    else:
+        response = http_session.get(item['image_url'], timeout=IMAGE_URL_TIMEOUT)
+        response.raise_for_status()
+        data = response.content
+    # Same orientation handling as the server, so boxes share its coordinates
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def preprocess(image):
+    """The processor's (3, H, W) pixel values for one image, at its resized detection shape."""
+    return processor(images=image, return_tensors="pt")["pixel_values"][0]
+
+
+def detect_batch(images, thresholds, pixel_values=None):
+    """
+    Run one forward pass over `images`, which must all resize to the same
+    shape, and return one detection list per image, in input order.
+
+    No padding is involved: YOLOS has no pixel mask, so padded patches would
+    take part in attention and change an image's detections.
+    """
+    if pixel_values is None:
+        pixel_values = [preprocess(image) for image in images]
+    shapes = {tuple(pv.shape) for pv in pixel_values}
+    if len(shapes) > 1:
+        raise ValueError(f"detect_batch needs images of one resized shape, got {sorted(shapes)}")
+
+    with torch.no_grad():
+        outputs = model(pixel_values=torch.stack(pixel_values).to(device))
+
+    target_sizes = torch.tensor([[image.height, image.width] for image in images], device=device)
+    results = processor.post_process_object_detection(
+        outputs,
+        threshold=min(thresholds),
+        target_sizes=target_sizes
+    )
+
+    batch_detections = []
+    for result, threshold in zip(results, thresholds):
+        detections = []
+        for box, score, label_idx in zip(result["boxes"], result["scores"], result["labels"]):
+            score_val = score.item()
+            label = model.config.id2label[label_idx.item()]
+
+            # Filter by garment type and this image's threshold
+            if label not in MAJOR_GARMENTS or score_val <= threshold:
+                continue
+
+            x1, y1, x2, y2 = map(int, box.tolist())
+            detections.append({
+                "label": label,
+                "score": score_val,
+                "bbox": [x1, y1, x2, y2]
+            })
+        batch_detections.append(detections)
+    return batch_detections
+
+
+def detect_images(items):
+    """
+    Detect on a list of {"image_base64" or "image_url", "threshold"} items.
+
+    Returns one {"detections", "image_size"} (or {"error"}) per item, in
+    input order. Only images that resize to the same shape share a batch (of
+    up to MAX_BATCH_SIZE): YOLOS has no pixel mask, so padding one image to
+    another's size would change its detections.
+    """
+    results = [None] * len(items)
+    decoded = []
+    for idx, item in enumerate(items):
+        if not item.get('image_base64') and not item.get('image_url'):
+            results[idx] = {"error": "image_base64 or image_url is required"}
+            continue
+        try:
+            image = decode_image(item)
+        except Exception as e:
+            results[idx] = {"error": f"Could not load image: {e}"}
+            continue
+        try:
+            pixel_values = preprocess(image)
+        except Exception as e:
+            results[idx] = {"error": f"Could not preprocess image: {e}"}
+            continue
+        decoded.append((idx, image, float(item.get('threshold', DEFAULT_THRESHOLD)), pixel_values))
+
+    by_shape = {}
+    for entry in decoded:
+        by_shape.setdefault(tuple(entry[3].shape), []).append(entry)
+
+    chunks = [
+        group[start:start + MAX_BATCH_SIZE]
+        for group in by_shape.values()
+        for start in range(0, len(group), MAX_BATCH_SIZE)
+    ]
+    for chunk in chunks:
+        try:
+            batch_detections = detect_batch(
+                [image for _, image, _, _ in chunk],
+                [thr for _, _, thr, _ in chunk],
+                [pv for _, _, _, pv in chunk],
+            )
+        except Exception as e:
+            for idx, _, _, _ in chunk:
+                results[idx] = {"error": str(e)}
+            continue
+        for (idx, image, _, _), detections in zip(chunk, batch_detections):
+            results[idx] = {
+                "detections": detections,
+                "image_size": {"width": image.width, "height": image.height}
+            }
+    return results
+
+
 def handler(job):
     """
     RunPod serverless handler for YOLOS detection.
 
-    Input:
+    Input, one image (inline, or a URL the handler downloads itself):
     {
         "input": {
-            "image_base64": "...",
+            "image_base64": "...",      # or "image_url": "https://..."
             "threshold": 0.275
         }
     }
@@ -48,67 +177,46 @@ def handler(job):
         "detections": [
             {"label": "dress", "score": 0.95, "bbox": [x1, y1, x2, y2]},
             ...
+        ],
+        "image_size": {"width": 1080, "height": 1440}
+    }
+
+    Input, several images (batched by resized shape, each with its own threshold):
+    {
+        "input": {
+            "images": [
+                {"image_base64": "...", "threshold": 0.275},
+                {"image_url": "https://...", "threshold": 0.2},
+                ...
+            ]
+        }
+    }
+
+    Output, one entry per image in input order:
+    {
+        "results": [
+            {"detections": [...], "image_size": {...}},
+            {"error": "..."},
+            ...
         ]
     }
     """
     job_input = job['input']
 
-    # Parse input
-    image_base64 = job_input.get('image_base64')
-    threshold = job_input.get('threshold', 0.275)
-
-    if not image_base64:
-        return {"error": "image_base64 is required"}
-
-    try:
-        # Decode image
-        image_data = base64.b64decode(image_base64)
-        image = Image.open(io.BytesIO(image_data))
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-
-        # Run detection
-        inputs = processor(images=image, return_tensors="pt")
-
-        # Move inputs to GPU
-        inputs = {k: v.to(device) for k, v in inputs.items()}
-
-        with torch.no_grad():
-            outputs = model(**inputs)
-
-        # Post-process
-        target_sizes = torch.tensor([[image.height, image.width]]).to(device)
-        results = processor.post_process_object_detection(
-            outputs,
-            threshold=threshold,
-            target_sizes=target_sizes
-        )[0]
+    if 'images' in job_input:
+        images = job_input['images']
+        if not isinstance(images, list) or not images:
+            return {"error": "images must be a non-empty list"}
+        return {"results": detect_images(images)}
 
-        # Format detections
-        detections = []
-        for box, score, label_idx in zip(results["boxes"], results["scores"], results["labels"]):
-            score_val = score.item()
-            label = model.config.id2label[label_idx.item()]
-
-            # Filter by garment type and threshold
-            if label not in MAJOR_GARMENTS or score_val < threshold:
-                continue
-
-            x1, y1, x2, y2 = map(int, box.tolist())
-            detections.append({
-                "label": label,
-                "score": score_val,
-                "bbox": [x1, y1, x2, y2]
-            })
-
-        return {
-            "detections": detections,
-            "image_size": {"width": image.width, "height": image.height}
-        }
+    # Single image (original input format)
+    if not job_input.get('image_base64') and not job_input.get('image_url'):
+        return {"error": "image_base64 or image_url is required"}
+    return detect_images([job_input])[0]
 
-    except Exception as e:
-        return {"error": str(e)}
 
+if __name__ == "__main__":
+    # Start RunPod serverless (guarded so benchmarks can import the handler)
+    import runpod
 
-# Start RunPod serverless
-runpod.serverless.start({"handler": handler})
+    runpod.serverless.start({"handler": handler})
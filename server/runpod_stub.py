@@ -0,0 +1,120 @@
+"""
+Local stand-in for a RunPod serverless endpoint.
+
+Serves POST /v2/<endpoint_id>/runsync the way RunPod does
+({"id", "status": "COMPLETED", "output": handler(job)}), so the server's
+RunPod path, circuit breaker and hedging can be exercised without a GPU or
+an account. `delay` and `fail` can be changed while it runs to simulate a
+slow or broken endpoint (fail=True answers HTTP 500).
+
+Usage:
+    python runpod_stub.py [--port 8010] [--delay 0]
+        # serves runpod/runpod_handler.py's handler on the local CPU
+
+    USE_RUNPOD=true RUNPOD_API_KEY=local RUNPOD_ENDPOINT_ID=local \\
+        RUNPOD_BASE_URL=http://127.0.0.1:8010/v2 uvicorn fashion_detector_server:app
+
+In tests:
+    with RunPodStub(lambda job: {"detections": []}) as stub:
+        requests.post(f"{stub.base_url}/any/runsync", json={"input": {}})
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable
+
+
+class RunPodStub:
+    def __init__(self, handler: Callable[[dict], dict], host: str = "127.0.0.1", port: int = 0, delay: float = 0.0):
+        self.handler = handler
+        self.delay = delay
+        self.fail = False
+        self.jobs = []
+        self._server = ThreadingHTTPServer((host, port), self._request_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v2"
+
+    def start(self) -> "RunPodStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="runpod-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "RunPodStub":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _request_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/runsync"):
+                    return self._reply(404, {"error": f"unknown path {self.path}"})
+                length = int(self.headers.get("Content-Length", 0))
+                job = json.loads(self.rfile.read(length) or b"{}")
+                stub.jobs.append(job)
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if stub.fail:
+                    return self._reply(500, {"error": "stub failure"})
+                try:
+                    output = stub.handler(job)
+                except Exception as exc:
+                    return self._reply(200, {"id": str(uuid.uuid4()), "status": "FAILED", "error": str(exc)})
+                self._reply(200, {"id": str(uuid.uuid4()), "status": "COMPLETED", "output": output})
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.end_headers()
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to sleep before answering each job")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent / "runpod"))
+    import runpod_handler
+
+    stub = RunPodStub(runpod_handler.handler, host=args.host, port=args.port, delay=args.delay)
+    print(f"RunPod stand-in on {stub.base_url}/<endpoint_id>/runsync (device={runpod_handler.device})")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -48,6 +48,10 @@ class SupabaseManager:
     # IMAGE CACHE OPERATIONS
     # ============================================
 
+    def ping(self) -> None:
+        """Cheapest real query: opens the client's keep-alive connection (raises on failure)."""
+        self.client.table('image_cache').select('id').limit(1).execute()
+
     def check_cache_by_source(self, source_url: str) -> Optional[Dict[str, Any]]:
         """
         Check if we've already analyzed this Instagram/source URL.
@@ -151,7 +155,8 @@ class SupabaseManager:
         detected_garments: List[Dict],
         search_results: List[Dict],
         country: str = 'US',
-        expires_in_days: int = 30
+        expires_in_days: int = 30,
+        image_phash: Optional[str] = None
     ) -> Optional[str]:
         """
         Store analysis results in cache for a specific country.
@@ -165,6 +170,8 @@ class SupabaseManager:
             search_results: List of search results
             country: Country code (e.g., 'US', 'GB', 'FR') - results are country-specific
             expires_in_days: Number of days before cache expires
+            image_phash: Perceptual hash (hex) for near-duplicate lookups; needs the
+                image_phash column (migration 20261017000000_add_image_cache_phash.sql)
         """
         if not self.enabled:
             return None
@@ -183,6 +190,8 @@ class SupabaseManager:
                 'expires_at': expires_at.isoformat(),
                 'cache_hits': 0
             }
+            if image_phash:
+                cache_entry['image_phash'] = image_phash
 
             response = self.client.table('image_cache')\
                 .insert(cache_entry)\
@@ -199,6 +208,52 @@ class SupabaseManager:
             print(f"Cache store error: {e}")
             return None
 
+    def get_cache_entry(self, cache_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a cache entry by ID if it has not expired."""
+        if not self.enabled:
+            return None
+
+        try:
+            response = self.client.table('image_cache')\
+                .select('*')\
+                .eq('id', cache_id)\
+                .gt('expires_at', datetime.now().isoformat())\
+                .limit(1)\
+                .execute()
+            return response.data[0] if response.data else None
+
+        except Exception as e:
+            print(f"Cache fetch error: {e}")
+            return None
+
+    def load_perceptual_hashes(self, page_size: int = 1000, max_rows: int = 200_000) -> List[Dict[str, Any]]:
+        """
+        Return id, image_phash and country of every unexpired cache entry that
+        has a perceptual hash, for building the near-duplicate index at startup.
+        """
+        if not self.enabled:
+            return []
+
+        rows: List[Dict[str, Any]] = []
+        try:
+            now = datetime.now().isoformat()
+            while len(rows) < max_rows:
+                # Keyset pagination on id: each page is a range scan of the
+                # partial (id) WHERE image_phash IS NOT NULL index, no sort or offset
+                query = self.client.table('image_cache')\
+                    .select('id, image_phash, country')\
+                    .not_.is_('image_phash', 'null')\
+                    .gt('expires_at', now)
+                if rows:
+                    query = query.gt('id', rows[-1]['id'])
+                response = query.order('id').limit(page_size).execute()
+                rows.extend(response.data or [])
+                if not response.data or len(response.data) < page_size:
+                    break
+        except Exception as e:
+            print(f"Perceptual hash load error: {e}")
+        return rows
+
     def increment_cache_hit(self, cache_id: str):
         """Increment cache hit counter"""
         if not self.enabled:
@@ -0,0 +1,132 @@
+import io
+import random
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+from crop_storage import (
+    FaultyStorage,
+    LocalStorage,
+    StorageSettings,
+    available_storages,
+    check_local_settings,
+    create_storage,
+)
+from test_support import FakeClock
+
+
+def jpeg(size=(40, 30), color=(200, 40, 40)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class LocalStorageTest(unittest.TestCase):
+    def storage(self, **settings):
+        self.clock = FakeClock()
+        settings = StorageSettings(base_url="https://snaplook.test/", secret="s3cret", ttl_seconds=60, **settings)
+        return LocalStorage(settings, clock=self.clock)
+
+    def test_signed_urls_expire_and_reject_tampering(self):
+        storage = self.storage()
+        data = jpeg()
+        upload = storage.put(data, timeout=5)
+
+        self.assertEqual((upload["width"], upload["height"]), (40, 30))
+        self.assertTrue(upload["secure_url"].startswith(f"https://snaplook.test/crops/{upload['public_id']}.jpg?"))
+        self.assertEqual(storage.get_url(upload["secure_url"]), data)
+        self.assertIsNone(storage.get_url(upload["secure_url"].replace("sig=", "sig=0")))
+        self.assertIsNone(storage.get_url(upload["secure_url"].replace("expires=", "expires=9")))
+        other = LocalStorage(StorageSettings(secret="other"), clock=self.clock)
+        self.assertIsNone(other.get_url(upload["secure_url"]))
+
+        self.clock.now += 61
+        self.assertIsNone(storage.get_url(upload["secure_url"]))
+        self.assertIsNone(storage.refresh(upload))
+
+    def test_refresh_resigns_while_the_entry_lives(self):
+        storage = self.storage()
+        upload = storage.put(jpeg(), timeout=5, public_id="abc123")
+        self.clock.now += 30
+        refreshed = storage.refresh(upload)
+        self.assertNotEqual(refreshed["secure_url"], upload["secure_url"])
+        self.assertEqual(storage.get_url(refreshed["secure_url"]), jpeg())
+        with self.assertRaises(ValueError):
+            storage.put(jpeg(), timeout=5, public_id="../etc/passwd")
+
+    def test_memory_store_evicts_oldest_beyond_max_bytes(self):
+        size = len(jpeg())
+        storage = self.storage(max_bytes=size * 2)
+        uploads = [storage.put(jpeg(), timeout=5) for _ in range(3)]
+        self.assertIsNone(storage.get_url(uploads[0]["secure_url"]))
+        self.assertIsNotNone(storage.get_url(uploads[2]["secure_url"]))
+        self.assertEqual(storage.info()["entries"], 2)
+
+    def test_directory_store_is_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as directory:
+            writer = self.storage(directory=directory)
+            # Another worker: same secret and directory
+            reader = LocalStorage(StorageSettings(secret="s3cret", ttl_seconds=60, directory=directory), clock=self.clock)
+            upload = writer.put(jpeg(), timeout=5, public_id="abc123")
+            self.assertEqual(reader.get_url(upload["secure_url"]), jpeg())
+            self.assertEqual([p.name for p in Path(directory).iterdir()], ["abc123.jpg"])
+
+            # Overwriting a file only counts the difference
+            writer.put(jpeg(size=(80, 60)), timeout=5, public_id="abc123")
+            self.assertEqual(writer.info()["bytes"], len(jpeg(size=(80, 60))))
+
+    def test_settings_that_hand_out_unreachable_urls_are_rejected(self):
+        ok = StorageSettings(base_url="https://snaplook.test", secret="s3cret", directory="/tmp/crops")
+        check_local_settings(ok, workers=2)
+        check_local_settings(StorageSettings(base_url="https://snaplook.test"), workers=1)
+        with self.assertRaisesRegex(ValueError, "base URL"):
+            check_local_settings(StorageSettings(), workers=1)
+        with self.assertRaisesRegex(ValueError, "in-memory store with 2 workers"):
+            check_local_settings(StorageSettings(base_url="https://snaplook.test", secret="s3cret"), workers=2)
+
+
+class FaultyStorageTest(unittest.TestCase):
+    def test_injects_errors_and_timeouts_at_the_configured_rates(self):
+        sleeps = []
+        settings = StorageSettings(fault_latency_ms=100, fault_error_rate=0.2, fault_timeout_rate=0.1)
+        storage = FaultyStorage(settings, sleep=sleeps.append, rng=random.Random(7))
+        outcomes = {"ok": 0, "error": 0, "timeout": 0}
+        for _ in range(500):
+            try:
+                storage.put(jpeg(), timeout=2)
+                outcomes["ok"] += 1
+            except TimeoutError:
+                outcomes["timeout"] += 1
+            except ConnectionError:
+                outcomes["error"] += 1
+
+        self.assertAlmostEqual(outcomes["timeout"] / 500, 0.1, delta=0.04)
+        self.assertAlmostEqual(outcomes["error"] / 500, 0.2, delta=0.05)
+        self.assertIn(2, sleeps)
+        self.assertTrue(all(0.05 <= s <= 0.15 for s in sleeps if s != 2))
+        self.assertEqual(storage.info()["name"], "faulty(local)")
+        self.assertEqual((storage.faults["errors"], storage.faults["timeouts"]), (outcomes["error"], outcomes["timeout"]))
+
+    def test_latency_beyond_the_timeout_times_out(self):
+        sleeps = []
+        storage = FaultyStorage(StorageSettings(fault_latency_ms=5000), sleep=sleeps.append)
+        with self.assertRaises(TimeoutError):
+            storage.put(jpeg(), timeout=1)
+        self.assertEqual(sleeps, [1])
+
+    def test_registry(self):
+        self.assertEqual(available_storages(), ["cloudinary", "faulty", "local"])
+        self.assertIsInstance(create_storage("local", StorageSettings()), LocalStorage)
+        with self.assertRaises(ValueError):
+            create_storage("s3", StorageSettings())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import importlib
+import io
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import requests
+from PIL import Image
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+import cloudinary
+
+from cloudinary_stub import CloudinaryStub
+
+
+def photo(size=(1200, 900)):
+    small = np.random.default_rng(0).integers(0, 255, (size[1] // 50, size[0] // 50, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.BICUBIC)
+
+
+class CropUploadTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        sys.modules.pop("fashion_detector_server", None)
+        with patch("transformers.AutoImageProcessor.from_pretrained", return_value=MagicMock(name="processor")), \
+             patch("transformers.YolosForObjectDetection.from_pretrained", return_value=MagicMock(name="model")):
+            cls.server = importlib.import_module("fashion_detector_server")
+        cls.stub = CloudinaryStub().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+        cloudinary.reset_config()
+
+    def setUp(self):
+        cloudinary.config(cloud_name="local", api_key="key", api_secret="secret", upload_prefix=self.stub.base_url)
+        self.stub.reset()
+        self.image = photo()
+        self.detections = [
+            {"label": "shirt", "expanded_bbox": [100, 50, 700, 600]},
+            {"label": "shoe", "expanded_bbox": [800, 700, 1000, 880]},
+            {"label": "hat", "expanded_bbox": [10, 10, 50, 50]},  # below the hat minimum
+        ]
+
+    def upload(self, by_url):
+        with patch.object(self.server, "CLOUDINARY_CROP_BY_URL", by_url):
+            return self.server.upload_garments(self.image, self.detections)
+
+    def test_crop_urls_need_a_single_upload(self):
+        full_url, results = self.upload(by_url=True)
+
+        self.assertEqual(len(self.stub.uploads), 1)
+        self.assertIsNotNone(full_url)
+        urls = [url for _, url in results]
+        self.assertIsNone(urls[2])
+        for det, url in results[:2]:
+            self.assertIn("/image/upload/c_crop,", url)
+            served = Image.open(io.BytesIO(requests.get(url, timeout=5).content)).convert("RGB")
+            expected = self.image.crop(tuple(det["expanded_bbox"]))
+            self.assertEqual(served.size, expected.size)
+            difference = np.abs(np.asarray(served, dtype=np.int16) - np.asarray(expected, dtype=np.int16))
+            self.assertLess(difference.mean(), 4)
+
+    def test_uploaded_crops_apply_the_same_minimum_sizes(self):
+        full_url, results = self.upload(by_url=False)
+
+        self.assertIsNone(full_url)
+        self.assertEqual([url is not None for _, url in results], [True, True, False])
+        self.assertEqual(len(self.stub.uploads), 2)
+
+    def test_repeated_uploads_are_deduplicated_by_content(self):
+        crop = self.image.crop((100, 50, 700, 600))
+        with patch.object(self.server, "CLOUDINARY_UPLOAD_DEDUPE", True), \
+             patch.object(self.server, "_upload_cache", None):
+            first = self.server.upload_to_cloudinary(crop, "shirt")
+            self.assertEqual(self.server.upload_to_cloudinary(crop.copy(), "shirt"), first)
+            self.assertEqual(len(self.stub.uploads), 1)
+
+            stats = self.server.get_upload_cache().stats()
+            self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+            self.assertEqual(stats["bytes_saved"], stats["bytes_uploaded"])
+            self.assertGreater(stats["bytes_saved"], 0)
+
+            # Another worker without the URL still lands on the same asset
+            self.server._upload_cache.cache.clear()
+            self.assertEqual(self.server.upload_to_cloudinary(crop, "shirt"), first)
+            self.assertEqual(len({upload["public_id"] for upload in self.stub.uploads}), 1)
+            self.assertNotEqual(self.server.upload_to_cloudinary(self.image, "full", is_full=True), first)
+
+    def test_local_storage_serves_signed_crops(self):
+        from fastapi.testclient import TestClient
+
+        from crop_storage import LocalStorage, StorageSettings
+
+        storage = LocalStorage(StorageSettings(base_url="http://testserver", secret="s3cret"))
+        with patch.object(self.server, "_crop_storage", storage), \
+             patch.object(self.server, "_upload_client", None), \
+             patch.object(self.server, "CLOUDINARY_CROP_BY_URL", True):
+            full_url, results = self.server.upload_garments(self.image, self.detections)
+            self.assertEqual(self.server.get_upload_client().stats()["backend"], "local")
+            client = TestClient(self.server.app)
+            for det, url in results[:2]:
+                # No Cloudinary transformations here: crops are uploaded one by one
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                served = Image.open(io.BytesIO(response.content))
+                self.assertEqual(served.size, self.image.crop(tuple(det["expanded_bbox"])).size)
+            self.assertIsNone(full_url)
+            self.assertEqual(client.get(results[0][1].replace("sig=", "sig=f")).status_code, 404)
+        self.assertEqual(self.stub.uploads, [])
+
+    def test_crop_url_scales_to_the_downsized_upload(self):
+        upload = {"secure_url": "https://res.example.com/demo/image/upload/v1/a.jpg", "width": 1600, "height": 1200}
+        url = self.server.cloudinary_crop_url(upload, [400, 300, 1600, 2100], (3200, 2400), "dress")
+        self.assertEqual(
+            url,
+            "https://res.example.com/demo/image/upload/c_crop,h_900,w_600,x_200,y_150/c_limit,h_768,w_768/q_72/v1/a.jpg",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+from detection_cache import DetectionCache, SqliteStore
+from hash_utils import hash_pixels
+from test_support import FakeClock
+
+
+def result(label):
+    return [[{"label": label, "score": 0.9, "bbox": [0, 0, 10, 10]}], 1]
+
+
+class DetectionCacheTest(unittest.TestCase):
+    def test_lru_eviction_and_ttl(self):
+        clock = FakeClock()
+        cache = DetectionCache(max_entries=2, ttl_seconds=60, clock=clock)
+        cache.put("a", result("shirt"))
+        cache.put("b", result("pants"))
+        self.assertIsNotNone(cache.get("a"))  # "b" is now least recently used
+        cache.put("c", result("hat"))
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), result("shirt"))
+        clock.now += 61
+        self.assertIsNone(cache.get("c"))
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+        self.assertEqual((stats["evictions"], stats["expired"]), (1, 1))
+
+    def test_hits_are_independent_copies(self):
+        cache = DetectionCache()
+        cache.put("a", result("shirt"))
+        cache.get("a")[0][0]["id"] = "garment_1"
+        self.assertNotIn("id", cache.get("a")[0][0])
+
+    def test_store_is_shared_between_workers(self):
+        clock = FakeClock()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "detections.sqlite")
+            first = DetectionCache(store=SqliteStore(path, ttl_seconds=60, clock=clock), clock=clock)
+            second = DetectionCache(store=SqliteStore(path, ttl_seconds=60, clock=clock), clock=clock)
+
+            first.put("a", result("shirt"))
+            self.assertEqual(second.get("a"), result("shirt"))
+            self.assertEqual(second.get("a"), result("shirt"))
+            self.assertEqual((second.stats()["store_hits"], second.stats()["hits"]), (1, 1))
+
+            clock.now += 61
+            second.clear()
+            self.assertIsNone(second.get("a"))
+
+    def test_tables_share_a_file_independently(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "cache.sqlite")
+            detections = SqliteStore(path, ttl_seconds=60)
+            uploads = SqliteStore(path, ttl_seconds=60, table="uploads")
+            detections.put("a", "detections")
+            uploads.put("a", "uploads")
+            self.assertEqual((detections.get("a"), uploads.get("a")), ("detections", "uploads"))
+            self.assertEqual((len(detections), len(uploads)), (1, 1))
+        with self.assertRaises(ValueError):
+            SqliteStore(path, ttl_seconds=60, table="uploads; DROP TABLE detections")
+
+    def test_store_errors_are_misses(self):
+        class BrokenStore(SqliteStore):
+            def get(self, key):
+                raise sqlite3.OperationalError("database is locked")
+
+            def put(self, key, value):
+                raise sqlite3.OperationalError("database is locked")
+
+        cache = DetectionCache(store=BrokenStore(":memory:", ttl_seconds=60), log=lambda *args: None)
+        cache.put("a", result("shirt"))
+        self.assertEqual(cache.get("a"), result("shirt"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["store_errors"], 2)
+
+    def test_pixel_hash_ignores_encoding(self):
+        image = Image.new("RGB", (32, 24), (10, 20, 30))
+        self.assertEqual(hash_pixels(image), hash_pixels(image.copy()))
+        self.assertNotEqual(hash_pixels(image), hash_pixels(image.convert("L")))
+        self.assertNotEqual(hash_pixels(image), hash_pixels(Image.new("RGB", (24, 32), (10, 20, 30))))
+
+
+if __name__ == "__main__":
+    unittest.main()
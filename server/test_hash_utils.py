@@ -0,0 +1,118 @@
+import base64
+import hashlib
+import io
+import random
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+from hash_utils import (
+    Base64Hasher,
+    MultiIndexHash,
+    NearDuplicateIndex,
+    decode_base64_with_hash,
+    dhash,
+    hamming_distance,
+    hash_base64_stream,
+    hash_bytes,
+    hash_image,
+    hash_images,
+    hash_to_hex,
+    phash,
+)
+
+
+def photo(seed, size=(640, 480)):
+    """Smooth random texture, like a photo at thumbnail scale."""
+    small = np.random.default_rng(seed).integers(0, 255, (12, 16, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.BICUBIC)
+
+
+def recompressed(image, size, quality=60):
+    buffer = io.BytesIO()
+    image.resize(size, Image.LANCZOS).save(buffer, format="JPEG", quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+
+
+class ContentHashTest(unittest.TestCase):
+    def test_streaming_base64_matches_one_shot_decode(self):
+        data = bytes(range(256)) * 1000 + b"tail"
+        text = base64.b64encode(data).decode()
+        wrapped = "\n".join(text[i:i + 76] for i in range(0, len(text), 76))
+
+        for source in (text, wrapped, text.rstrip("=")):
+            decoded, digest = decode_base64_with_hash(source, chunk_size=1001)
+            self.assertEqual(decoded, data)
+            self.assertEqual(digest, hash_bytes(data))
+        chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+        self.assertEqual(hash_base64_stream(chunks), hash_bytes(data))
+        # image_cache keys stay SHA-256 hex, the format of the rows already stored
+        self.assertEqual(hash_bytes(data), hashlib.sha256(data).hexdigest())
+
+        hasher = Base64Hasher(keep_decoded=False)
+        hasher.update(text.encode())
+        self.assertEqual(hasher.size, len(data))
+        with self.assertRaises(ValueError):
+            hasher.decoded()
+
+    def test_image_hash_needs_no_reencode(self):
+        image = photo(1)
+        self.assertEqual(hash_image(image), hash_image(image.copy()))
+        self.assertEqual(len(hash_image(image)), 64)
+        self.assertNotEqual(hash_image(image), hash_image(photo(2)))
+        images = [photo(seed) for seed in range(5)] + [b"raw upload bytes"]
+        self.assertEqual(hash_images(images), [hash_image(image) for image in images])
+
+
+class PerceptualHashTest(unittest.TestCase):
+    def test_near_duplicates_are_close_and_other_images_are_not(self):
+        original = photo(1)
+        copy = recompressed(original, (320, 240))
+        other = photo(2)
+
+        for hash_fn in (phash, dhash):
+            self.assertLessEqual(hamming_distance(hash_fn(original), hash_fn(copy)), 4)
+            self.assertGreater(hamming_distance(hash_fn(original), hash_fn(other)), 12)
+        self.assertEqual(len(hash_to_hex(phash(original))), 16)
+
+    def test_multi_index_matches_brute_force(self):
+        rng = random.Random(0)
+        hashes = [rng.getrandbits(64) for _ in range(2000)]
+        # A few near copies so there is something to find
+        hashes += [h ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for h in hashes[:50]]
+        table = MultiIndexHash(max_distance=6)
+        for i, value_hash in enumerate(hashes):
+            table.add(value_hash, i)
+
+        for query in hashes[:20] + [rng.getrandbits(64)]:
+            expected = sorted(
+                (hamming_distance(query, h), i) for i, h in enumerate(hashes) if hamming_distance(query, h) <= 6
+            )
+            self.assertEqual(sorted(table.find(query)), expected)
+        self.assertEqual(len(table), len(hashes))
+
+    def test_index_is_per_country(self):
+        index = NearDuplicateIndex(max_distance=4)
+        image_hash = phash(photo(1))
+        index.load([
+            {"id": "us-1", "image_phash": hash_to_hex(image_hash), "country": "US"},
+            {"id": "no-hash", "image_phash": None, "country": "US"},
+        ])
+        index.add(image_hash ^ 0b111, "gb-1", "GB")
+
+        self.assertEqual(index.find(image_hash, "US"), [(0, "us-1")])
+        self.assertEqual(index.find(image_hash, "GB"), [(3, "gb-1")])
+        self.assertEqual(index.find(image_hash, "GB", max_distance=2), [])
+        self.assertEqual(index.find(image_hash, "NO"), [])
+        self.assertEqual(index.stats()["entries"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import io
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageOps
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+from image_codec import JpegBudget, SourceImage, encode_jpeg, encode_jpeg_budget, encode_jpeg_within, pixels_of
+
+
+def noisy_image(width=640, height=480, seed=0):
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 255, (height, width, 3), dtype=np.uint8))
+
+
+class EncodeJpegWithinTest(unittest.TestCase):
+    def test_picks_highest_quality_that_fits(self):
+        image = noisy_image()
+        budget = len(encode_jpeg(image, 70)) + 1
+
+        data, quality = encode_jpeg_within(image, budget, min_quality=40, max_quality=90)
+
+        self.assertEqual(quality, 70)
+        self.assertLessEqual(len(data), budget)
+        self.assertGreater(len(encode_jpeg(image, 71)), budget)
+
+    def test_small_image_keeps_max_quality(self):
+        image = Image.new("RGB", (64, 64), (120, 80, 40))
+        data, quality = encode_jpeg_within(image, 100_000, max_quality=90)
+        self.assertEqual(quality, 90)
+        self.assertEqual(data, encode_jpeg(image, 90))
+
+    def test_falls_back_to_min_quality_over_budget(self):
+        _, quality = encode_jpeg_within(noisy_image(), 1_000, min_quality=40)
+        self.assertEqual(quality, 40)
+
+    def test_quality_step_limits_the_candidates(self):
+        image = noisy_image()
+        budget = len(encode_jpeg(image, 68))
+        _, quality = encode_jpeg_within(image, budget, min_quality=50, max_quality=85, quality_step=5)
+        self.assertEqual(quality, 65)
+
+
+class EncodeJpegBudgetTest(unittest.TestCase):
+    def test_plain_image_keeps_size_and_quality(self):
+        plain = noisy_image(40, 30).resize((1600, 1200), Image.BICUBIC)
+        data, quality, size = encode_jpeg_budget(plain, JpegBudget(max_bytes=500_000, max_dim=800, max_quality=80))
+        self.assertEqual((quality, size), (80, (800, 600)))
+        self.assertEqual(Image.open(io.BytesIO(data)).size, (800, 600))
+
+    def test_busy_image_is_shrunk_to_fit(self):
+        budget = JpegBudget(max_bytes=40_000, max_dim=800, max_quality=80, progressive=True)
+        data, quality, size = encode_jpeg_budget(noisy_image(1600, 1200), budget)
+        self.assertLessEqual(len(data), budget.max_bytes)
+        self.assertLess(size[0], 800)
+        self.assertGreaterEqual(quality, budget.min_quality)
+
+        tiny = JpegBudget(max_bytes=1_000, max_dim=800, min_dim=320)
+        data, quality, size = encode_jpeg_budget(noisy_image(1600, 1200), tiny)
+        self.assertEqual((quality, max(size)), (50, 320))  # a target, not a hard limit
+
+
+
+def jpeg_upload(image, orientation=None):
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(buffer, format="JPEG", quality=90, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def reference_decode(data):
+    """What load_image_from_bytes used to do: full decode, orient, convert."""
+    return ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+
+
+class SourceImageTest(unittest.TestCase):
+    def test_preview_is_draft_scaled_and_crops_are_full_resolution(self):
+        data = jpeg_upload(noisy_image(1600, 1200).resize((3200, 2400)))
+        source = SourceImage(data, lambda width, height: (700, 500))
+
+        self.assertEqual(source.size, (3200, 2400))
+        self.assertEqual(source.preview.size, (800, 600))  # 1/4 scale still covers 700x500
+        self.assertIs(pixels_of(source), source.preview)
+        self.assertFalse(source.full_decoded)
+        self.assertEqual(max(source.within(768).size), 800)  # served from the preview
+        self.assertFalse(source.full_decoded)
+
+        crop = source.crop((100, 200, 900, 1000))
+        self.assertTrue(source.full_decoded)
+        self.assertEqual(crop.tobytes(), reference_decode(data).crop((100, 200, 900, 1000)).tobytes())
+
+    def test_exif_rotation_is_applied_to_sizes_and_pixels(self):
+        data = jpeg_upload(noisy_image(1600, 1200), orientation=6)
+        source = SourceImage(data, lambda width, height: (300, 400))
+
+        self.assertEqual(source.size, (1200, 1600))
+        self.assertEqual(source.preview.size, (300, 400))
+        self.assertEqual(source.full().tobytes(), reference_decode(data).tobytes())
+
+    def test_non_jpeg_is_decoded_once(self):
+        buffer = io.BytesIO()
+        noisy_image(320, 240).save(buffer, format="PNG")
+        source = SourceImage(buffer.getvalue(), lambda width, height: (160, 120))
+
+        self.assertEqual(source.preview.size, (320, 240))
+        self.assertIs(source.full(), source.preview)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+from image_stats import LumaStats, luma_stats
+from onnx_engine import get_resize_size
+
+
+def detection_copy(image, shortest_edge=800, longest_edge=1333):
+    """Same downsizing as fashion_detector_server.resize_for_detection."""
+    height, width = get_resize_size(image.height, image.width, shortest_edge, longest_edge)
+    return image.resize((width, height), Image.BILINEAR, reducing_gap=1.0)
+
+
+def sample_photo(seed, brightness, contrast, size=(1536, 2048)):
+    """Smooth scene + per-pixel sensor noise, scaled to a brightness / contrast."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    scene = Image.fromarray(rng.integers(0, 255, (height // 64, width // 64, 3), dtype=np.uint8))
+    scene = np.asarray(scene.resize(size, Image.BICUBIC), dtype=np.float32)
+    scene = (scene - scene.mean()) * contrast + brightness
+    scene += rng.normal(0, 4, scene.shape)
+    return Image.fromarray(np.clip(scene, 0, 255).astype(np.uint8))
+
+
+class LumaStatsTest(unittest.TestCase):
+    def test_low_light_rule(self):
+        self.assertTrue(LumaStats(mean=60, std=40).low_light)
+        self.assertTrue(LumaStats(mean=80, std=20).low_light)
+        self.assertFalse(LumaStats(mean=80, std=30).low_light)
+        self.assertFalse(LumaStats(mean=90, std=10).low_light)
+
+    def test_detection_copy_matches_full_resolution_decisions(self):
+        corpus = [
+            sample_photo(seed, brightness, contrast)
+            for seed, brightness in enumerate((25, 55, 70, 80, 95, 140))
+            for contrast in (0.15, 0.3, 0.6)
+        ]
+        low_light = 0
+        for image in corpus:
+            full = luma_stats(image)
+            small = luma_stats(detection_copy(image))
+            self.assertAlmostEqual(small.mean, full.mean, delta=0.5)
+            self.assertAlmostEqual(small.std, full.std, delta=1.0)
+            self.assertEqual(small.low_light, full.low_light, (full, small))
+            low_light += full.low_light
+        # The corpus covers both sides of the gate
+        self.assertTrue(0 < low_light < len(corpus))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+from inference_backends import (
+    BackendSettings,
+    InferenceBackend,
+    agreement,
+    available_backends,
+    cached_selection,
+    create_backend,
+    register_backend,
+    select_backend,
+)
+
+SETTINGS = BackendSettings(
+    model_id="test/model",
+    shortest_edge=800,
+    longest_edge=1333,
+    allowed_labels=frozenset({"shirt"}),
+    category_thresholds={},
+)
+
+
+def shirt(x1, score=0.9):
+    return {"label": "shirt", "score": score, "bbox": [x1, 10, x1 + 100, 110]}
+
+
+class FakeBackend(InferenceBackend):
+    """Returns fixed detections after sleeping `delay` seconds per image."""
+
+    delay = 0.0
+    offset = 0
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self._loaded = False
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def load(self):
+        self._loaded = True
+
+    def infer(self, images, thresholds):
+        time.sleep(self.delay * len(images))
+        return [[shirt(10 + self.offset)] for _ in images]
+
+
+@register_backend("test-reference")
+class ReferenceBackend(FakeBackend):
+    name = "test-reference"
+    delay = 0.03
+
+
+@register_backend("test-fast-but-wrong")
+class FastWrongBackend(FakeBackend):
+    name = "test-fast-but-wrong"
+    offset = 80  # IoU ~0.1 with the reference box
+
+
+@register_backend("test-fast")
+class FastBackend(FakeBackend):
+    name = "test-fast"
+    delay = 0.01
+    offset = 2
+
+
+@register_backend("test-broken")
+class BrokenBackend(FakeBackend):
+    name = "test-broken"
+
+    def load(self):
+        raise FileNotFoundError("no model file")
+
+
+class RegistryTest(unittest.TestCase):
+    def test_builtin_backends_are_registered(self):
+        for name in ("pytorch", "onnx", "onnx-int8"):
+            self.assertIn(name, available_backends())
+        self.assertEqual(create_backend("onnx-int8", SETTINGS).name, "onnx-int8")
+
+    def test_unknown_backend_names_the_options(self):
+        with self.assertRaisesRegex(ValueError, "available: .*pytorch"):
+            create_backend("tensorrt", SETTINGS)
+
+
+class AutoSelectionTest(unittest.TestCase):
+    def test_agreement(self):
+        self.assertEqual(agreement([[]], [[]]), 1.0)
+        self.assertEqual(agreement([[shirt(10)]], [[shirt(12)]]), 1.0)
+        self.assertEqual(agreement([[shirt(10)]], [[shirt(90)]]), 0.0)
+        self.assertAlmostEqual(agreement([[shirt(10), shirt(300)]], [[shirt(10)]]), 2 / 3)
+
+    def test_picks_fastest_backend_that_agrees_with_the_reference(self):
+        images = [Image.new("RGB", (64, 48))] * 2
+        report = select_backend(
+            SETTINGS,
+            ["test-reference", "test-fast-but-wrong", "test-fast", "test-broken"],
+            images,
+            reference="test-reference",
+            runs=2,
+        )
+
+        self.assertEqual(report["selected"], "test-fast")
+        candidates = report["candidates"]
+        self.assertTrue(candidates["test-reference"]["reference"])
+        self.assertFalse(candidates["test-fast-but-wrong"]["ok"])
+        self.assertLess(candidates["test-fast-but-wrong"]["agreement"], 0.9)
+        self.assertIn("no model file", candidates["test-broken"]["error"])
+
+    def test_selection_is_cached_per_key(self):
+        calls = []
+
+        def select():
+            calls.append(1)
+            return {"selected": f"run-{len(calls)}", "candidates": {}}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = Path(tmp) / "choice.json"
+            first = cached_selection(cache, {"cpus": 4}, select)
+            second = cached_selection(cache, {"cpus": 4}, select)
+            third = cached_selection(cache, {"cpus": 8}, select)
+
+        self.assertEqual((first["selected"], first["cached"]), ("run-1", False))
+        self.assertEqual((second["selected"], second["cached"]), ("run-1", True))
+        self.assertEqual(third["selected"], "run-2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+import numpy as np
+from PIL import Image
+
+from inference_batcher import InferenceBatcher
+from onnx_engine import ModelMetadata, YolosPreprocessor, get_resize_size
+
+
+class InferenceBatcherTest(unittest.TestCase):
+    def test_groups_concurrent_submissions(self):
+        seen_batches = []
+
+        def run_batch(items):
+            seen_batches.append(list(items))
+            return [item * 10 for item in items]
+
+        batcher = InferenceBatcher(run_batch, max_batch_size=8, max_wait_ms=200)
+        futures = [batcher.submit(i) for i in range(5)]
+        results = [f.result(timeout=5) for f in futures]
+        batcher.close()
+
+        self.assertEqual(results, [0, 10, 20, 30, 40])
+        self.assertEqual(seen_batches, [[0, 1, 2, 3, 4]])
+        stats = batcher.stats()
+        self.assertEqual(stats["batch_size"]["count"], 1)
+        self.assertEqual(stats["queue_wait_ms"]["count"], 5)
+
+    def test_respects_max_batch_size(self):
+        sizes = []
+        gate = threading.Event()
+
+        def run_batch(items):
+            gate.wait(5)
+            sizes.append(len(items))
+            return items
+
+        batcher = InferenceBatcher(run_batch, max_batch_size=3, max_wait_ms=50)
+        futures = [batcher.submit(i) for i in range(7)]
+        gate.set()
+        self.assertEqual([f.result(timeout=5) for f in futures], list(range(7)))
+        batcher.close()
+
+        self.assertTrue(all(size <= 3 for size in sizes))
+        self.assertEqual(sum(sizes), 7)
+
+    def test_flushes_partial_batch_after_max_wait(self):
+        batcher = InferenceBatcher(lambda items: items, max_batch_size=16, max_wait_ms=20)
+        started = time.perf_counter()
+        self.assertEqual(batcher.run("only", timeout=5), "only")
+        self.assertLess(time.perf_counter() - started, 2.0)
+        batcher.close()
+
+    def test_propagates_errors_to_every_caller(self):
+        def run_batch(items):
+            raise ValueError("model exploded")
+
+        batcher = InferenceBatcher(run_batch, max_batch_size=4, max_wait_ms=50)
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=5)
+        batcher.close()
+
+    def test_rejects_mismatched_result_count(self):
+        batcher = InferenceBatcher(lambda items: items[:-1], max_batch_size=2, max_wait_ms=50)
+        futures = [batcher.submit(i) for i in range(2)]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+        batcher.close()
+
+    def test_only_items_with_the_same_key_share_a_batch(self):
+        seen_batches = []
+
+        def run_batch(items):
+            seen_batches.append(list(items))
+            return items
+
+        batcher = InferenceBatcher(run_batch, max_batch_size=2, max_wait_ms=200, key=lambda item: item[0])
+        futures = [batcher.submit(item) for item in ["a1", "b1", "a2", "a3", "b2"]]
+        self.assertEqual([f.result(timeout=5) for f in futures], ["a1", "b1", "a2", "a3", "b2"])
+        batcher.close()
+
+        self.assertEqual(seen_batches, [["a1", "a2"], ["b1", "b2"], ["a3"]])
+
+    def test_detections_do_not_depend_on_batch_mates(self):
+        metadata = ModelMetadata.from_configs({"id2label": {"0": "shirt"}}, {"size": 800, "max_size": 1333})
+        preprocessor = YolosPreprocessor(metadata)
+
+        def run_batch(images):
+            # Like YOLOS without a pixel mask: every patch, padding included, feeds every output
+            pixel_values, _ = preprocessor.preprocess_batch(images)
+            return [float(row.mean()) for row in pixel_values]
+
+        def shape_key(image):
+            return get_resize_size(image.height, image.width, metadata.shortest_edge, metadata.longest_edge)
+
+        rng = np.random.default_rng(0)
+        portrait = Image.fromarray(rng.integers(0, 255, (1200, 900, 3), dtype=np.uint8))
+        landscape = Image.fromarray(rng.integers(0, 255, (900, 1200, 3), dtype=np.uint8))
+        batcher = InferenceBatcher(run_batch, max_batch_size=4, max_wait_ms=100, key=shape_key)
+        alone = batcher.run(portrait, timeout=5)
+        futures = [batcher.submit(portrait), batcher.submit(landscape)]
+        batched = futures[0].result(timeout=5)
+        futures[1].result(timeout=5)
+        batcher.close()
+
+        self.assertEqual(batched, alone)
+        self.assertEqual(batcher.stats()["batch_size"]["count"], 3)
+        self.assertNotEqual(run_batch([portrait, landscape])[0], alone)
+
+
+if __name__ == "__main__":
+    unittest.main()
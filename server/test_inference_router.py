@@ -0,0 +1,98 @@
+import sys
+import time
+import unittest
+from pathlib import Path
+
+import requests
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+from inference_router import CircuitBreaker, InferenceRouter
+from runpod_stub import RunPodStub
+from test_support import FakeClock
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_consecutive_failures_and_probes_once(self):
+        clock = FakeClock(0.0)
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+
+        breaker.record(False, 0.1)
+        self.assertTrue(breaker.allow_request())
+        breaker.record(False, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        clock.now = 10
+        self.assertTrue(breaker.allow_request())  # the probe
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow_request())  # only one probe at a time
+
+        breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow_request())
+
+    def test_slow_calls_count_as_failures_and_failed_probe_reopens(self):
+        clock = FakeClock(0.0)
+        breaker = CircuitBreaker(failure_threshold=1, slow_call_seconds=5, reset_timeout=10, clock=clock)
+
+        breaker.record(True, 6.0)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        clock.now = 10
+        self.assertTrue(breaker.allow_request())
+        breaker.record(False, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        clock.now = 15
+        self.assertFalse(breaker.allow_request())
+        self.assertEqual(breaker.snapshot()["times_opened"], 2)
+
+
+class InferenceRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = RunPodStub(lambda job: {"detections": ["remote"]}).start()
+        self.addCleanup(self.stub.stop)
+
+    def remote(self, image_ids):
+        response = requests.post(f"{self.stub.base_url}/test/runsync", json={"input": {"ids": image_ids}}, timeout=5)
+        response.raise_for_status()
+        return response.json()["output"]["detections"]
+
+    def local(self, image_ids):
+        return ["local"]
+
+    def test_falls_back_and_stops_calling_a_broken_endpoint(self):
+        router = InferenceRouter(self.remote, self.local, CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        self.stub.fail = True
+
+        results = [router.run([i]) for i in range(5)]
+
+        self.assertEqual(results, [["local"]] * 5)
+        self.assertEqual(len(self.stub.jobs), 2)
+        stats = router.snapshot()
+        self.assertEqual(stats["breaker"]["state"], CircuitBreaker.OPEN)
+        self.assertEqual(stats["fallbacks"], 2)
+        self.assertEqual(stats["short_circuited"], 3)
+        self.assertEqual(stats["backends"]["runpod"]["errors"], 2)
+        self.assertEqual(stats["backends"]["local"]["calls"], 5)
+
+    def test_hedges_with_local_when_remote_is_slow(self):
+        router = InferenceRouter(self.remote, self.local, hedge=True, hedge_min_ms=50, hedge_default_ms=50)
+        self.assertEqual(router.run([1]), ["remote"])
+
+        self.stub.delay = 1.0
+        start = time.perf_counter()
+        result = router.run([2])
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(result, ["local"])
+        self.assertLess(elapsed, 0.8)
+        stats = router.snapshot()
+        self.assertEqual(stats["hedged"], 1)
+        self.assertEqual(stats["hedge_wins"], {"runpod": 0, "local": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
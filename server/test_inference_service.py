@@ -0,0 +1,76 @@
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+from inference_service import InferenceClient, InferenceService
+
+
+class InferenceServiceTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.socket_path = str(Path(tmp.name) / "inference.sock")
+        self.batches = []
+
+    def start_service(self, run_batch=None, **kwargs):
+        def describe(images, thresholds):
+            self.batches.append(len(images))
+            return [
+                [{"label": "shirt", "score": threshold, "bbox": [0, 0, img.width, img.height], "pixel": list(img.getpixel((0, 0)))}]
+                for img, threshold in zip(images, thresholds)
+            ]
+
+        service = InferenceService(self.socket_path, run_batch or describe, **kwargs).start()
+        self.addCleanup(service.stop)
+        return service
+
+    def test_round_trips_images_and_thresholds(self):
+        self.start_service()
+        client = InferenceClient(self.socket_path, timeout=5)
+        images = [Image.new("RGB", (32, 24), (10, 20, 30)), Image.new("L", (16, 40), 200)]
+
+        results = client.detect_batch(images, [0.3, 0.5])
+
+        self.assertEqual(results[0], [{"label": "shirt", "score": 0.3, "bbox": [0, 0, 32, 24], "pixel": [10, 20, 30]}])
+        self.assertEqual(results[1][0]["bbox"], [0, 0, 16, 40])
+        self.assertEqual(results[1][0]["pixel"], [200, 200, 200])
+        self.assertEqual(client.stats()["requests"], 2)
+
+    def test_batches_requests_from_concurrent_clients(self):
+        self.start_service(max_batch_size=8, max_wait_ms=200)
+        image = Image.new("RGB", (8, 8))
+        results = []
+
+        def worker():
+            results.append(InferenceClient(self.socket_path, timeout=5).detect_batch([image], [0.1]))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(self.batches, [4])
+
+    def test_errors_reach_the_client(self):
+        def fail(images, thresholds):
+            raise ValueError("model exploded")
+
+        self.start_service(fail)
+        with self.assertRaisesRegex(RuntimeError, "model exploded"):
+            InferenceClient(self.socket_path, timeout=5).detect_batch([Image.new("RGB", (8, 8))], [0.1])
+        with self.assertRaises(OSError):
+            InferenceClient(self.socket_path + ".missing", timeout=1).stats()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import importlib
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from PIL import Image
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+
+def dark_photo(size=(1200, 1600)):
+    small = np.random.default_rng(0).integers(10, 70, (size[1] // 40, size[0] // 40, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.BICUBIC)
+
+
+class LowLightPassTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        sys.modules.pop("fashion_detector_server", None)
+        with patch("transformers.AutoImageProcessor.from_pretrained", return_value=MagicMock(name="processor")), \
+             patch("transformers.YolosForObjectDetection.from_pretrained", return_value=MagicMock(name="model")):
+            cls.server = importlib.import_module("fashion_detector_server")
+
+    def setUp(self):
+        self.calls = []
+        self.image = dark_photo()
+
+    def fake_batch(self, images, thresholds, image_urls=None):
+        """Original pass: a shirt and pants. Enhanced pass: a stronger copy of the shirt and a new bag."""
+        self.calls.append((images, thresholds, image_urls))
+        original = [
+            {"label": "shirt, blouse", "score": 0.6, "bbox": [200, 150, 600, 550]},
+            {"label": "pants", "score": 0.55, "bbox": [220, 560, 580, 1000]},
+        ]
+        enhanced = [
+            {"label": "shirt, blouse", "score": 0.7, "bbox": [205, 150, 600, 555]},
+            {"label": "bag, wallet", "score": 0.48, "bbox": [620, 500, 760, 700]},
+        ]
+        return [enhanced if any(image is e for e in self.enhanced) else original for image in images]
+
+    def fake_enhance(self, image):
+        enhanced = self.enhance(image)
+        self.enhanced.append(enhanced)
+        return enhanced
+
+    def detect(self, fused, threshold=0.5):
+        self.calls, self.enhanced = [], []
+        self.enhance = self.server.enhance_image_for_detection
+        with patch.object(self.server, "LOW_LIGHT_FUSED_PASS", fused), \
+             patch.object(self.server, "enhance_image_for_detection", side_effect=self.fake_enhance), \
+             patch.object(self.server, "get_raw_detections_batch", side_effect=self.fake_batch):
+            return self.server.detect_and_filter(self.image, threshold, 0.1, max_crops=5)
+
+    def test_fused_pass_sends_both_thresholds_in_one_batch(self):
+        for threshold, relaxed in ((0.5, 0.45), (0.21, 0.2)):
+            self.detect(fused=True, threshold=threshold)
+            self.assertEqual(len(self.calls), 1)
+            images, thresholds, image_urls = self.calls[0]
+            self.assertEqual(thresholds, [threshold, relaxed])
+            self.assertEqual(image_urls, [None, None])
+            self.assertEqual(images[0].size, images[1].size)
+            self.assertIs(images[1], self.enhanced[0])
+
+    def test_fused_pass_matches_the_two_pass_result(self):
+        fused = self.detect(fused=True)
+        fused_calls = self.calls
+        sequential = self.detect(fused=False)
+
+        self.assertEqual([thresholds for _, thresholds, _ in self.calls], [[0.5], [0.45]])
+        self.assertEqual(fused_calls[0][1], [0.5, 0.45])
+        self.assertEqual(fused, sequential)
+        detections, initial_count = fused
+        self.assertEqual(initial_count, 3)
+        # The enhanced shirt replaced the overlapping original one
+        self.assertEqual(
+            sorted((d["label"], d["score"]) for d in detections),
+            [("bag, wallet", 0.48), ("pants", 0.55), ("shirt, blouse", 0.7)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
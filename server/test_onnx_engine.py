@@ -0,0 +1,190 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+from detection_postprocess import DetectionFilter, post_process_object_detection
+from onnx_engine import (
+    ModelMetadata,
+    SessionConfig,
+    YolosPreprocessor,
+    create_session,
+    optimized_model_path,
+    per_worker_threads,
+)
+
+
+def make_image(height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, (max(1, height // 8), max(1, width // 8), 3), dtype=np.uint8)
+    return Image.fromarray(small).resize((width, height), Image.BICUBIC)
+
+
+class NumpyPreprocessingParityTest(unittest.TestCase):
+    def setUp(self):
+        from transformers import YolosImageProcessor
+
+        self.reference = YolosImageProcessor()
+        metadata = ModelMetadata.from_configs({"id2label": {"0": "shirt"}}, {"size": 800, "max_size": 1333})
+        self.preprocessor = YolosPreprocessor(metadata)
+
+    def test_matches_transformers_processor(self):
+        for height, width in [(600, 800), (1000, 1000), (333, 1500), (4032, 3024)]:
+            image = make_image(height, width)
+            expected = self.reference(images=image, return_tensors="np")["pixel_values"][0]
+            actual = self.preprocessor.preprocess(image)
+            self.assertEqual(expected.shape, actual.shape)
+            # Rounding/antialiasing differ slightly when downscaling large photos
+            self.assertLess(float(np.abs(expected - actual).mean()), 5e-3)
+
+    def test_batch_is_padded_bottom_right(self):
+        images = [make_image(600, 800, seed=1), make_image(800, 600, seed=2)]
+        batch, sizes = self.preprocessor.preprocess_batch(images)
+        self.assertEqual(sizes, [(800, 1056), (1056, 800)])
+        self.assertEqual(batch.shape, (2, 3, 1056, 1056))
+        self.assertTrue(np.all(batch[0, :, 800:, :] == 0))
+        self.assertTrue(np.all(batch[1, :, :, 800:] == 0))
+
+
+class NumpyPostProcessingParityTest(unittest.TestCase):
+    def test_matches_transformers_post_processing(self):
+        import torch
+        from types import SimpleNamespace
+        from transformers import YolosImageProcessor
+
+        rng = np.random.default_rng(0)
+        logits = rng.normal(0, 3, (2, 100, 47)).astype(np.float32)
+        pred_boxes = rng.uniform(0.05, 0.6, (2, 100, 4)).astype(np.float32)
+        target_sizes = [[480.0, 640.0], [1333.0, 800.0]]
+
+        expected = YolosImageProcessor().post_process_object_detection(
+            SimpleNamespace(logits=torch.from_numpy(logits), pred_boxes=torch.from_numpy(pred_boxes)),
+            threshold=0.3,
+            target_sizes=torch.tensor(target_sizes),
+        )
+        actual = post_process_object_detection(logits, pred_boxes, target_sizes, threshold=0.3)
+
+        for exp, act in zip(expected, actual):
+            np.testing.assert_allclose(exp["scores"].numpy(), act["scores"], rtol=1e-5)
+            np.testing.assert_array_equal(exp["labels"].numpy(), act["labels"])
+            np.testing.assert_allclose(exp["boxes"].numpy(), act["boxes"], rtol=1e-5, atol=1e-3)
+
+
+class DetectionFilterTest(unittest.TestCase):
+    def test_matches_per_box_loop(self):
+        id2label = {idx: f"class_{idx}" for idx in range(46)}
+        allowed = {f"class_{idx}" for idx in range(0, 46, 3)}
+        category_thresholds = {"class_0": 0.45, "class_3": 0.2, "class_9": 0.6}
+        detection_filter = DetectionFilter(id2label, allowed, category_thresholds)
+
+        rng = np.random.default_rng(1)
+        logits = rng.normal(0, 3, (3, 100, 47)).astype(np.float32)
+        pred_boxes = rng.uniform(0.05, 0.6, (3, 100, 4)).astype(np.float32)
+        target_sizes = [[480.0, 640.0], [1333.0, 800.0], [800.0, 800.0]]
+        thresholds = [0.3, 0.5, 0.25]
+
+        actual = detection_filter.detect(logits, pred_boxes, target_sizes, thresholds)
+
+        for idx, threshold in enumerate(thresholds):
+            result = post_process_object_detection(
+                logits[idx:idx + 1], pred_boxes[idx:idx + 1], target_sizes[idx:idx + 1], threshold
+            )[0]
+            expected = []
+            for score, label, box in zip(result["scores"], result["labels"], result["boxes"]):
+                name = id2label[int(label)]
+                if name not in allowed or score < category_thresholds.get(name, threshold):
+                    continue
+                expected.append((name, [int(v) for v in box.tolist()]))
+
+            self.assertEqual([(d["label"], d["bbox"]) for d in actual[idx]], expected)
+            self.assertTrue(all(d["score"] > threshold for d in actual[idx]))
+
+    def test_fused_rows_match_raw_outputs(self):
+        id2label = {idx: f"class_{idx}" for idx in range(46)}
+        detection_filter = DetectionFilter(id2label, {f"class_{idx}" for idx in range(0, 46, 2)}, {"class_4": 0.5})
+
+        rng = np.random.default_rng(2)
+        logits = rng.normal(0, 3, (2, 100, 47)).astype(np.float32)
+        pred_boxes = rng.uniform(0.05, 0.6, (2, 100, 4)).astype(np.float32)
+        target_sizes = [[480.0, 640.0], [1333.0, 800.0]]
+        thresholds = [0.3, 0.4]
+
+        # What a --fused-postprocess graph returns: every query above a 0.2 floor
+        results = post_process_object_detection(logits, pred_boxes, target_sizes, threshold=0.2)
+        rows = np.concatenate([
+            np.column_stack([np.full(len(r["scores"]), b), r["labels"], r["scores"], r["boxes"]])
+            for b, r in enumerate(results)
+        ]).astype(np.float32)
+
+        self.assertEqual(
+            detection_filter.filter_rows(rows, thresholds),
+            detection_filter.detect(logits, pred_boxes, target_sizes, thresholds),
+        )
+
+
+def write_small_model(path):
+    """(N, 4) -> MatMul -> Add -> Relu, enough for the optimiser to fuse something."""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+    graph = helper.make_graph(
+        [
+            helper.make_node("MatMul", ["x", "w"], ["mm"]),
+            helper.make_node("Add", ["mm", "b"], ["add"]),
+            helper.make_node("Relu", ["add"], ["y"]),
+        ],
+        "small",
+        [helper.make_tensor_value_info("x", TensorProto.FLOAT, ["n", 4])],
+        [helper.make_tensor_value_info("y", TensorProto.FLOAT, ["n", 3])],
+        initializer=[
+            numpy_helper.from_array(rng.normal(size=(4, 3)).astype(np.float32), "w"),
+            numpy_helper.from_array(rng.normal(size=(3,)).astype(np.float32), "b"),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 14)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+
+class SessionFactoryTest(unittest.TestCase):
+    def test_per_worker_thread_budget(self):
+        self.assertEqual(per_worker_threads(2, cpus=8), 4)
+        self.assertEqual(per_worker_threads(3, cpus=8), 2)
+        self.assertEqual(per_worker_threads(4, cpus=2), 1)
+        self.assertEqual(per_worker_threads(0, cpus=2), 2)
+
+    def test_applies_config_and_reuses_optimized_model(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model_path = os.path.join(tmp_dir, "small.onnx")
+            write_small_model(model_path)
+            config = SessionConfig(intra_op_threads=2, cache_optimized_model=True)
+            x = np.arange(8, dtype=np.float32).reshape(2, 4)
+
+            first, first_info = create_session(model_path, config)
+            self.assertEqual(first_info["optimized_model_cache"], "written")
+            self.assertTrue(optimized_model_path(model_path, "all").exists())
+            self.assertEqual(first.get_session_options().intra_op_num_threads, 2)
+            self.assertEqual(first.get_session_options().get_session_config_entry("session.intra_op.allow_spinning"), "0")
+
+            second, second_info = create_session(model_path, config)
+            self.assertEqual(second_info["optimized_model_cache"], "hit")
+            self.assertEqual(second_info["loaded_from"], str(optimized_model_path(model_path, "all")))
+            np.testing.assert_allclose(first.run(None, {"x": x})[0], second.run(None, {"x": x})[0])
+
+            # Re-exporting the model invalidates the cached graph
+            os.utime(model_path, (os.path.getatime(model_path), os.path.getmtime(model_path) + 10))
+            _, third_info = create_session(model_path, config)
+            self.assertEqual(third_info["optimized_model_cache"], "written")
+
+
+if __name__ == "__main__":
+    unittest.main()
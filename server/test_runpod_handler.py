@@ -0,0 +1,94 @@
+import base64
+import io
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+if str(server_dir / "runpod") not in sys.path:
+    sys.path.insert(0, str(server_dir / "runpod"))
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import YolosImageProcessor
+
+
+def encode(size, seed):
+    small = np.random.default_rng(seed).integers(0, 255, (size[1] // 40, size[0] // 40, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(small).resize(size, Image.BICUBIC).save(buffer, format="JPEG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+class FakeModel:
+    """Stands in for YOLOS: two queries whose scores depend on every pixel in the batch row, padding included."""
+
+    config = SimpleNamespace(id2label={0: "shirt, blouse", 1: "dress"})
+
+    def __init__(self):
+        self.shapes = []
+
+    def to(self, device):
+        return self
+
+    def __call__(self, pixel_values):
+        self.shapes.append(tuple(pixel_values.shape))
+        batch = pixel_values.shape[0]
+        means = pixel_values.mean(dim=(1, 2, 3))
+        logits = torch.zeros(batch, 2, 3)
+        logits[:, 0, 0] = 2 + means
+        logits[:, 1, 1] = 1 - means
+        boxes = torch.tensor([[0.5, 0.4, 0.3, 0.2], [0.5, 0.6, 0.6, 0.5]]).repeat(batch, 1, 1)
+        return SimpleNamespace(logits=logits, pred_boxes=boxes)
+
+
+class RunPodHandlerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        sys.modules.pop("runpod_handler", None)
+        with patch("transformers.AutoImageProcessor.from_pretrained", return_value=MagicMock(name="processor")), \
+             patch("transformers.YolosForObjectDetection.from_pretrained", return_value=MagicMock(name="model")):
+            import runpod_handler
+        cls.handler = runpod_handler
+
+    def setUp(self):
+        self.model = FakeModel()
+        patcher = patch.multiple(self.handler, processor=YolosImageProcessor(), model=self.model, device="cpu")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_images_are_batched_by_resized_shape(self):
+        # Two 3:4 portraits share a shape; a 9:16 portrait and a landscape each get their own
+        sizes = [(600, 800), (900, 1200), (540, 960), (800, 600)]
+        items = [{"image_base64": encode(size, seed), "threshold": 0.1} for seed, size in enumerate(sizes)]
+        items.insert(2, {"threshold": 0.1})
+
+        results = self.handler.handler({"input": {"images": items}})["results"]
+
+        self.assertEqual(results[2], {"error": "image_base64 or image_url is required"})
+        results = results[:2] + results[3:]
+        self.assertEqual([r["image_size"] for r in results], [{"width": w, "height": h} for w, h in sizes])
+        self.assertEqual(sorted(shape[0] for shape in self.model.shapes), [1, 1, 2])
+        self.assertEqual(len(set(self.model.shapes)), 3)
+
+        # Batch-mates don't change an image's detections
+        for item, batched in zip(items[:2] + items[3:], results):
+            alone = self.handler.handler({"input": item})
+            self.assertEqual(alone, batched)
+            self.assertEqual([d["label"] for d in alone["detections"]], ["shirt, blouse", "dress"])
+
+    def test_jobs_larger_than_max_batch_size_are_split(self):
+        items = [{"image_base64": encode((600, 800), seed), "threshold": 0.1} for seed in range(3)]
+        with patch.object(self.handler, "MAX_BATCH_SIZE", 2):
+            results = self.handler.handler({"input": {"images": items}})["results"]
+        self.assertEqual([shape[0] for shape in self.model.shapes], [2, 1])
+        self.assertTrue(all(len(r["detections"]) == 2 for r in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,18 @@
+"""Helpers shared by the server's tests."""
+
+from typing import List
+
+
+class FakeClock:
+    """A clock that only moves when told: call it for the time, `sleep` to advance it."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.sleeps: List[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
@@ -0,0 +1,92 @@
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+from upload_client import UploadClient, UploadDeadlineExceeded
+from test_support import FakeClock
+
+
+class FlakyUpload:
+    """Fails `failures` times, each attempt taking `seconds` of fake time."""
+
+    def __init__(self, clock, failures, seconds=1.0):
+        self.clock = clock
+        self.failures = failures
+        self.seconds = seconds
+        self.timeouts = []
+
+    def __call__(self, data, timeout):
+        self.timeouts.append(timeout)
+        self.clock.now += self.seconds
+        if len(self.timeouts) <= self.failures:
+            raise ConnectionError("connection reset")
+        return {"secure_url": f"https://cdn.example.com/{data}.jpg"}
+
+
+def client_for(upload, clock, **kwargs):
+    return UploadClient(upload, clock=clock, sleep=clock.sleep, jitter=lambda: 1.0, **kwargs)
+
+
+class UploadClientTest(unittest.TestCase):
+    def test_retries_with_exponential_backoff(self):
+        clock = FakeClock()
+        upload = FlakyUpload(clock, failures=2)
+        client = client_for(upload, clock, attempts=3, backoff_base=0.25)
+
+        self.assertEqual(client.call("a")["secure_url"], "https://cdn.example.com/a.jpg")
+        self.assertEqual(clock.sleeps, [0.25, 0.5])
+        stats = client.stats()
+        self.assertEqual((stats["attempts"], stats["retries"], stats["failures"]), (3, 2, 0))
+        self.assertEqual((stats["attempt_ms"]["error"]["count"], stats["attempt_ms"]["ok"]["count"]), (2, 1))
+
+        with self.assertRaises(ConnectionError):
+            client_for(FlakyUpload(clock, failures=5), clock, attempts=2).call("b")
+
+    def test_attempts_never_run_past_the_deadline(self):
+        clock = FakeClock()
+        upload = FlakyUpload(clock, failures=5, seconds=4.0)
+        client = client_for(upload, clock, attempts=5, attempt_timeout=8.0, min_attempt_timeout=1.0)
+
+        with self.assertRaises(UploadDeadlineExceeded) as raised:
+            client.call("a", deadline=clock.now + 5.0)
+        # 5 s budget: the first attempt takes 4 s, leaving too little for backoff plus a useful attempt
+        self.assertEqual(upload.timeouts, [5.0])
+        self.assertIsInstance(raised.exception.__cause__, ConnectionError)
+        self.assertEqual(client.stats()["deadline_exceeded"], 1)
+
+        upload = FlakyUpload(clock, failures=1, seconds=1.0)
+        client = client_for(upload, clock, attempts=3, attempt_timeout=8.0, backoff_base=0.5)
+        client.call("b", deadline=clock.now + 4.0)
+        self.assertEqual(upload.timeouts, [4.0, 2.5])
+
+    def test_pool_is_shared_and_bounded(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def task(item):
+            with lock:
+                running.append(item)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(item)
+            return item * 2
+
+        client = UploadClient(lambda data, timeout: data, max_workers=3)
+        try:
+            self.assertEqual(client.map(task, range(12)), [i * 2 for i in range(12)])
+            self.assertEqual(client.submit(task, 21).result(), 42)
+            self.assertLessEqual(max(peak), 3)
+        finally:
+            client.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+server_dir = Path(__file__).resolve().parent
+if str(server_dir) not in sys.path:
+    sys.path.insert(0, str(server_dir))
+
+from warmup import WarmupTracker
+
+
+class WarmupTrackerTest(unittest.TestCase):
+    def test_not_ready_until_steps_finish(self):
+        tracker = WarmupTracker()
+        self.assertFalse(tracker.ready)
+        self.assertEqual(tracker.snapshot()["status"], "pending")
+
+        during = []
+        finished = []
+        ready = tracker.run(
+            [("load_model", lambda: time.sleep(0.05), True), ("detect", lambda: during.append(tracker.snapshot()), True)],
+            on_finish=finished.append,
+        )
+        self.assertTrue(ready)
+        self.assertEqual((during[0]["ready"], during[0]["status"]), (False, "running"))
+
+        state = tracker.snapshot()
+        self.assertEqual(state["status"], "ready")
+        self.assertEqual([step["name"] for step in state["steps"]], ["load_model", "detect"])
+        self.assertGreaterEqual(state["steps"][0]["seconds"], 0.05)
+        tracker.wait(timeout=5)
+        self.assertEqual(finished[0]["status"], "ready")
+        # A second call in the same process doesn't run anything again
+        self.assertTrue(tracker.run([("load_model", during.clear, True)]))
+        self.assertEqual(len(during), 1)
+
+    def test_optional_failure_is_recorded_required_failure_is_not_ready(self):
+        def boom():
+            raise ConnectionError("unreachable")
+
+        tracker = WarmupTracker()
+        self.assertTrue(tracker.run([("connect_searchapi", boom, False), ("load_model", lambda: None, True)]))
+        tracker.wait(timeout=5)
+        # Optional steps run after the required ones
+        self.assertEqual([(step["name"], step["ok"]) for step in tracker.snapshot()["steps"]],
+                         [("load_model", True), ("connect_searchapi", False)])
+
+        tracker = WarmupTracker()
+        self.assertFalse(tracker.run([("load_model", boom, True), ("detect", lambda: None, True)]))
+        state = tracker.snapshot()
+        self.assertEqual(state["status"], "failed")
+        self.assertEqual(len(state["steps"]), 1)
+        self.assertIn("unreachable", state["error"])
+
+    def test_run_finishes_required_steps_before_returning(self):
+        order = []
+        gate = threading.Event()
+        steps = [
+            ("load_model", lambda: order.append("load_model"), True),
+            ("connect_searchapi", lambda: (gate.wait(5), order.append("connect_searchapi")), False),
+            ("detect", lambda: order.append("detect"), True),
+        ]
+        finished = []
+        tracker = WarmupTracker()
+
+        self.assertTrue(tracker.run(steps, on_finish=finished.append))
+        # Ready as soon as the required steps are done; connections are opened afterwards
+        self.assertEqual(order, ["load_model", "detect"])
+        self.assertEqual(tracker.snapshot()["status"], "ready")
+        gate.set()
+        tracker.wait(timeout=5)
+        self.assertEqual(order[-1], "connect_searchapi")
+        self.assertEqual(len(finished[0]["steps"]), 3)
+
+        def boom():
+            raise RuntimeError("no weights")
+
+        tracker = WarmupTracker()
+        self.assertFalse(tracker.run([("load_model", boom, True), ("connect", lambda: order.append("x"), False)]))
+        tracker.wait(timeout=5)
+        self.assertNotIn("x", order)
+
+    def test_disabled_is_ready(self):
+        tracker = WarmupTracker()
+        tracker.skip()
+        self.assertTrue(tracker.ready)
+
+
+if __name__ == "__main__":
+    unittest.main()
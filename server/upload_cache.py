@@ -0,0 +1,58 @@
+"""
+Cloudinary uploads keyed by the content of the encoded image.
+
+The same full image or crop is often uploaded again a minute later (client
+retries, reshared posts, the same photo sent by several users). The server
+names every upload after a hash of its JPEG bytes, so a repeat maps onto the
+same Cloudinary asset, and UploadCache remembers hash -> upload response so
+the repeat skips the network entirely.
+
+The entries live in a DetectionCache (LRU with a TTL, optionally backed by a
+SqliteStore shared by every worker on the host).
+"""
+
+import threading
+from typing import Optional
+
+from detection_cache import DetectionCache
+
+# The parts of Cloudinary's upload response the server uses (crop URLs need the size)
+UPLOAD_FIELDS = ("secure_url", "public_id", "version", "width", "height")
+PUBLIC_ID_LENGTH = 32
+
+
+def content_public_id(digest: str) -> str:
+    """Deterministic Cloudinary public ID for a hex content digest."""
+    return digest[:PUBLIC_ID_LENGTH]
+
+
+class UploadCache:
+    """
+    hash -> upload response, with the bytes every hit did not have to send.
+
+    `get` and `put` take the size of the encoded upload; stats() reports the
+    cache counters plus bytes_uploaded and bytes_saved.
+    """
+
+    def __init__(self, cache: DetectionCache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._bytes = {"bytes_uploaded": 0, "bytes_saved": 0}
+
+    def get(self, digest: str, size: int) -> Optional[dict]:
+        upload = self.cache.get(digest)
+        if upload is not None:
+            with self._lock:
+                self._bytes["bytes_saved"] += size
+        return upload
+
+    def put(self, digest: str, upload: dict, size: int) -> None:
+        with self._lock:
+            self._bytes["bytes_uploaded"] += size
+        if upload.get("secure_url"):
+            self.cache.put(digest, {field: upload.get(field) for field in UPLOAD_FIELDS})
+
+    def stats(self) -> dict:
+        with self._lock:
+            byte_counters = dict(self._bytes)
+        return {**self.cache.stats(), **byte_counters}
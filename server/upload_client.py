@@ -0,0 +1,143 @@
+"""
+Long-lived, bounded pool for CDN uploads with deadline-aware retries.
+
+Uploads used to run in a ThreadPoolExecutor created per request, with a fixed
+two attempts, 0.5 s apart, of up to 8 s each - however little of the
+request's time was left. UploadClient keeps one pool per worker process for
+all requests (so concurrent requests share a bound on parallel uploads), and
+retries with jittered exponential backoff only while the caller's deadline
+leaves room for another useful attempt. Each attempt's timeout is capped by
+the time remaining.
+
+Every attempt's latency is recorded by outcome for /metrics, labelled with
+the storage backend behind `upload`.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from perf_stats import Histogram
+
+
+class UploadDeadlineExceeded(TimeoutError):
+    """No time left in the caller's deadline for another attempt."""
+
+
+class UploadClient:
+    """
+    Calls `upload(*args, timeout=seconds, **kwargs)` with retries.
+
+    Deadlines are absolute values of `clock` (time.monotonic by default).
+    An attempt only starts when at least `min_attempt_timeout` seconds are
+    left; a failed attempt is retried after a random delay of up to
+    `backoff_base * 2 ** (attempt - 1)` seconds (at most `backoff_max`).
+    """
+
+    def __init__(
+        self,
+        upload: Callable[..., Any],
+        max_workers: int = 8,
+        attempts: int = 3,
+        attempt_timeout: float = 8.0,
+        min_attempt_timeout: float = 1.0,
+        backoff_base: float = 0.25,
+        backoff_max: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        jitter: Callable[[], float] = random.random,
+        log: Optional[Callable[[str], None]] = None,
+        backend: str = "",
+    ):
+        self.upload = upload
+        self.backend = backend
+        self.max_workers = max(1, int(max_workers))
+        self.attempts = max(1, int(attempts))
+        self.attempt_timeout = attempt_timeout
+        self.min_attempt_timeout = min_attempt_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self.sleep = sleep
+        self.jitter = jitter
+        self._log = log or (lambda message: None)
+
+        self.attempt_hist = {"ok": Histogram(), "error": Histogram()}
+        self.call_hist = Histogram()
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "attempts": 0, "retries": 0, "failures": 0, "deadline_exceeded": 0}
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="upload")
+
+    def call(self, *args, deadline: Optional[float] = None, **kwargs) -> Any:
+        """Upload with retries; raises the last error, or UploadDeadlineExceeded."""
+        self._count("calls")
+        start = self.clock()
+        last_error: Optional[BaseException] = None
+        try:
+            for attempt in range(1, self.attempts + 1):
+                timeout = self.attempt_timeout
+                if deadline is not None:
+                    timeout = min(timeout, deadline - self.clock())
+                    if timeout < self.min_attempt_timeout:
+                        self._count("deadline_exceeded")
+                        raise UploadDeadlineExceeded(
+                            f"{timeout:.2f}s left before the deadline after {attempt - 1} attempt(s)"
+                        ) from last_error
+
+                self._count("attempts")
+                attempt_start = self.clock()
+                try:
+                    result = self.upload(*args, timeout=timeout, **kwargs)
+                except Exception as exc:
+                    self.attempt_hist["error"].observe((self.clock() - attempt_start) * 1000)
+                    self._log(f"[Upload] Attempt {attempt} failed: {exc}")
+                    last_error = exc
+                else:
+                    self.attempt_hist["ok"].observe((self.clock() - attempt_start) * 1000)
+                    return result
+
+                if attempt < self.attempts:
+                    delay = self.jitter() * min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                    if deadline is not None and deadline - self.clock() - delay < self.min_attempt_timeout:
+                        self._count("deadline_exceeded")
+                        raise UploadDeadlineExceeded(
+                            f"no time left before the deadline to retry after {attempt} attempt(s)"
+                        ) from last_error
+                    self._count("retries")
+                    self.sleep(delay)
+
+            self._count("failures")
+            raise last_error
+        finally:
+            self.call_hist.observe((self.clock() - start) * 1000)
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Run `fn` on the shared pool."""
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def map(self, fn: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+        """`fn` over `items` on the shared pool, results in order."""
+        futures = [self._executor.submit(fn, item) for item in items]
+        return [future.result() for future in futures]
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "backend": self.backend,
+            "max_workers": self.max_workers,
+            "attempts_per_call": self.attempts,
+            "attempt_timeout_s": self.attempt_timeout,
+            **counters,
+            "attempt_ms": {outcome: hist.snapshot() for outcome, hist in self.attempt_hist.items()},
+            "call_ms": self.call_hist.snapshot(),
+        }
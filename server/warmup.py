@@ -0,0 +1,129 @@
+"""
+Worker warm-up and readiness tracking.
+
+A worker can answer `/` long before it can answer a detection quickly: the
+model still has to load, and the first forward pass at each input shape
+pays for allocations (and ONNX/torch kernel selection). `WarmupTracker`
+runs a list of named steps at worker start and records what each one cost.
+`run` does the required steps before returning, so a worker that calls it
+during startup only accepts requests once it is warm.
+"""
+
+import os
+import threading
+import time
+import traceback
+from typing import Callable, List, Optional, Tuple
+
+
+class WarmupTracker:
+    """
+    Runs warm-up steps once per process and exposes their progress.
+
+    Steps are `(name, fn, required)`. A failing required step (e.g. loading
+    the model) leaves the worker not ready; a failing optional step (e.g.
+    pre-opening a connection) is recorded and warm-up carries on.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._reset(status="pending")
+
+    def _reset(self, status: str) -> None:
+        self._pid = os.getpid()
+        self.status = status
+        self.steps: List[dict] = []
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    # --- public API ---
+
+    def run(
+        self,
+        steps: List[Tuple[str, Callable[[], None], bool]],
+        on_finish: Optional[Callable[[dict], None]] = None,
+    ) -> bool:
+        """
+        Run the required steps in the calling thread and return whether the
+        worker is ready; the optional ones (e.g. pre-opening connections)
+        follow in a daemon thread. `on_finish` receives the final snapshot.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # Inherited from the gunicorn master: state belongs to another process
+                self._reset(status="pending")
+            if self.status != "pending":
+                return self.ready
+            self.status = "running"
+            self.started_at = time.time()
+        required = [step for step in steps if step[2]]
+        optional = [step for step in steps if not step[2]]
+        status = self._run_steps(required)
+        with self._lock:
+            self.status = status
+            self.finished_at = time.time()
+
+        def finish():
+            if status == "ready":
+                self._run_steps(optional)
+            if on_finish is not None:
+                on_finish(self.snapshot())
+
+        self._thread = threading.Thread(target=finish, name="warmup", daemon=True)
+        self._thread.start()
+        return self.ready
+
+    def skip(self) -> None:
+        """Mark the worker ready without warming up."""
+        with self._lock:
+            self._reset(status="disabled")
+
+    @property
+    def ready(self) -> bool:
+        return self._pid == os.getpid() and self.status in {"ready", "disabled"}
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the background (optional) steps to finish; returns `ready`."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.ready
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            finished = self.finished_at or time.time()
+            return {
+                "ready": self.ready,
+                "status": self.status if self._pid == os.getpid() else "pending",
+                "pid": os.getpid(),
+                "elapsed_s": round(finished - self.started_at, 3) if self.started_at else None,
+                "error": self.error,
+                "steps": [dict(step) for step in self.steps],
+            }
+
+    # --- worker ---
+
+    def _run_steps(self, steps) -> str:
+        """Run `steps` in order; "failed" as soon as a required one fails, else "ready"."""
+        status = "ready"
+        for name, fn, required in steps:
+            started = time.perf_counter()
+            step = {"name": name, "ok": True}
+            try:
+                fn()
+            except Exception as exc:
+                step["ok"] = False
+                step["error"] = f"{type(exc).__name__}: {exc}"
+                if required:
+                    traceback.print_exc()
+            step["seconds"] = round(time.perf_counter() - started, 3)
+            with self._lock:
+                self.steps.append(step)
+                if not step["ok"] and required:
+                    status = "failed"
+                    self.error = f"{name}: {step['error']}"
+            if status == "failed":
+                break
+        return status
@@ -0,0 +1,13 @@
+-- Perceptual hash (64-bit pHash as 16 hex chars) of each cached image.
+-- The server loads (id, image_phash, country) into an in-memory index at
+-- startup and reuses results for near-duplicate images (recompressed,
+-- resized or screenshotted copies) that the exact image_hash never matches.
+
+ALTER TABLE image_cache
+    ADD COLUMN IF NOT EXISTS image_phash text;
+
+-- The loader pages through hashed rows in id order (keyset pagination), so
+-- this index serves each page without a sort; expires_at is checked per row.
+CREATE INDEX IF NOT EXISTS image_cache_id_with_phash_idx
+    ON image_cache (id)
+    WHERE image_phash IS NOT NULL;